@@ -0,0 +1,282 @@
+"""Times the phases of building a pipeline (creating the steps, crawling them
+into a graph, generating layers and the state machine definition, packaging
+Lambdas, and synthesizing Terraform) on synthetic pipelines of various
+shapes, and records the peak memory of each phase.  Results are written as
+JSON, and compared against a baseline: phases slower (or larger) than the
+baseline by more than the threshold are reported as regressions, and the
+exit code is 1.
+
+Usage:
+    python benchmarks/bench_pipeline.py --steps 10 1000 50000 --output results.json
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json --threshold 1.5
+    python benchmarks/bench_pipeline.py --save-baseline benchmarks/baseline.json
+"""
+
+from step_in_line.step import step, Step
+from step_in_line.pipeline import Pipeline
+from step_in_line.packaging import package_lambda
+from step_in_line.tf_json import StepInLineJson
+from importlib import resources as impresources
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+TEMPLATE_FILE = impresources.files("step_in_line") / "template_lambda.py"
+
+
+def task(*args: str) -> str:
+    return "done"
+
+
+def _step(name: str, *args) -> Step:
+    return step(name=name)(task)(*args)
+
+
+def chain(num_steps: int) -> List[Step]:
+    """Each step depends on the previous one"""
+    current = _step("step_0", "hi")
+    for index in range(1, num_steps):
+        current = _step(f"step_{index}", current)
+    return [current]
+
+
+def fan(num_steps: int) -> List[Step]:
+    """One root step, num_steps - 2 independent steps, and a final step"""
+    root = _step("root", "hi")
+    middle = [_step(f"middle_{index}", root) for index in range(num_steps - 2)]
+    return [_step("final", *middle)]
+
+
+def diamonds(num_steps: int) -> List[Step]:
+    """A chain of diamonds: each step fans out to two steps, which join"""
+    current = _step("join_0", "hi")
+    for index in range(1, (num_steps - 1) // 3 + 1):
+        left = _step(f"left_{index}", current)
+        right = _step(f"right_{index}", current)
+        current = _step(f"join_{index}", left, right)
+    return [current]
+
+
+def random_dag(num_steps: int, max_dependencies: int = 3, seed: int = 0) -> List[Step]:
+    """Each step depends on up to max_dependencies random earlier steps,
+    mostly recent ones, so that the DAG is both deep and wide"""
+    rng = random.Random(seed)
+    steps = [_step("step_0", "hi")]
+    has_dependents = set()
+    for index in range(1, num_steps):
+        window = steps[max(0, index - 50) :]
+        dependencies = rng.sample(
+            window, rng.randint(1, min(max_dependencies, len(window)))
+        )
+        has_dependents.update(dependency.name for dependency in dependencies)
+        steps.append(_step(f"step_{index}", *dependencies))
+    return [s for s in steps if s.name not in has_dependents]
+
+
+SHAPES = {"chain": chain, "fan": fan, "diamonds": diamonds, "random": random_dag}
+
+
+def measure(phase: Callable[[], Any], memory: bool) -> Tuple[Any, float, Optional[int]]:
+    """Runs a phase.  Returns its result, its time in seconds, and (if
+    memory) its peak memory in bytes, measured by running it again with
+    tracemalloc, so that tracing does not slow down the timed run."""
+    start = time.perf_counter()
+    result = phase()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        phase()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def bench_shape(
+    shape: str,
+    num_steps: int,
+    memory: bool,
+    package_steps: int,
+    synth_max_steps: int,
+    cdktf: bool,
+) -> List[Dict[str, Any]]:
+    results = []
+
+    def record(phase_name: str, phase: Callable[[], Any]) -> Any:
+        result, seconds, peak = measure(phase, memory)
+        results.append(
+            {
+                "shape": shape,
+                "steps": num_steps,
+                "phase": phase_name,
+                "seconds": seconds,
+                "peak_bytes": peak,
+            }
+        )
+        return result
+
+    outputs = record("steps", lambda: SHAPES[shape](num_steps))
+    pipe = record("pipeline", lambda: Pipeline("bench", steps=outputs))
+    record("generate_layers", pipe.generate_layers)
+    record("generate_step_functions", pipe.generate_step_functions)
+    sample = list(pipe.get_steps())[:package_steps]
+    record(
+        "package_lambda",
+        lambda: [package_lambda(TEMPLATE_FILE, s, "index") for s in sample],
+    )
+    if num_steps <= synth_max_steps:
+        record(
+            "StepInLineJson",
+            lambda: json.dumps(
+                StepInLineJson(Pipeline("bench", steps=outputs), "us-east-1").to_dict()
+            ),
+        )
+        if cdktf:
+            from cdktf import Testing
+            from step_in_line.tf import StepInLine
+
+            record(
+                "StepInLine",
+                lambda: Testing.synth(
+                    StepInLine(
+                        Testing.app(),
+                        "bench",
+                        Pipeline("bench", steps=outputs),
+                        "us-east-1",
+                    )
+                ),
+            )
+    return results
+
+
+def _key(result: Dict[str, Any]) -> Tuple[str, int, str]:
+    return result["shape"], result["steps"], result["phase"]
+
+
+def compare(
+    results: List[Dict[str, Any]],
+    baseline: List[Dict[str, Any]],
+    threshold: float,
+    min_seconds: float,
+) -> List[str]:
+    """Regressions of the results against the baseline: phases whose time
+        (above a noise floor of min_seconds) or peak memory exceeds the
+        baseline by more than the threshold ratio.
+
+    Args:
+        results (list): Results of this run
+        baseline (list): Results of the baseline run
+        threshold (float): Maximum ratio to the baseline, eg 1.5
+        min_seconds (float): Differences in time below this are ignored as noise
+    """
+    baseline_by_key = {_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline_by_key.get(_key(result))
+        if base is None:
+            continue
+        shape, num_steps, phase = _key(result)
+        if (
+            result["seconds"] > threshold * base["seconds"]
+            and result["seconds"] - base["seconds"] > min_seconds
+        ):
+            regressions.append(
+                f"{shape}/{num_steps}/{phase}: {result['seconds']:.3f}s vs {base['seconds']:.3f}s"
+            )
+        if (
+            result["peak_bytes"] is not None
+            and base["peak_bytes"] is not None
+            and result["peak_bytes"] > threshold * base["peak_bytes"]
+        ):
+            regressions.append(
+                f"{shape}/{num_steps}/{phase}: {result['peak_bytes']} bytes vs {base['peak_bytes']} bytes"
+            )
+    return regressions
+
+
+def main(args: argparse.Namespace) -> int:
+    results = []
+    print(f"{'shape':>10} {'steps':>8} {'phase':>24} {'seconds':>10} {'peak MB':>10}")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)  # lambda zips are written to the working directory
+        try:
+            for shape in args.shapes:
+                for num_steps in args.steps:
+                    for result in bench_shape(
+                        shape,
+                        num_steps,
+                        not args.no_memory,
+                        args.package_steps,
+                        args.synth_max_steps,
+                        args.cdktf,
+                    ):
+                        peak = result["peak_bytes"]
+                        peak_mb = float("nan") if peak is None else peak / 1e6
+                        print(
+                            f"{shape:>10} {num_steps:>8} {result['phase']:>24} {result['seconds']:>10.4f} {peak_mb:>10.2f}"
+                        )
+                        results.append(result)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    for path in filter(None, [args.output, args.save_baseline]):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {path}")
+    if args.baseline is None:
+        return 0
+    if not Path(args.baseline).exists():
+        print(f"No baseline at {args.baseline}: save one with --save-baseline")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold, args.min_seconds)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print(f"No regressions against {args.baseline} (threshold {args.threshold})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--steps", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument(
+        "--shapes", nargs="+", choices=list(SHAPES), default=list(SHAPES)
+    )
+    parser.add_argument(
+        "--package-steps",
+        type=int,
+        default=20,
+        help="Number of steps to package per pipeline",
+    )
+    parser.add_argument(
+        "--synth-max-steps",
+        type=int,
+        default=1000,
+        help="Largest pipeline to synthesize Terraform for (packaging every Lambda)",
+    )
+    parser.add_argument("--cdktf", action="store_true", help="Also time StepInLine")
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--save-baseline", help="Write the results as a baseline")
+    parser.add_argument("--baseline", help="Compare the results to this baseline")
+    parser.add_argument("--threshold", type=float, default=1.5)
+    parser.add_argument("--min-seconds", type=float, default=0.05)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,99 @@
+"""Compares the encode/decode time and payload size of the serializers of step
+outputs, on representative outputs.  Formats and compressions whose optional
+dependency (msgpack, pyarrow, zstandard) is not installed are skipped.
+
+Usage: python benchmarks/bench_serialization.py --rows 1000 10000
+"""
+
+from step_in_line.serialization import Serializer
+from typing import Any, Dict, List
+import argparse
+import json
+import random
+import time
+
+SERIALIZERS = {
+    "json": Serializer(),
+    "json+gzip": Serializer(compression="gzip"),
+    "json+zstd": Serializer(compression="zstd"),
+    "msgpack": Serializer("msgpack"),
+    "msgpack+zstd": Serializer("msgpack", compression="zstd"),
+    "arrow": Serializer("arrow"),
+    "arrow+zstd": Serializer("arrow", compression="zstd"),
+}
+
+
+def records(num_rows: int) -> List[Dict[str, Any]]:
+    """Rows of a table, as a list of dicts"""
+    rng = random.Random(0)
+    return [
+        {
+            "id": index,
+            "key": f"s3://bucket/partition={index % 10}/file_{index}.parquet",
+            "size": rng.randint(0, 1 << 30),
+            "score": rng.random(),
+        }
+        for index in range(num_rows)
+    ]
+
+
+def outputs(num_rows: int) -> Dict[str, Any]:
+    rows = records(num_rows)
+    return {
+        "records": rows,
+        "floats": [row["score"] for row in rows],
+        "table": {column: [row[column] for row in rows] for column in rows[0]},
+    }
+
+
+def measure(serializer: Serializer, value: Any, repeat: int = 5):
+    """Best encode and decode times, in milliseconds, and the size of the
+    output as passed to Step Functions.  Times include the JSON encoding
+    (and decoding) of the Lambda response, which every serializer pays."""
+    encode_times = []
+    decode_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoded = json.dumps(serializer.encode(value))
+        encode_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        serializer.decode(json.loads(encoded))
+        decode_times.append(time.perf_counter() - start)
+    return (
+        1000 * min(encode_times),
+        1000 * min(decode_times),
+        len(encoded),
+    )
+
+
+def main(rows: List[int]):
+    print(
+        f"{'rows':>8} {'output':>8} {'serializer':>14} {'encode (ms)':>12} {'decode (ms)':>12} {'bytes':>10}"
+    )
+    for num_rows in rows:
+        for output_name, value in outputs(num_rows).items():
+            for name, serializer in SERIALIZERS.items():
+                if serializer.format == "arrow":
+                    if output_name != "table":
+                        continue
+                    try:
+                        import pyarrow as pa
+                    except ImportError:
+                        continue
+                    value_to_encode = pa.table(value)
+                else:
+                    value_to_encode = value
+                try:
+                    encode_ms, decode_ms, size = measure(serializer, value_to_encode)
+                except ImportError:
+                    continue  # optional dependency not installed
+                print(
+                    f"{num_rows:>8} {output_name:>8} {name:>14} {encode_ms:>12.2f} {decode_ms:>12.2f} {size:>10}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    args = parser.parse_args()
+    main(args.rows)
@@ -0,0 +1,64 @@
+"""Compares the synth time of the cdktf `StepInLine` stack with the native
+`StepInLineJson` generator.
+
+Usage: python benchmarks/bench_synth.py --steps 10 50 100
+"""
+
+from step_in_line.step import step
+from step_in_line.pipeline import Pipeline
+from step_in_line.tf_json import StepInLineJson
+from typing import List
+import argparse
+import json
+import os
+import tempfile
+import time
+
+
+def fan_out(arg1: str) -> str:
+    return arg1
+
+
+def fan_in(*args: str) -> str:
+    return "done"
+
+
+def wide_pipeline(num_steps: int) -> Pipeline:
+    """Pipeline with one root step, num_steps - 2 independent steps and a final step"""
+    root = step(name="root")(fan_out)("hi")
+    middle = [step(name=f"middle_{i}")(fan_out)(root) for i in range(num_steps - 2)]
+    return Pipeline("bench", steps=[step(name="final")(fan_in)(*middle)])
+
+
+def time_native(num_steps: int) -> float:
+    start = time.perf_counter()
+    json.dumps(StepInLineJson(wide_pipeline(num_steps), "us-east-1").to_dict())
+    return time.perf_counter() - start
+
+
+def time_cdktf(num_steps: int) -> float:
+    from cdktf import Testing
+    from step_in_line.tf import StepInLine
+
+    start = time.perf_counter()
+    stack = StepInLine(Testing.app(), "bench", wide_pipeline(num_steps), "us-east-1")
+    Testing.synth(stack)
+    return time.perf_counter() - start
+
+
+def main(steps: List[int], skip_cdktf: bool):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)  # lambda zips are written to the working directory
+        print(f"{'steps':>8} {'native (s)':>12} {'cdktf (s)':>12}")
+        for num_steps in steps:
+            native = time_native(num_steps)
+            cdktf = float("nan") if skip_cdktf else time_cdktf(num_steps)
+            print(f"{num_steps:>8} {native:>12.3f} {cdktf:>12.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--skip-cdktf", action="store_true")
+    args = parser.parse_args()
+    main(args.steps, args.skip_cdktf)
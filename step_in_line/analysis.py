@@ -0,0 +1,492 @@
+"""Static analysis of the payloads passed between the states of the state
+machines generated for a pipeline.  Each Lambda returns the outputs of all
+the previous steps along with its own, and a Parallel state outputs the list
+of the outputs of its branches, each of which carries those outputs: the
+payload grows along the pipeline, and is multiplied by wide layers (and by
+the passthrough branches of Map and conditional steps).
+
+From the sizes of the outputs of the steps, sampled by a local run, the
+analysis estimates the size of the input and output of every state, the
+state transitions and history events of each execution, and the cost of an
+execution, and flags the steps whose states exceed a payload budget (by
+default, the 256 KB limit of Step Functions).  Conditional steps are assumed
+to run.
+"""
+
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from .pipeline import (
+    Pipeline,
+    StateMachineSpec,
+    estimate_duration,
+    step_names,
+    EXECUTION_EVENTS,
+    TASK_EVENTS,
+    RETRY_EVENTS,
+    PARALLEL_EVENTS,
+    PASS_EVENTS,
+    MAP_EVENTS,
+    MAP_ITERATION_EVENTS,
+    CHOICE_EVENTS,
+    PAYLOAD_LIMIT,
+)
+from .profiling import Profiler, output_size
+from .step import Step, StepSelector, MapStep
+
+logger = logging.getLogger(__name__)
+
+# prices in USD (us-east-1)
+STANDARD_TRANSITION_PRICE = 0.000025
+EXPRESS_REQUEST_PRICE = 0.000001
+LAMBDA_REQUEST_PRICE = 0.0000002
+LAMBDA_GB_SECOND_PRICE = 0.0000166667
+
+# approximate size of the metadata (eg, response headers) which the Lambda
+# integration adds to each result, next to the Payload
+RESULT_METADATA_BYTES = 800
+
+# bytes of the JSON fields around the payloads (the 0s), in the outputs of
+# the states
+_RESULT_FIELDS = (
+    len(json.dumps({"ExecutedVersion": "$LATEST", "Payload": 0, "StatusCode": 200})) - 1
+)
+_PAYLOAD_FIELD = len(json.dumps({"Payload": 0})) - 1
+_MAP_ITEMS_FIELDS = len(json.dumps({"MapItems": 0, "Input": 0})) - 2
+_ITERATION_FIELDS = len(json.dumps({"MapItems": 0, "Payload": 0})) - 2
+
+
+def _dict_bytes(entries: int, count: int) -> int:
+    """Size of a JSON object, from the total size of its "key": value entries"""
+    return 2 + entries + 2 * max(count - 1, 0)
+
+
+def _list_bytes(sizes: List[int]) -> int:
+    return 2 + sum(sizes) + 2 * max(len(sizes) - 1, 0)
+
+
+def samples_from_local_run(
+    pipeline: Pipeline, outputs: List[List[Tuple[str, Any]]]
+) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """Sizes of the outputs of the steps (encoded, if the step has a
+        serializer), and numbers of items of the Map steps, from the
+        outputs of a local run.
+
+    Args:
+        pipeline (Pipeline): The pipeline which was run
+        outputs (list): Result of `pipeline.local_run()`
+    """
+    steps = {step.name: step for step in pipeline.get_steps()}
+    sizes = {}
+    map_items = {}
+    for layer in outputs:
+        for name, output in layer:
+            step = steps[name]
+            if isinstance(step, MapStep):
+                map_items[name] = len(output)
+            serializer = pipeline._serializer_for(step)
+            if serializer is not None:
+                output = serializer.encode(output)
+            size = output_size(output)
+            if size is not None:
+                sizes[name] = size
+    return sizes, map_items
+
+
+def sizes_from_profiler(profiler: Profiler) -> Dict[str, int]:
+    """Sizes of the outputs of the steps recorded by a `Profiler`
+
+    Args:
+        profiler (Profiler): Profiler passed to `pipeline.local_run`
+    """
+    return {
+        name: profile.output_bytes
+        for name, profile in profiler.profiles.items()
+        if profile.output_bytes is not None
+    }
+
+
+class StatePayload:
+    """Estimated size of the input and output of a state"""
+
+    def __init__(
+        self,
+        execution: str,
+        state: str,
+        steps: List[str],
+        input_bytes: int,
+        output_bytes: int,
+    ):
+        self.execution = execution
+        self.state = state
+        self.steps = steps  # the steps run by the state
+        self.input_bytes = input_bytes
+        self.output_bytes = output_bytes
+
+    @property
+    def max_bytes(self) -> int:
+        return max(self.input_bytes, self.output_bytes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "execution": self.execution,
+            "state": self.state,
+            "steps": self.steps,
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+        }
+
+
+class ExecutionBudget:
+    """Estimated state transitions and worst case (every retry used) history
+    events of an execution of a state machine"""
+
+    def __init__(self, name: str, workflow_type: str, executions: int = 1):
+        self.name = name
+        self.workflow_type = workflow_type
+        self.executions = executions  # eg, the iterations of a distributed Map
+        self.transitions = 0  # per execution
+        self.history_events = EXECUTION_EVENTS  # per execution
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "type": self.workflow_type,
+            "executions": self.executions,
+            "transitions": self.transitions,
+            "history_events": self.history_events,
+        }
+
+
+class PayloadReport:
+    """Results of `analyze_payloads`"""
+
+    def __init__(
+        self,
+        states: List[StatePayload],
+        executions: List[ExecutionBudget],
+        invocations: int,
+        gb_seconds: float,
+        output_sizes: Dict[str, int],
+        missing: List[str],
+        budget: int,
+    ):
+        """Initialize a PayloadReport
+
+        Args:
+            states (list): Payloads of the states, in order of execution
+            executions (list): Budgets of the executions, the pipeline's first
+            invocations (int): Number of Lambda invocations per execution
+            gb_seconds (float): Lambda GB-seconds per execution, of the steps with a known duration
+            output_sizes (dict): Sizes of the outputs of the steps
+            missing (list): Names of the steps with no sampled output size (counted as empty)
+            budget (int): Maximum payload size, in bytes
+        """
+        self.states = states
+        self.executions = executions
+        self.invocations = invocations
+        self.gb_seconds = gb_seconds
+        self.output_sizes = output_sizes
+        self.missing = missing
+        self.budget = budget
+
+    @property
+    def max_payload_bytes(self) -> int:
+        return max((state.max_bytes for state in self.states), default=0)
+
+    @property
+    def transitions(self) -> int:
+        """State transitions of all the executions"""
+        return sum(e.transitions * e.executions for e in self.executions)
+
+    def over_budget(self) -> List[StatePayload]:
+        """States whose input or output exceeds the budget"""
+        return [state for state in self.states if state.max_bytes > self.budget]
+
+    def flagged_steps(self) -> List[str]:
+        """Names of the steps run by states over the budget, in order"""
+        return list(
+            dict.fromkeys(name for state in self.over_budget() for name in state.steps)
+        )
+
+    def largest_outputs(self, count: int = 5) -> List[Tuple[str, int]]:
+        """The largest outputs, which every later payload carries"""
+        return sorted(self.output_sizes.items(), key=lambda item: -item[1])[:count]
+
+    def cost(self) -> Dict[str, float]:
+        """Estimated cost of an execution, in USD.  Standard workflows are
+        billed by state transition, Express workflows by request (their
+        duration is not included), and Lambdas by request and GB-second."""
+        step_functions = sum(
+            e.executions
+            * (
+                e.transitions * STANDARD_TRANSITION_PRICE
+                if e.workflow_type == "STANDARD"
+                else EXPRESS_REQUEST_PRICE
+            )
+            for e in self.executions
+        )
+        lambda_cost = (
+            self.invocations * LAMBDA_REQUEST_PRICE
+            + self.gb_seconds * LAMBDA_GB_SECOND_PRICE
+        )
+        return {
+            "step_functions": step_functions,
+            "lambda": lambda_cost,
+            "total": step_functions + lambda_cost,
+        }
+
+    def summary(self) -> str:
+        cost = self.cost()
+        lines = [
+            f"largest payload: {self.max_payload_bytes:,} bytes (budget {self.budget:,})",
+            f"state transitions: {self.transitions:,}, Lambda invocations: {self.invocations:,}",
+            f"estimated cost per execution: ${cost['total']:.6f} (Step Functions ${cost['step_functions']:.6f}, Lambda ${cost['lambda']:.6f})",
+        ]
+        for e in self.executions:
+            lines.append(
+                f"{e.name} ({e.workflow_type}, x{e.executions}): {e.transitions} transitions, {e.history_events} history events"
+            )
+        for state in self.over_budget():
+            lines.append(
+                f"over budget: {state.state} ({', '.join(state.steps)}) {state.max_bytes:,} bytes"
+            )
+        if self.over_budget():
+            lines.append(
+                "largest outputs: "
+                + ", ".join(f"{n} ({s:,} bytes)" for n, s in self.largest_outputs())
+            )
+        if self.missing:
+            lines.append(f"no sampled output size: {', '.join(self.missing)}")
+        return "\n".join(lines)
+
+
+class _Analysis:
+    """Walks the state machines of a pipeline, layer by layer, tracking the
+    size of the output of the current state, and the total size of the
+    entries of the accumulated payload"""
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        output_sizes: Dict[str, int],
+        map_items: Dict[str, int],
+        metadata_bytes: int,
+    ):
+        self.pipeline = pipeline
+        self.output_sizes = output_sizes
+        self.map_items = map_items
+        self.metadata_bytes = metadata_bytes
+        self.specs = pipeline.generate_state_machines()
+        self.states = []
+        self.executions = []
+        self.invocations = 0
+        self.gb_seconds = 0.0
+
+    def entry(self, name: str) -> int:
+        """Size of the "name": output entry of a step in the payload"""
+        return len(json.dumps(name)) + 2 + self.output_sizes.get(name, 0)
+
+    def result_bytes(self, entries: int, count: int) -> int:
+        """Size of the result of the Lambda integration"""
+        return _RESULT_FIELDS + self.metadata_bytes + _dict_bytes(entries, count)
+
+    def record(
+        self, execution: ExecutionBudget, state: str, steps: List[str], i: int, o: int
+    ):
+        self.states.append(StatePayload(execution.name, state, steps, i, o))
+
+    def invoke(self, step: Step, invocations: int = 1):
+        self.invocations += invocations
+        duration = estimate_duration(step, self.pipeline.durations)
+        if duration is not None:
+            self.gb_seconds += invocations * duration * step.memory_size / 1024
+
+    def run(self, spec: StateMachineSpec, size: int, payload: Tuple[int, int]):
+        """Returns the size of the output of the state machine, and the
+        accumulated payload"""
+        execution = ExecutionBudget(spec.name, spec.workflow_type)
+        self.executions.append(execution)
+        for item in spec.items:
+            if isinstance(item, str):  # started, and waited for
+                execution.transitions += 1
+                execution.history_events += TASK_EVENTS
+                input_size = size
+                size, payload = self.run(self.specs[item], size, payload)
+                self.record(execution, item, [], input_size, size)
+            else:
+                size, payload = self.layer(execution, spec, item, size, payload)
+        return size, payload
+
+    def layer(
+        self,
+        execution: ExecutionBudget,
+        spec: StateMachineSpec,
+        layer: List[Step],
+        size: int,
+        payload: Tuple[int, int],
+    ) -> Tuple[int, Tuple[int, int]]:
+        entries, count = payload
+        branches = []
+        for step in layer:
+            branches.append(self.branch(execution, spec, step, size, payload))
+            entries += sum(self.entry(name) for name in step_names(step))
+            count += len(step_names(step))
+        if len(layer) == 1:
+            return branches[0], (entries, count)
+        output = _list_bytes(branches)
+        execution.transitions += 1
+        execution.history_events += PARALLEL_EVENTS
+        self.record(
+            execution,
+            f"parallel at {spec.layer_index[layer[0].name]}",
+            [step.name for step in layer],
+            size,
+            output,
+        )
+        return output, (entries, count)
+
+    def branch(
+        self,
+        execution: ExecutionBudget,
+        spec: StateMachineSpec,
+        step: Step,
+        size: int,
+        payload: Tuple[int, int],
+    ) -> int:
+        """Returns the size of the output of the branch running the step"""
+        names = step_names(step)
+        entries = payload[0] + sum(self.entry(name) for name in names)
+        count = payload[1] + len(names)
+        task_events = TASK_EVENTS + RETRY_EVENTS * step.retry_count
+        conditional = step.name in spec.conditional
+        if not isinstance(step, MapStep) and not conditional:
+            output = self.result_bytes(entries, count)
+            execution.transitions += 1
+            execution.history_events += task_events
+            self.record(execution, step.name, [step.name], size, output)
+            self.invoke(step)
+            return output
+
+        if conditional:
+            execution.transitions += 1
+            execution.history_events += CHOICE_EVENTS
+            self.record(execution, f"{step.name} condition", [step.name], size, size)
+        if isinstance(step, MapStep):
+            branch_output = self.map(execution, step, size, task_events)
+            state_id = f"map {step.name}"
+        else:
+            branch_output = self.result_bytes(entries, count)
+            execution.transitions += 1
+            execution.history_events += task_events
+            self.record(execution, step.name, [step.name], size, branch_output)
+            self.invoke(step)
+            state_id = f"when {step.name}"
+        # a Parallel state with a passthrough branch
+        output = _list_bytes([size, branch_output])
+        execution.transitions += 2
+        execution.history_events += PARALLEL_EVENTS + PASS_EVENTS
+        self.record(execution, state_id, [step.name], size, output)
+        return output
+
+    def map(
+        self, execution: ExecutionBudget, step: MapStep, size: int, task_events: int
+    ) -> int:
+        """Returns the size of the output of the Map state"""
+        if isinstance(step.items, (Step, StepSelector)):
+            source = (
+                step.items.step if isinstance(step.items, StepSelector) else step.items
+            )
+            items_bytes = self.output_sizes.get(source.name, 0)
+            items = self.map_items.get(step.name, 1)
+        else:
+            items_bytes = len(json.dumps(list(step.items)))
+            items = self.map_items.get(step.name, len(step.items))
+        batches = max(-(-items // (step.batch_size or 1)), 1)
+        if step.batch_size is not None and step.batch_size > 1 and not step.distributed:
+            items_bytes += 2 * batches  # the brackets of each batch
+        items_output = _MAP_ITEMS_FIELDS + items_bytes + size
+        self.record(execution, f"{step.name} items", [step.name], size, items_output)
+
+        dependencies = {
+            (arg.step if isinstance(arg, StepSelector) else arg).name
+            for index, arg in enumerate(step.args)
+            if index != step.map_index and isinstance(arg, (Step, StepSelector))
+        }
+        iteration_input = (
+            _ITERATION_FIELDS
+            + items_bytes // batches
+            + _dict_bytes(
+                sum(self.entry(name) for name in dependencies), len(dependencies)
+            )
+        )
+        iteration_output = self.output_sizes.get(step.name, 0) // batches
+        self.record(
+            execution,
+            f"{step.name} iteration",
+            [step.name],
+            iteration_input,
+            iteration_output,
+        )
+        self.invoke(step, batches)
+        output = _PAYLOAD_FIELD + _dict_bytes(self.entry(step.name), 1)
+        self.record(execution, step.name, [step.name], items_output, output)
+
+        execution.transitions += 2
+        execution.history_events += PASS_EVENTS + MAP_EVENTS
+        if step.distributed:  # each batch is a child execution
+            child = ExecutionBudget(
+                f"{execution.name}/{step.name}", "STANDARD", executions=batches
+            )
+            child.transitions = 1
+            child.history_events += task_events
+            self.executions.append(child)
+        else:
+            execution.transitions += batches
+            execution.history_events += batches * (MAP_ITERATION_EVENTS + task_events)
+        return output
+
+
+def analyze_payloads(
+    pipeline: Pipeline,
+    output_sizes: Dict[str, int],
+    map_items: Optional[Dict[str, int]] = None,
+    budget: int = PAYLOAD_LIMIT,
+    input_bytes: int = 2,
+    metadata_bytes: int = RESULT_METADATA_BYTES,
+) -> PayloadReport:
+    """Estimates the size of the input and output of each state of the state
+        machines generated for a pipeline, and their transitions, history
+        events and cost, without running them.
+
+    Args:
+        pipeline (Pipeline): The pipeline to analyze
+        output_sizes (dict): Sizes in bytes of the outputs of the steps, keyed by step name.  See `samples_from_local_run` and `sizes_from_profiler`.
+        map_items (dict): Numbers of items of the Map steps, keyed by step name.  Defaults to the number of static items, or 1.
+        budget (int): Maximum size of the input or output of a state.  Defaults to the 256 KB limit.
+        input_bytes (int): Size of the input of the execution.  Defaults to 2 (ie, {}).
+        metadata_bytes (int): Size of the metadata the Lambda integration adds to each result.  Defaults to an approximate 800 bytes.
+    """
+    analysis = _Analysis(pipeline, output_sizes, map_items or {}, metadata_bytes)
+    analysis.run(analysis.specs[pipeline.name], input_bytes, (0, 0))
+    missing = [
+        name
+        for step in pipeline.get_compiled_steps()
+        for name in step_names(step)
+        if name not in output_sizes
+    ]
+    report = PayloadReport(
+        analysis.states,
+        analysis.executions,
+        analysis.invocations,
+        analysis.gb_seconds,
+        output_sizes,
+        missing,
+        budget,
+    )
+    for state in report.over_budget():
+        logger.warning(
+            f"State {state.state} of {state.execution} exceeds the payload budget: {state.max_bytes:,} bytes"
+        )
+    return report
@@ -0,0 +1,699 @@
+"""Distributed local runs: the steps of a pipeline run on worker processes,
+possibly on several machines, rather than in threads of the local process.
+
+A `Coordinator` serves a queue of steps over TCP, from the process of a
+`multiprocessing.managers` manager (connections are authenticated with a
+shared key).  `Pipeline.local_run`
+walks the graph as usual, but hands each ready step to the coordinator, and
+workers, started with the `step-in-line-worker` command, take the steps,
+run them, and return their outputs.  Like a Lambda, a worker receives the
+source code of the step's function rather than importing the pipeline, so
+steps must be self contained (eg, import modules within the function), and
+the modules they use must be installed on the workers.
+
+Outputs larger than `inline_limit` bytes are put in a shared `ResultStore`
+(eg, an `S3Store`, or a `DirectoryStore` on a network drive), and passed
+around as `BlobRef`s, which workers resolve.  Workers send heartbeats: a
+worker which misses them for `worker_timeout` seconds is considered lost,
+and its step is re-queued for another worker.  Steps fail if no worker is
+connected for `queue_timeout` seconds, rather than waiting forever.
+"""
+
+import argparse
+import collections
+import inspect
+import logging
+import os
+import pickle
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from multiprocessing import AuthenticationError
+from multiprocessing.managers import BaseManager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .memoization import ResultStore, store_from_options
+from .packaging import remove_decorators
+from .serialization import Serializer, decode_value, encode_value
+from .step import Step, MapStep
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 50050
+AUTHKEY_VARIABLE = "STEP_IN_LINE_AUTHKEY"
+
+
+class BlobRef:
+    """Reference to an output put in the blob store of a `Coordinator`.
+    Indexing selects a field, resolved when the output is loaded."""
+
+    def __init__(self, key: str, keys: Optional[List[Any]] = None):
+        """Initialize a BlobRef
+
+        Args:
+            key (str): Key of the output in the blob store
+            keys (list): Keys (for dicts) and indices (for lists) to select, in order
+        """
+        self.key = key
+        self.keys = keys if keys else []
+
+    def __getitem__(self, key: Any) -> "BlobRef":
+        return BlobRef(self.key, self.keys + [key])
+
+    __iter__ = None  # indexing selects a field, so BlobRefs are not iterable
+
+    def load(self, store: ResultStore) -> Any:
+        """Loads the output (decoded, if encoded by a serializer) and
+            selects the field.
+
+        Args:
+            store (ResultStore): The blob store
+        """
+        found, value = store.get(self.key)
+        if not found:
+            raise KeyError(f"Output {self.key} not found in the blob store")
+        value = decode_value(value)
+        for key in self.keys:
+            value = value[key]
+        return value
+
+    def __repr__(self) -> str:
+        return f"BlobRef({self.key!r}, {self.keys!r})"
+
+
+class _WorkQueue:
+    """Queue of the steps to run, shared with the workers.  Tasks are
+    plain dicts; a task taken by a worker which is then lost is re-queued,
+    with its attempt incremented, so that late results are ignored."""
+
+    def __init__(
+        self,
+        heartbeat_interval: float,
+        worker_timeout: float,
+        max_requeues: int,
+        worker_config: Dict[str, Any],
+        queue_timeout: Optional[float] = None,
+    ):
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_timeout = worker_timeout
+        self.max_requeues = max_requeues
+        self.queue_timeout = queue_timeout
+        self.worker_config = worker_config
+        self.requeued = 0
+        self._condition = threading.Condition()
+        self._pending = collections.deque()  # task ids
+        self._tasks = {}  # task id -> task
+        self._assigned = {}  # task id -> worker id
+        self._results = {}  # task id -> (worker id, ok, output or traceback)
+        self._workers = {}  # worker id -> time of its last heartbeat
+        self._queued_at = {}  # task id -> time it was (re-)queued
+        self._no_workers_since = time.monotonic()
+        self._ids = iter(range(1, 2**63))
+        self.closed = False
+
+    # called by the workers, through proxies
+
+    def register(self, worker_id: str) -> Dict[str, Any]:
+        """Registers a worker.  Returns its configuration."""
+        with self._condition:
+            self._workers[worker_id] = time.monotonic()
+        logger.info(f"Worker {worker_id} connected")
+        return {"heartbeat_interval": self.heartbeat_interval, **self.worker_config}
+
+    def heartbeat(self, worker_id: str):
+        with self._condition:
+            self._workers[worker_id] = time.monotonic()
+
+    def take(self, worker_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Takes the next step to run, waiting at most timeout seconds.
+        Returns None if there is none."""
+        with self._condition:
+            self._workers[worker_id] = time.monotonic()
+            self._condition.wait_for(lambda: self._pending or self.closed, timeout)
+            if self.closed or not self._pending:
+                return None
+            task_id = self._pending.popleft()
+            self._assigned[task_id] = worker_id
+            task = self._tasks[task_id]
+        logger.debug(f"Worker {worker_id} took step {task['name']}")
+        return task
+
+    def complete(
+        self, worker_id: str, task_id: int, attempt: int, ok: bool, value: Any
+    ):
+        """Returns the output of a step, or the traceback of its failure"""
+        with self._condition:
+            task = self._tasks.get(task_id)
+            if (
+                task is None
+                or task["attempt"] != attempt
+                or self._assigned.get(task_id) != worker_id
+            ):
+                logger.warning(
+                    f"Ignored a late result from worker {worker_id} for task {task_id}"
+                )
+                return
+            del self._assigned[task_id]
+            self._results[task_id] = (worker_id, ok, value)
+            self._condition.notify_all()
+
+    # called by the coordinator
+
+    def submit(self, task: Dict[str, Any]) -> int:
+        with self._condition:
+            task_id = next(self._ids)
+            self._tasks[task_id] = {**task, "id": task_id, "attempt": 0}
+            self._queued_at[task_id] = time.monotonic()
+            self._pending.append(task_id)
+            if self.closed:
+                self._fail_pending("The coordinator closed before step {name} ran")
+            self._condition.notify_all()
+        return task_id
+
+    def wait(
+        self, task_id: int, timeout: float
+    ) -> Optional[Tuple[Optional[str], bool, Any]]:
+        """Waits at most timeout seconds for the result of a task.  Returns
+        None if there is none yet, otherwise the worker which ran it (None
+        if no worker did), whether it succeeded, and its output or
+        traceback."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: task_id in self._results, timeout):
+                return None
+            del self._tasks[task_id]
+            del self._queued_at[task_id]
+            return self._results.pop(task_id)
+
+    def _fail_pending(self, message: str, task_ids: Optional[List[int]] = None):
+        """Fails tasks which no worker has taken (by default, all of them)"""
+        for task_id in list(self._pending) if task_ids is None else task_ids:
+            self._pending.remove(task_id)
+            self._results[task_id] = (
+                None,
+                False,
+                message.format(name=self._tasks[task_id]["name"]),
+            )
+
+    def check_workers(self):
+        """Re-queues the tasks of the workers which missed their heartbeats,
+        and fails the queued tasks if no worker was connected for
+        queue_timeout seconds."""
+        with self._condition:
+            now = time.monotonic()
+            lost = {
+                worker_id
+                for worker_id, seen in self._workers.items()
+                if now - seen > self.worker_timeout
+            }
+            for worker_id in lost:
+                del self._workers[worker_id]
+                logger.warning(f"Lost worker {worker_id}")
+            for task_id, worker_id in list(self._assigned.items()):
+                if worker_id not in lost:
+                    continue
+                del self._assigned[task_id]
+                task = self._tasks[task_id]
+                if task["attempt"] >= self.max_requeues:
+                    self._results[task_id] = (
+                        worker_id,
+                        False,
+                        f"Lost {task['attempt'] + 1} workers running step {task['name']}",
+                    )
+                    continue
+                task["attempt"] += 1
+                self.requeued += 1
+                self._pending.appendleft(task_id)
+                self._queued_at[task_id] = now
+                logger.warning(f"Re-queued step {task['name']} of worker {worker_id}")
+            if self._workers:
+                self._no_workers_since = now
+            elif self.queue_timeout is not None:
+                expired = [
+                    task_id
+                    for task_id in self._pending
+                    if now - max(self._queued_at[task_id], self._no_workers_since)
+                    > self.queue_timeout
+                ]
+                self._fail_pending(
+                    f"No worker connected within {self.queue_timeout} seconds to run step {{name}}",
+                    expired,
+                )
+            self._condition.notify_all()
+
+    def close(self):
+        """Fails the tasks which have no result yet, and disconnects the
+        workers after their next request"""
+        with self._condition:
+            self.closed = True
+            self._fail_pending("The coordinator closed before step {name} ran")
+            for task_id in list(self._assigned):
+                worker_id = self._assigned.pop(task_id)
+                self._results[task_id] = (
+                    worker_id,
+                    False,
+                    f"The coordinator closed while step {self._tasks[task_id]['name']} ran",
+                )
+            self._condition.notify_all()
+
+    def workers(self) -> List[str]:
+        with self._condition:
+            return list(self._workers)
+
+    def requeues(self) -> int:
+        with self._condition:
+            return self.requeued
+
+
+# the queue of a coordinator, in the process of its manager
+_served_queue = None
+
+
+def _create_queue(*args):
+    """Creates the queue, when the manager process of a coordinator starts"""
+    global _served_queue
+    _served_queue = _WorkQueue(*args)
+
+
+def _get_queue() -> _WorkQueue:
+    return _served_queue
+
+
+class _CoordinatorManager(BaseManager):
+    pass
+
+
+# the workers and the coordinator share the queue (and the authkey)
+_CoordinatorManager.register(
+    "work_queue",
+    callable=_get_queue,
+    exposed=[
+        "register",
+        "heartbeat",
+        "take",
+        "complete",
+        "submit",
+        "wait",
+        "check_workers",
+        "close",
+        "workers",
+        "requeues",
+    ],
+)
+
+
+class Coordinator:
+    """Serves the steps of local runs to workers over TCP.  Pass it to
+    `Pipeline.local_run`; use it as a context manager, or call `start`
+    and `close`."""
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = ("", DEFAULT_PORT),
+        authkey: Optional[bytes] = None,
+        heartbeat_interval: float = 1.0,
+        worker_timeout: float = 10.0,
+        max_requeues: int = 3,
+        blob_store: Optional[ResultStore] = None,
+        inline_limit: Optional[int] = 65536,
+        queue_timeout: Optional[float] = 60.0,
+    ):
+        """Initialize a Coordinator
+
+        Args:
+            address (tuple): Host and port to listen on.  Port 0 picks a free port (see `address` once started).  Defaults to port 50050 on all interfaces.
+            authkey (bytes): Key shared with the workers.  Defaults to the STEP_IN_LINE_AUTHKEY environment variable.
+            heartbeat_interval (float): Seconds between the heartbeats of the workers.  Defaults to 1.
+            worker_timeout (float): Seconds without heartbeat after which a worker is considered lost, and its step re-queued.  Defaults to 10.
+            max_requeues (int): Maximum number of times a step is re-queued, eg if it crashes every worker running it.  Defaults to 3.
+            blob_store (ResultStore): Optional store, shared with the workers, of the outputs larger than inline_limit.  Outputs must then be JSON serializable.
+            inline_limit (int): Size, in bytes (pickled), of the largest output returned inline when there is a blob store.  Defaults to 64 KB.
+            queue_timeout (float): Seconds without any connected worker after which queued steps fail, rather than waiting forever.  Steps still wait while workers are connected but busy.  None waits forever.  Defaults to 60.
+        """
+        if authkey is None:
+            authkey = os.environ.get(AUTHKEY_VARIABLE, "").encode()
+        if not authkey:
+            raise ValueError(
+                f"The coordinator needs an authkey, or the {AUTHKEY_VARIABLE} environment variable"
+            )
+        self.requested_address = address
+        self.authkey = authkey
+        self.blob_store = blob_store
+        self.heartbeat_interval = heartbeat_interval
+        self._queue_args = (
+            heartbeat_interval,
+            worker_timeout,
+            max_requeues,
+            {
+                "blob_store": blob_store.options() if blob_store else None,
+                "inline_limit": inline_limit,
+            },
+            queue_timeout,
+        )
+        self.queue = None  # proxy of the queue, once started
+        self._manager = None
+        self._requeued = 0
+        self._closed = threading.Event()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        """Address the coordinator listens on"""
+        if self._manager is None:
+            return self.requested_address
+        return self._manager.address
+
+    def start(self):
+        """Starts serving the queue to workers, from a manager process"""
+        manager = _CoordinatorManager(
+            address=self.requested_address, authkey=self.authkey
+        )
+        manager.start(_create_queue, self._queue_args)
+        self._manager = manager
+        self.queue = manager.work_queue()
+        self._requeued = 0
+        self._closed.clear()
+        threading.Thread(target=self._monitor, daemon=True).start()
+        logger.info(f"Coordinator listening on {self.address}")
+
+    def _monitor(self):
+        while not self._closed.wait(self.heartbeat_interval):
+            try:
+                self.queue.check_workers()
+            except (OSError, EOFError):
+                return
+
+    def close(self):
+        """Stops serving workers, and shuts the manager process down.  The
+        workers reconnect until a coordinator is started again at the same
+        address."""
+        if self._manager is None or self._closed.is_set():
+            return
+        self._closed.set()
+        try:
+            self._requeued = self.queue.requeues()
+            self.queue.close()
+        except (OSError, EOFError):
+            pass
+        self._manager.shutdown()
+
+    def __enter__(self) -> "Coordinator":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def workers(self) -> List[str]:
+        """Ids of the connected workers"""
+        if self.queue is None or self._closed.is_set():
+            return []
+        return self.queue.workers()
+
+    @property
+    def requeued(self) -> int:
+        """Number of steps re-queued after losing their worker"""
+        if self.queue is None or self._closed.is_set():
+            return self._requeued
+        return self.queue.requeues()
+
+    def run_step(
+        self, step: Step, args: List[Any], serializer: Optional[Serializer] = None
+    ) -> Any:
+        """Runs a step on a worker, and waits for its output (encoded, if
+            the step has a serializer, or a `BlobRef`).
+
+        Args:
+            step (Step): The `Step` to run
+            args (list): Resolved arguments of the step
+            serializer (Serializer): Optional serialization of the step's output, eg the pipeline's for steps which do not set their own.  Defaults to the step's serializer.
+        """
+        if self._manager is None or self._closed.is_set():
+            raise RuntimeError(
+                "The coordinator is not running: use it as a context manager, or call start"
+            )
+        try:
+            code = remove_decorators(inspect.getsource(step.func))
+        except (OSError, TypeError):
+            raise ValueError(
+                f"The source code of step {step.name} is not available, to send to workers"
+            )
+        serializer = serializer or step.serializer
+        task = {
+            "name": step.name,
+            "code": code,
+            "function": step.func.__name__,
+            "args": args,
+            "serializer": serializer.options() if serializer else None,
+        }
+        if isinstance(step, MapStep):
+            task["map_index"] = step.map_index
+            task["max_concurrency"] = step.max_concurrency
+        try:
+            task_id = self.queue.submit(task)
+            result = None
+            while result is None:
+                if self._closed.is_set():
+                    raise RuntimeError(
+                        f"The coordinator closed before step {step.name} completed"
+                    )
+                result = self.queue.wait(task_id, self.heartbeat_interval)
+        except (OSError, EOFError):
+            # eg, closed while waiting for the result
+            raise RuntimeError(f"Lost the coordinator running step {step.name}")
+        worker_id, ok, value = result
+        if not ok and worker_id is None:
+            raise RuntimeError(f"Step {step.name} failed: {value}")
+        if not ok:
+            raise RuntimeError(
+                f"Step {step.name} failed on worker {worker_id}: {value}"
+            )
+        return value
+
+    def resolve(self, value: Any) -> Any:
+        """Loads the output referenced by a `BlobRef`.  Other values are
+            returned as is.
+
+        Args:
+            value: An output of a distributed local run
+        """
+        if isinstance(value, BlobRef):
+            return value.load(self.blob_store)
+        return value
+
+
+class _WorkerManager(BaseManager):
+    pass
+
+
+_WorkerManager.register("work_queue")
+
+
+class Worker:
+    """Takes steps from a `Coordinator`, runs them, and returns their
+    outputs, one step at a time.  Start several workers to run steps
+    concurrently."""
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        authkey: bytes,
+        reconnect_seconds: float = 1.0,
+        max_disconnected: Optional[float] = None,
+    ):
+        """Initialize a Worker
+
+        Args:
+            address (tuple): Host and port of the coordinator
+            authkey (bytes): Key shared with the coordinator
+            reconnect_seconds (float): Seconds between attempts to (re)connect to the coordinator.  Defaults to 1.
+            max_disconnected (float): Seconds without a coordinator after which the worker exits.  Defaults to never.
+        """
+        self.address = address
+        self.authkey = authkey
+        self.reconnect_seconds = reconnect_seconds
+        self.max_disconnected = max_disconnected
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._functions = {}  # hash of the code -> function
+        self._connected = False
+
+    def run(self):
+        """Serves coordinators until disconnected for max_disconnected seconds"""
+        disconnected = time.monotonic()
+        while True:
+            self._connected = False
+            try:
+                self._serve()
+            except (OSError, EOFError) as e:
+                logger.debug(f"No coordinator at {self.address}: {e}")
+            except AuthenticationError:
+                raise
+            except Exception:
+                logger.exception(f"Worker {self.worker_id} failed, reconnecting")
+            if self._connected:
+                logger.info(f"Worker {self.worker_id} disconnected")
+                disconnected = time.monotonic()
+            if self.max_disconnected is not None and (
+                time.monotonic() - disconnected > self.max_disconnected
+            ):
+                logger.info(f"No coordinator for {self.max_disconnected}s, exiting")
+                return
+            time.sleep(self.reconnect_seconds)
+
+    def _serve(self):
+        manager = _WorkerManager(address=self.address, authkey=self.authkey)
+        manager.connect()
+        queue = manager.work_queue()
+        config = queue.register(self.worker_id)
+        self._connected = True
+        logger.info(f"Worker {self.worker_id} connected to {self.address}")
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(config["heartbeat_interval"]):
+                try:
+                    queue.heartbeat(self.worker_id)
+                except (OSError, EOFError):
+                    return
+
+        threading.Thread(target=beat, daemon=True).start()
+        store = None
+        if config["blob_store"] is not None:
+            store = store_from_options(config["blob_store"])
+        try:
+            while True:
+                task = queue.take(self.worker_id, config["heartbeat_interval"])
+                if task is None:
+                    continue
+                ok, value = self._run(task, store, config["inline_limit"])
+                try:
+                    queue.complete(
+                        self.worker_id, task["id"], task["attempt"], ok, value
+                    )
+                except (pickle.PicklingError, TypeError, AttributeError):
+                    queue.complete(
+                        self.worker_id,
+                        task["id"],
+                        task["attempt"],
+                        False,
+                        traceback.format_exc(),
+                    )
+        finally:
+            stop.set()
+
+    def _function(self, task: Dict[str, Any]) -> Callable:
+        """Compiles the code of a step, as the template of its Lambda does"""
+        key = sha256(task["code"].encode()).hexdigest()
+        if key not in self._functions:
+            from .warm_cache import object_cache, file_cache
+
+            namespace = {
+                "__name__": f"step_in_line_{task['name']}",
+                "object_cache": object_cache,
+                "file_cache": file_cache,
+            }
+            exec(compile(task["code"], f"<step {task['name']}>", "exec"), namespace)
+            self._functions[key] = namespace[task["function"]]
+        return self._functions[key]
+
+    def _run(
+        self, task: Dict[str, Any], store: Optional[ResultStore], inline_limit: int
+    ) -> Tuple[bool, Any]:
+        """Runs a step.  Returns whether it succeeded, and its output or the
+        traceback of its failure."""
+        logger.info(f"Running step {task['name']}")
+        try:
+            func = self._function(task)
+            args = [
+                arg.load(store) if isinstance(arg, BlobRef) else arg
+                for arg in task["args"]
+            ]
+            if "map_index" in task:
+                index = task["map_index"]
+
+                def run_item(item):
+                    return func(*args[:index], item, *args[index + 1 :])
+
+                with ThreadPoolExecutor(task["max_concurrency"]) as executor:
+                    output = list(executor.map(run_item, args[index]))
+            else:
+                output = func(*args)
+            output = encode_value(output, task["serializer"])
+        except Exception:
+            logger.exception(f"Step {task['name']} failed")
+            return False, traceback.format_exc()
+        if store is not None and inline_limit is not None:
+            try:
+                large = len(pickle.dumps(output)) > inline_limit
+            except Exception:
+                large = False
+            if large:
+                key = f"{task['name']}-{uuid.uuid4().hex}"
+                try:
+                    store.put(key, output)
+                except TypeError:
+                    logger.warning(
+                        f"Output of step {task['name']} is not JSON serializable: returned inline"
+                    )
+                else:
+                    return True, BlobRef(key)
+        return True, output
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """Parses "host:port" (or "host", on the default port)
+
+    Args:
+        address (str): Address of the coordinator
+    """
+    host, _, port = address.rpartition(":")
+    if not host:
+        return port, DEFAULT_PORT
+    return host, int(port)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Runs the steps served by a step_in_line coordinator"
+    )
+    parser.add_argument(
+        "address", help=f"host:port of the coordinator (port {DEFAULT_PORT} by default)"
+    )
+    parser.add_argument(
+        "--authkey",
+        default=os.environ.get(AUTHKEY_VARIABLE),
+        help=f"key shared with the coordinator.  Defaults to the {AUTHKEY_VARIABLE} environment variable",
+    )
+    parser.add_argument(
+        "--reconnect-seconds",
+        type=float,
+        default=1.0,
+        help="seconds between attempts to (re)connect to the coordinator",
+    )
+    parser.add_argument(
+        "--max-disconnected",
+        type=float,
+        default=None,
+        help="seconds without a coordinator after which the worker exits.  Defaults to never",
+    )
+    args = parser.parse_args(argv)
+    if not args.authkey:
+        parser.error(f"--authkey or {AUTHKEY_VARIABLE} is required")
+    logging.basicConfig(level=logging.INFO)
+    Worker(
+        parse_address(args.address),
+        args.authkey.encode(),
+        args.reconnect_seconds,
+        args.max_disconnected,
+    ).run()
+
+
+if __name__ == "__main__":
+    # with `python -m`, run the worker from the package's module, so that
+    # BlobRefs are pickled as step_in_line.distributed.BlobRef
+    from step_in_line.distributed import main as worker_main
+
+    worker_main()
@@ -0,0 +1,688 @@
+"""In-process emulator of the Step Functions definitions generated for a
+pipeline.  Unlike `Pipeline.local_run`, which runs the graph of steps
+directly, the emulator interprets the generated Amazon States Language
+(Task, Pass, Parallel, Map, Choice, and StartExecution states, with Retry),
+and invokes the `lambda_handler` of each step's packaged zip in a pool of
+worker processes.  It reports the payload size of every state transition,
+the history events of each execution, and a simulated end-to-end latency.
+
+Each worker process is a warm container for the functions it has already
+run: the first invocation of a function in a worker is a cold start, whose
+measured import time and a configurable penalty are added to the latency.
+"""
+
+import concurrent.futures
+import heapq
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+import traceback
+import zipfile
+from importlib import resources as impresources
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .packaging import (
+    package_lambda,
+    package_dispatcher_lambda,
+    group_steps_for_dispatcher,
+)
+from .pipeline import (
+    Pipeline,
+    EXECUTION_EVENTS,
+    TASK_EVENTS,
+    RETRY_EVENTS,
+    PARALLEL_EVENTS,
+    PASS_EVENTS,
+    MAP_EVENTS,
+    MAP_ITERATION_EVENTS,
+    CHOICE_EVENTS,
+    PAYLOAD_LIMIT,
+)
+from .step import CompositeStep
+
+logger = logging.getLogger(__name__)
+
+LAMBDA_INVOKE = "arn:aws:states:::lambda:invoke"
+START_EXECUTION = "arn:aws:states:::states:startExecution.sync:2"
+
+
+class EmulationError(Exception):
+    """A state failed (eg, its Lambda raised after all retries), or uses a
+    feature the emulator does not support."""
+
+
+class _PathNotFound(EmulationError):
+    pass
+
+
+_PATH_SEGMENT = re.compile(r"\.([^.\[\]]+)|\[(\d+|\*)\]")
+
+
+def get_path(data: Any, path: str, context: Optional[dict] = None) -> Any:
+    """Evaluates the JSONPath subset used in definitions: fields, indices,
+        and wildcards (whose matches are flattened into a list).  Paths
+        starting with "$$" are evaluated against the context object.
+
+    Args:
+        data: The JSON document
+        path (str): The path, eg "$[1].Payload.name" or "$[*][*]"
+        context (dict): The context object, eg {"Map": {"Item": {"Value": ...}}}
+    """
+    if path.startswith("$$"):
+        data, path = context or {}, path[1:]
+    if not path.startswith("$"):
+        raise EmulationError(f"Unsupported path {path}")
+    nodes = [data]
+    wildcard = False
+    position = 1
+    while position < len(path):
+        match = _PATH_SEGMENT.match(path, position)
+        if match is None:
+            raise EmulationError(f"Unsupported path {path}")
+        position = match.end()
+        key, index = match.groups()
+        matches = []
+        for node in nodes:
+            if index == "*":
+                matches.extend(node if isinstance(node, list) else node.values())
+            elif index is not None:
+                if isinstance(node, list) and int(index) < len(node):
+                    matches.append(node[int(index)])
+            elif isinstance(node, dict) and key in node:
+                matches.append(node[key])
+        wildcard = wildcard or index == "*"
+        if not matches and not wildcard:
+            raise _PathNotFound(f"Path {path} not found")
+        nodes = matches
+    return nodes if wildcard else nodes[0]
+
+
+_INTRINSIC = re.compile(r"^States\.(\w+)\((.*)\)$")
+
+
+def _intrinsic(expression: str, data: Any, context: Optional[dict]) -> Any:
+    name, raw_args = _INTRINSIC.match(expression).groups()
+    args = []
+    for arg in (a.strip() for a in raw_args.split(",")):
+        args.append(
+            get_path(data, arg, context) if arg.startswith("$") else json.loads(arg)
+        )
+    if name == "Array":
+        return args
+    if name == "ArrayPartition":
+        array, size = args
+        return [array[index : index + size] for index in range(0, len(array), size)]
+    raise EmulationError(f"Unsupported intrinsic function States.{name}")
+
+
+def resolve_parameters(template: Any, data: Any, context: Optional[dict] = None) -> Any:
+    """Resolves a Parameters (or ItemSelector, or ResultSelector) template:
+        the values of keys ending in ".$" are paths or intrinsic functions.
+
+    Args:
+        template: The template
+        data: The document paths are evaluated against
+        context (dict): The context object, for paths starting with "$$"
+    """
+    if isinstance(template, list):
+        return [resolve_parameters(value, data, context) for value in template]
+    if not isinstance(template, dict):
+        return template
+    resolved = {}
+    for key, value in template.items():
+        if key.endswith(".$"):
+            resolved[key[:-2]] = (
+                _intrinsic(value, data, context)
+                if _INTRINSIC.match(value)
+                else get_path(data, value, context)
+            )
+        else:
+            resolved[key] = resolve_parameters(value, data, context)
+    return resolved
+
+
+def _matches(rule: dict, data: Any) -> bool:
+    """Evaluates a Choice rule"""
+    if "And" in rule:
+        return all(_matches(sub_rule, data) for sub_rule in rule["And"])
+    if "Or" in rule:
+        return any(_matches(sub_rule, data) for sub_rule in rule["Or"])
+    if "Not" in rule:
+        return not _matches(rule["Not"], data)
+    try:
+        value = get_path(data, rule["Variable"])
+        present = True
+    except _PathNotFound:
+        value, present = None, False
+    if "IsPresent" in rule:
+        return present == rule["IsPresent"]
+    if not present:
+        return False
+    comparisons = {
+        "BooleanEquals": lambda expected: value is expected,
+        "StringEquals": lambda expected: value == expected,
+        "NumericEquals": lambda expected: value == expected,
+        "NumericGreaterThan": lambda expected: value > expected,
+        "NumericGreaterThanEquals": lambda expected: value >= expected,
+        "NumericLessThan": lambda expected: value < expected,
+        "NumericLessThanEquals": lambda expected: value <= expected,
+        "IsNull": lambda expected: (value is None) == expected,
+    }
+    for operator, compare in comparisons.items():
+        if operator in rule:
+            return compare(rule[operator])
+    raise EmulationError(f"Unsupported Choice rule {rule}")
+
+
+def payload_bytes(value: Any) -> int:
+    """Size of a state's input or output, as JSON"""
+    return len(json.dumps(value).encode())
+
+
+# handler modules loaded by this worker process, keyed by Lambda directory
+_handlers = {}
+
+
+def _invoke_handler(
+    lambda_dir: str, env_variables: Dict[str, str], event: Any
+) -> Tuple[Any, float, float, bool, Optional[str]]:
+    """Runs in a worker process: invokes the handler of a Lambda, importing
+    it first if this is the worker's first invocation of the Lambda.
+    Returns its output (round-tripped through JSON, as by Lambda), the
+    import and invocation times, whether it was a cold start, and the
+    traceback if it raised."""
+    cold = lambda_dir not in _handlers
+    init_seconds = 0.0
+    previous = {key: os.environ.get(key) for key in env_variables}
+    os.environ.update(env_variables)
+    start = time.perf_counter()
+    try:
+        if cold:
+            spec = importlib.util.spec_from_file_location(
+                f"step_in_line_emulated_{len(_handlers)}",
+                os.path.join(lambda_dir, "index.py"),
+            )
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _handlers[lambda_dir] = module
+            init_seconds = time.perf_counter() - start
+            start = time.perf_counter()
+        output = json.loads(
+            json.dumps(_handlers[lambda_dir].lambda_handler(event, None))
+        )
+        error = None
+    except Exception:
+        output, error = None, traceback.format_exc()
+    finally:
+        for key, value in previous.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+    return output, init_seconds, time.perf_counter() - start, cold, error
+
+
+class Transition:
+    """A state run by an emulated execution"""
+
+    def __init__(
+        self,
+        execution: str,
+        state: str,
+        state_type: str,
+        input_bytes: int,
+        output_bytes: int,
+    ):
+        self.execution = execution
+        self.state = state
+        self.state_type = state_type
+        self.input_bytes = input_bytes
+        self.output_bytes = output_bytes
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "execution": self.execution,
+            "state": self.state,
+            "type": self.state_type,
+            "input_bytes": self.input_bytes,
+            "output_bytes": self.output_bytes,
+        }
+
+
+class EmulationReport:
+    """Results of an emulated execution"""
+
+    def __init__(
+        self,
+        output: Any,
+        latency: float,
+        wall_seconds: float,
+        transitions: List[Transition],
+        history_events: Dict[str, int],
+        invocations: int,
+        cold_starts: int,
+    ):
+        """Initialize an EmulationReport
+
+        Args:
+            output: Output of the execution
+            latency (float): Simulated end-to-end latency, in seconds: Lambda durations, cold starts, retry intervals, and transition overheads along the slowest path.
+            wall_seconds (float): Time the emulation took
+            transitions (list): Every state run, in order of completion
+            history_events (dict): Number of history events of each execution (the pipeline's, its child state machines', and distributed Map iterations')
+            invocations (int): Number of Lambda invocations
+            cold_starts (int): Number of invocations which were cold starts
+        """
+        self.output = output
+        self.latency = latency
+        self.wall_seconds = wall_seconds
+        self.transitions = transitions
+        self.history_events = history_events
+        self.invocations = invocations
+        self.cold_starts = cold_starts
+
+    @property
+    def payload(self) -> Dict[str, Any]:
+        """Outputs of the steps, combined from the output of the execution
+        as the Lambdas combine their input"""
+
+        def combine(output: Any) -> Dict[str, Any]:
+            if isinstance(output, list):
+                return {
+                    name: value for o in output for name, value in combine(o).items()
+                }
+            return output.get("Payload", {}) if isinstance(output, dict) else {}
+
+        return combine(self.output)
+
+    @property
+    def max_payload_bytes(self) -> int:
+        return max(
+            (max(t.input_bytes, t.output_bytes) for t in self.transitions), default=0
+        )
+
+    def oversized(self, limit: int = PAYLOAD_LIMIT) -> List[Transition]:
+        """Transitions whose input or output exceeds the limit"""
+        return [
+            t for t in self.transitions if max(t.input_bytes, t.output_bytes) > limit
+        ]
+
+    def summary(self) -> str:
+        lines = [
+            f"latency: {self.latency:.3f}s simulated ({self.wall_seconds:.3f}s emulated)",
+            f"invocations: {self.invocations} ({self.cold_starts} cold starts)",
+            f"state transitions: {len(self.transitions)}, largest payload: {self.max_payload_bytes:,} bytes",
+        ]
+        for execution, events in self.history_events.items():
+            lines.append(f"history events of {execution}: {events}")
+        for transition in self.oversized():
+            lines.append(
+                f"payload of {transition.state} exceeds {PAYLOAD_LIMIT:,} bytes"
+            )
+        return "\n".join(lines)
+
+
+class Emulator:
+    """Packages the Lambdas of a pipeline, and runs emulated executions of
+    its state machine definitions"""
+
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        max_workers: int = 4,
+        cold_start_seconds: float = 0.25,
+        transition_seconds: float = 0.0,
+        template_file: str = impresources.files(__package__) / "template_lambda.py",
+        dispatcher_template_file: str = impresources.files(__package__)
+        / "template_dispatcher.py",
+    ):
+        """Initialize an Emulator
+
+        Args:
+            pipeline (Pipeline): The pipeline to emulate
+            max_workers (int): Number of worker processes invoking Lambdas.  Defaults to 4.
+            cold_start_seconds (float): Latency added to cold starts, on top of the measured import time, for the Lambda runtime starting.  Defaults to 0.25.
+            transition_seconds (float): Latency added to every state transition.  Defaults to 0.
+            template_file (str): Location of template file to populate.  Defaults to internal template, but a custom file can be provided.
+            dispatcher_template_file (str): Location of the dispatcher template file, used when the pipeline is in dispatcher mode, or fuses or packs steps.
+        """
+        self.pipeline = pipeline
+        self.max_workers = max_workers
+        self.cold_start_seconds = cold_start_seconds
+        self.transition_seconds = transition_seconds
+        self.template_file = template_file
+        self.dispatcher_template_file = dispatcher_template_file
+        self._tmp_dir = None
+        self._executor = None
+        self._lambdas = {}  # function name -> (directory, environment variables)
+        self._definitions = {}  # state machine name -> definition
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "Emulator":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        """Packages the Lambdas, generates the definitions, and starts the
+        worker processes"""
+        if self._executor is not None:
+            return
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self._package()
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def close(self):
+        """Stops the worker processes, and deletes the packaged Lambdas"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._tmp_dir is not None:
+            self._tmp_dir.cleanup()
+            self._tmp_dir = None
+
+    def _add_lambda(self, name: str, zip_name: str, env_variables: Dict[str, str]):
+        lambda_dir = Path(self._tmp_dir.name, name)
+        with zipfile.ZipFile(zip_name) as zf:
+            zf.extractall(lambda_dir)
+        os.remove(zip_name)
+        self._lambdas[name] = (str(lambda_dir), dict(env_variables))
+
+    def _package(self):
+        pipeline = self.pipeline
+        step_to_function = {}
+        if pipeline.dispatcher:
+            for index, steps in enumerate(
+                group_steps_for_dispatcher(pipeline.get_compiled_steps())
+            ):
+                name = f"dispatcher_{index}"
+                zip_name = str(Path(self._tmp_dir.name, f"{name}.zip"))
+                package_dispatcher_lambda(
+                    self.template_file,
+                    self.dispatcher_template_file,
+                    steps,
+                    "index",
+                    zip_name,
+                    pipeline.serializer,
+                )
+                self._add_lambda(name, zip_name, steps[0].env_variables)
+                for step in steps:
+                    step_to_function[step.name] = name
+        else:
+            for step in pipeline.get_compiled_steps():
+                zip_name = str(Path(self._tmp_dir.name, f"{step.name}.zip"))
+                if isinstance(step, CompositeStep):
+                    package_dispatcher_lambda(
+                        self.template_file,
+                        self.dispatcher_template_file,
+                        [step],
+                        "index",
+                        zip_name,
+                        pipeline.serializer,
+                    )
+                else:
+                    package_lambda(
+                        self.template_file,
+                        step,
+                        "index",
+                        zip_name,
+                        pipeline.serializer,
+                    )
+                self._add_lambda(step.name, zip_name, step.env_variables)
+                step_to_function[step.name] = step.name
+
+        generate_step_name = pipeline.generate_step_name
+        generate_state_machine_name = pipeline.generate_state_machine_name
+        pipeline.set_generate_step_name(lambda s: step_to_function[s.name])
+        pipeline.set_generate_state_machine_name(lambda name: name)
+        try:
+            self._definitions = {
+                name: pipeline.generate_definition(spec)
+                for name, spec in pipeline.generate_state_machines().items()
+            }
+        finally:
+            pipeline.set_generate_step_name(generate_step_name)
+            pipeline.set_generate_state_machine_name(generate_state_machine_name)
+        logger.info(
+            f"Packaged {len(self._lambdas)} Lambdas and {len(self._definitions)} state machines for emulation"
+        )
+
+    def run(self, execution_input: Any = None) -> EmulationReport:
+        """Runs an emulated execution of the pipeline's state machine
+
+        Args:
+            execution_input: Input of the execution.  Defaults to {}.
+        """
+        self.start()
+        self._transitions = []
+        self._history = {}
+        self._invocations = 0
+        self._cold_starts = 0
+        start = time.perf_counter()
+        output, latency = self._run_execution(
+            self.pipeline.name,
+            self._definitions[self.pipeline.name],
+            {} if execution_input is None else execution_input,
+        )
+        return EmulationReport(
+            output,
+            latency,
+            time.perf_counter() - start,
+            self._transitions,
+            self._history,
+            self._invocations,
+            self._cold_starts,
+        )
+
+    def _count(self, execution: str, events: int):
+        with self._lock:
+            self._history[execution] = self._history.get(execution, 0) + events
+
+    def _run_execution(
+        self, execution: str, definition: dict, execution_input: Any
+    ) -> Tuple[Any, float]:
+        self._count(execution, EXECUTION_EVENTS)
+        return self._run_states(execution, definition, execution_input)
+
+    def _run_states(
+        self,
+        execution: str,
+        definition: dict,
+        data: Any,
+        context: Optional[dict] = None,
+    ) -> Tuple[Any, float]:
+        """Runs the states of a definition (or branch) from StartAt to End.
+        Returns the output and the simulated latency."""
+        name = definition["StartAt"]
+        latency = 0.0
+        while True:
+            state = definition["States"][name]
+            output, seconds, next_name = self._run_state(
+                execution, name, state, data, context
+            )
+            with self._lock:
+                self._transitions.append(
+                    Transition(
+                        execution,
+                        name,
+                        state["Type"],
+                        payload_bytes(data),
+                        payload_bytes(output),
+                    )
+                )
+            latency += seconds + self.transition_seconds
+            data = output
+            if next_name is None:
+                return data, latency
+            name = next_name
+
+    def _run_state(
+        self, execution: str, name: str, state: dict, data: Any, context: Optional[dict]
+    ) -> Tuple[Any, float, Optional[str]]:
+        """Runs a state.  Returns its output, its simulated latency, and the
+        name of the next state (None at the end)."""
+        state_type = state["Type"]
+        effective = get_path(data, state.get("InputPath", "$"), context)
+        next_name = None if state.get("End") else state.get("Next")
+        seconds = 0.0
+        if state_type == "Pass":
+            self._count(execution, PASS_EVENTS)
+            if "Result" in state:
+                result = state["Result"]
+            elif "Parameters" in state:
+                result = resolve_parameters(state["Parameters"], effective, context)
+            else:
+                result = effective
+        elif state_type == "Choice":
+            self._count(execution, CHOICE_EVENTS)
+            next_name = state.get("Default")
+            for rule in state["Choices"]:
+                if _matches(rule, effective):
+                    next_name = rule["Next"]
+                    break
+            if next_name is None:
+                raise EmulationError(f"No choice of {name} matched, and no Default")
+            result = effective
+        elif state_type == "Parallel":
+            self._count(execution, PARALLEL_EVENTS)
+            result, seconds = self._run_parallel(execution, state, effective)
+        elif state_type == "Map":
+            self._count(execution, MAP_EVENTS)
+            result, seconds = self._run_map(execution, name, state, effective, context)
+        elif state_type == "Task":
+            self._count(execution, TASK_EVENTS)
+            result, seconds = self._run_task(execution, name, state, effective, context)
+        else:
+            raise EmulationError(f"Unsupported state type {state_type} of {name}")
+        if "ResultSelector" in state:
+            result = resolve_parameters(state["ResultSelector"], result, context)
+        if state.get("ResultPath", "$") != "$":
+            raise EmulationError(f"Unsupported ResultPath of {name}")
+        output = get_path(result, state.get("OutputPath", "$"), context)
+        return output, seconds, next_name
+
+    def _run_parallel(
+        self, execution: str, state: dict, data: Any
+    ) -> Tuple[List[Any], float]:
+        branches = state["Branches"]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(branches)) as pool:
+            results = list(
+                pool.map(
+                    lambda branch: self._run_states(execution, branch, data), branches
+                )
+            )
+        return [output for output, _ in results], max(
+            (seconds for _, seconds in results), default=0.0
+        )
+
+    def _run_map(
+        self, execution: str, name: str, state: dict, data: Any, context: Optional[dict]
+    ) -> Tuple[List[Any], float]:
+        items = get_path(data, state.get("ItemsPath", "$"), context)
+        iterations = []
+        for index, item in enumerate(items):
+            item_context = {
+                **(context or {}),
+                "Map": {"Item": {"Value": item, "Index": index}},
+            }
+            iterations.append(
+                resolve_parameters(state["ItemSelector"], data, item_context)
+                if "ItemSelector" in state
+                else item
+            )
+        batch_size = state.get("ItemBatcher", {}).get("MaxItemsPerBatch")
+        if batch_size:
+            iterations = [
+                {"Items": iterations[index : index + batch_size]}
+                for index in range(0, len(iterations), batch_size)
+            ]
+        processor = state["ItemProcessor"]
+        distributed = processor.get("ProcessorConfig", {}).get("Mode") == "DISTRIBUTED"
+
+        def run_iteration(index: int) -> Tuple[Any, float]:
+            if distributed:  # each iteration is a child execution
+                return self._run_execution(
+                    f"{execution}/{name}/{index}", processor, iterations[index]
+                )
+            self._count(execution, MAP_ITERATION_EVENTS)
+            return self._run_states(execution, processor, iterations[index])
+
+        concurrency = state.get("MaxConcurrency") or len(iterations) or 1
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(concurrency, 64)
+        ) as pool:
+            results = list(pool.map(run_iteration, range(len(iterations))))
+        # iterations start in order, each as soon as one of `concurrency` slots is free
+        slots = [0.0] * min(concurrency, max(len(results), 1))
+        for _, seconds in results:
+            heapq.heappush(slots, heapq.heappop(slots) + seconds)
+        return [output for output, _ in results], max(slots)
+
+    def _run_task(
+        self, execution: str, name: str, state: dict, data: Any, context: Optional[dict]
+    ) -> Tuple[Any, float]:
+        parameters = resolve_parameters(state.get("Parameters", {}), data, context)
+        resource = state["Resource"]
+        if resource == START_EXECUTION:
+            child = parameters["StateMachineArn"]
+            output, seconds = self._run_execution(
+                child, self._definitions[child], parameters.get("Input")
+            )
+            return {"Output": output, "Status": "SUCCEEDED"}, seconds
+        if resource != LAMBDA_INVOKE:
+            raise EmulationError(f"Unsupported resource {resource} of {name}")
+        retries = [
+            retry
+            for retry in state.get("Retry", [])
+            if {"States.TaskFailed", "States.ALL"} & set(retry["ErrorEquals"])
+        ]
+        max_attempts = max(
+            (retry.get("MaxAttempts", 3) for retry in retries), default=0
+        )
+        seconds = 0.0
+        for attempt in range(max_attempts + 1):
+            output, attempt_seconds, error = self._invoke(
+                parameters["FunctionName"], parameters.get("Payload")
+            )
+            seconds += attempt_seconds
+            if error is None:
+                return {
+                    "ExecutedVersion": "$LATEST",
+                    "Payload": output,
+                    "StatusCode": 200,
+                }, seconds
+            if attempt < max_attempts:
+                retry = retries[0]
+                self._count(execution, RETRY_EVENTS)
+                seconds += (
+                    retry.get("IntervalSeconds", 1)
+                    * retry.get("BackoffRate", 2.0) ** attempt
+                )
+                logger.info(f"Retrying {name} after failure:\n{error}")
+        raise EmulationError(f"State {name} failed:\n{error}")
+
+    def _invoke(
+        self, function_name: str, event: Any
+    ) -> Tuple[Any, float, Optional[str]]:
+        lambda_dir, env_variables = self._lambdas[function_name]
+        output, init_seconds, seconds, cold, error = self._executor.submit(
+            _invoke_handler, lambda_dir, env_variables, event
+        ).result()
+        with self._lock:
+            self._invocations += 1
+            self._cold_starts += int(cold)
+        if cold:
+            seconds += init_seconds + self.cold_start_seconds
+        return output, seconds, error
@@ -0,0 +1,193 @@
+"""Instrumentation of the Lambda handler of a step.  Each invocation times
+its phases (loading the pickled arguments, combining the payload, resolving
+the arguments, running the function, and serializing its output), measures
+the size of its input and output, and notes whether it is the first
+invocation of the container (a cold start).
+
+Environment variables of the Lambda switch it on:
+    STEP_IN_LINE_METRICS: if set (eg, "1"), the measurements are printed as
+        a CloudWatch Embedded Metric Format line, which CloudWatch Logs turns
+        into metrics (namespace STEP_IN_LINE_METRICS_NAMESPACE, default
+        "StepInLine", with a "Step" dimension).
+    STEP_IN_LINE_PROFILE_MS: if set, invocations run under cProfile, and a
+        summary of the invocations slower than this many milliseconds is
+        printed (the top STEP_IN_LINE_PROFILE_LINES functions, default 25,
+        by cumulative time).
+
+This module is packaged with each Lambda, so it only depends on the standard
+library.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_NAMESPACE = "StepInLine"
+
+# the first invocation of a container is a cold start
+_cold_start = True
+_cold_start_lock = threading.Lock()
+
+
+def _take_cold_start() -> bool:
+    global _cold_start
+    with _cold_start_lock:
+        cold_start, _cold_start = _cold_start, False
+    return cold_start
+
+
+def payload_size(value: Any) -> int:
+    """Size in bytes of a payload, as JSON"""
+    return len(json.dumps(value, default=str).encode())
+
+
+def _metric_name(phase: str) -> str:
+    return "".join(part.title() for part in phase.split("_")) + "Time"
+
+
+class Invocation:
+    """Measurements of a single invocation of a step's handler"""
+
+    def __init__(
+        self,
+        metrics: Optional[bool] = None,
+        profile_ms: Optional[float] = None,
+        namespace: Optional[str] = None,
+    ):
+        """Initialize an Invocation.  Options default to the environment
+        variables described in the module.
+
+        Args:
+            metrics (bool): Whether to print the measurements as an Embedded Metric Format line.
+            profile_ms (float): If not None, invocations run under cProfile, and a summary is printed for those slower than this many milliseconds.
+            namespace (str): CloudWatch namespace of the metrics.
+        """
+        if metrics is None:
+            metrics = bool(os.environ.get("STEP_IN_LINE_METRICS"))
+        if profile_ms is None and os.environ.get("STEP_IN_LINE_PROFILE_MS"):
+            profile_ms = float(os.environ["STEP_IN_LINE_PROFILE_MS"])
+        self.metrics = metrics
+        self.profile_ms = profile_ms
+        self.namespace = namespace or os.environ.get(
+            "STEP_IN_LINE_METRICS_NAMESPACE", DEFAULT_NAMESPACE
+        )
+        self.step = None
+        self.timings = {}  # phase -> milliseconds
+        self.properties = {}  # logged with the metrics, eg whether the cache was hit
+
+    @property
+    def enabled(self) -> bool:
+        return self.metrics or self.profile_ms is not None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times a phase of the invocation.  Phases with the same name add up.
+
+        Args:
+            name (str): Name of the phase, eg "function"
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = 1000 * (time.perf_counter() - start)
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    def run(self, handler: Callable[[Any, "Invocation"], Any], event: Any) -> Any:
+        """Runs the handler, and reports the measurements if enabled.
+            Returns the output of the handler.
+
+        Args:
+            handler (callable): Takes the event and this Invocation, and returns the output
+            event: Input of the Lambda
+        """
+        cold_start = _take_cold_start()
+        if not self.enabled:
+            return handler(event, self)
+        profiler = None
+        if self.profile_ms is not None:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                profiler = None  # another profiler is active, eg in a packed step
+        start = time.perf_counter()
+        try:
+            output = handler(event, self)
+        finally:
+            duration = 1000 * (time.perf_counter() - start)
+            if profiler is not None:
+                profiler.disable()
+        if profiler is not None and duration >= self.profile_ms:
+            self.print_profile(profiler, duration)
+        if self.metrics:
+            print(
+                json.dumps(
+                    self.emf(
+                        duration,
+                        cold_start,
+                        payload_size(event),
+                        payload_size(output),
+                    )
+                ),
+                flush=True,
+            )
+        return output
+
+    def emf(
+        self, duration: float, cold_start: bool, input_bytes: int, output_bytes: int
+    ) -> Dict[str, Any]:
+        """The measurements in CloudWatch Embedded Metric Format
+
+        Args:
+            duration (float): Duration of the invocation, in milliseconds
+            cold_start (bool): Whether this was the first invocation of the container
+            input_bytes (int): Size of the event
+            output_bytes (int): Size of the output
+        """
+        values = {
+            "Duration": (duration, "Milliseconds"),
+            **{
+                _metric_name(phase): (timing, "Milliseconds")
+                for phase, timing in self.timings.items()
+            },
+            "InputBytes": (input_bytes, "Bytes"),
+            "OutputBytes": (output_bytes, "Bytes"),
+            "ColdStart": (int(cold_start), "Count"),
+        }
+        return {
+            "_aws": {
+                "Timestamp": int(1000 * time.time()),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [["Step"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, (_, unit) in values.items()
+                        ],
+                    }
+                ],
+            },
+            "Step": self.step or "unknown",
+            **{name: value for name, (value, _) in values.items()},
+            **self.properties,
+        }
+
+    def print_profile(self, profiler: cProfile.Profile, duration: float):
+        """Prints the functions with the most cumulative time"""
+        lines = int(os.environ.get("STEP_IN_LINE_PROFILE_LINES", 25))
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(
+            lines
+        )
+        print(
+            f"Profile of step {self.step} ({duration:.0f} ms):\n{stream.getvalue()}",
+            flush=True,
+        )
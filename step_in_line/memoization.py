@@ -0,0 +1,347 @@
+"""Memoization of the results of steps.  A step with a `ResultStore` looks up
+its result, keyed by a hash of its code and its arguments, before running,
+so that re-executions with unchanged inputs (eg, re-driven executions) do
+not run the function again.
+
+This module is packaged with each Lambda, so it only depends on the standard
+library.  boto3 (available in the Lambda runtime) is imported when used.
+"""
+
+import json
+import os
+import pickle
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from contextlib import closing
+from hashlib import sha256
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Prefix of the keys holding the cache hit and miss counts of a step in the
+# output of its Lambda, eg {"__step_in_line_cache__load": {"hits": 1, "misses": 0}}
+CACHE_STATS_PREFIX = "__step_in_line_cache__"
+
+
+def cache_key(code_fingerprint: str, arg_values: List[Any]) -> str:
+    """Key of a result: a hash of the code of the step and of its resolved
+        arguments.  Arguments which are not JSON serializable are pickled.
+
+    Args:
+        code_fingerprint (str): Hash of the code of the step
+        arg_values (list): Resolved arguments of the step
+    """
+    try:
+        args = json.dumps(arg_values, sort_keys=True).encode()
+    except TypeError:
+        args = pickle.dumps(arg_values)
+    return sha256(code_fingerprint.encode() + args).hexdigest()
+
+
+def _expires(ttl: Optional[float]) -> Optional[float]:
+    return None if ttl is None else time.time() + ttl
+
+
+def _expired(expires: Optional[float]) -> bool:
+    return expires is not None and expires < time.time()
+
+
+class ResultStore(ABC):
+    """Base class of the stores of step results.  Results must be JSON
+    serializable."""
+
+    store_type = None
+
+    def __init__(self, ttl: Optional[float] = None):
+        """Initialize a ResultStore
+
+        Args:
+            ttl (float): Time to live of results, in seconds.  Defaults to no expiry.
+        """
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Looks up a result.  Returns whether it was found, and the result.
+
+        Args:
+            key (str): Key of the result
+        """
+
+    @abstractmethod
+    def put(self, key: str, value: Any):
+        """Stores a result.
+
+        Args:
+            key (str): Key of the result
+            value: The result, JSON serializable
+        """
+
+    def options(self) -> Dict[str, Any]:
+        """Plain representation of the store, passed to the Lambda"""
+        return {"type": self.store_type, "ttl": self.ttl}
+
+    def policies(self) -> List[str]:
+        """IAM policies, in JSON, the Lambda needs to access the store"""
+        return []
+
+
+class DirectoryStore(ResultStore):
+    """Stores results as JSON files in a local directory.  For tests and
+    `local_run`."""
+
+    store_type = "directory"
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        """Initialize a DirectoryStore
+
+        Args:
+            path (str): Directory of the results
+            ttl (float): Time to live of results, in seconds.  Defaults to no expiry.
+        """
+        super().__init__(ttl)
+        self.path = path
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        file_name = os.path.join(self.path, f"{key}.json")
+        if not os.path.exists(file_name):
+            return False, None
+        with open(file_name) as f:
+            entry = json.load(f)
+        if _expired(entry["expires"]):
+            os.remove(file_name)
+            return False, None
+        return True, entry["value"]
+
+    def put(self, key: str, value: Any):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, f"{key}.json"), "w") as f:
+            json.dump({"expires": _expires(self.ttl), "value": value}, f)
+
+    def evict(self) -> int:
+        """Deletes expired results.  Returns the number of deleted results."""
+        evicted = 0
+        for file_name in os.listdir(self.path) if os.path.isdir(self.path) else []:
+            with open(os.path.join(self.path, file_name)) as f:
+                expires = json.load(f)["expires"]
+            if _expired(expires):
+                os.remove(os.path.join(self.path, file_name))
+                evicted += 1
+        return evicted
+
+    def options(self) -> Dict[str, Any]:
+        return {**super().options(), "path": self.path}
+
+
+class SQLiteStore(ResultStore):
+    """Stores results in a SQLite database.  For tests and `local_run`."""
+
+    store_type = "sqlite"
+
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        """Initialize a SQLiteStore
+
+        Args:
+            path (str): Location of the database file
+            ttl (float): Time to live of results, in seconds.  Defaults to no expiry.
+        """
+        super().__init__(ttl)
+        self.path = path
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+        )
+        return connection
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with closing(self._connect()) as connection, connection:
+            row = connection.execute(
+                "SELECT value, expires FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or _expired(row[1]):
+            return False, None
+        return True, json.loads(row[0])
+
+    def put(self, key: str, value: Any):
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "DELETE FROM results WHERE expires < ?", (time.time(),)
+            )  # evict expired results
+            connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                (key, json.dumps(value), _expires(self.ttl)),
+            )
+
+    def options(self) -> Dict[str, Any]:
+        return {**super().options(), "path": self.path}
+
+
+class S3Store(ResultStore):
+    """Stores results as JSON objects in S3.  Expired results are ignored;
+    deleting them is left to a lifecycle rule on the prefix."""
+
+    store_type = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "step_in_line_cache/",
+        ttl: Optional[float] = None,
+    ):
+        """Initialize a S3Store
+
+        Args:
+            bucket (str): Name of the bucket
+            prefix (str): Prefix of the keys of the results.  Defaults to "step_in_line_cache/".
+            ttl (float): Time to live of results, in seconds.  Defaults to no expiry.
+        """
+        super().__init__(ttl)
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        import boto3
+
+        client = boto3.client("s3")
+        try:
+            response = client.get_object(Bucket=self.bucket, Key=self.prefix + key)
+        except client.exceptions.NoSuchKey:
+            return False, None
+        entry = json.loads(response["Body"].read())
+        if _expired(entry["expires"]):
+            return False, None
+        return True, entry["value"]
+
+    def put(self, key: str, value: Any):
+        import boto3
+
+        boto3.client("s3").put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + key,
+            Body=json.dumps({"expires": _expires(self.ttl), "value": value}),
+        )
+
+    def options(self) -> Dict[str, Any]:
+        return {**super().options(), "bucket": self.bucket, "prefix": self.prefix}
+
+    def policies(self) -> List[str]:
+        return [
+            json.dumps(
+                {
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Action": ["s3:GetObject", "s3:PutObject"],
+                            "Resource": [f"arn:aws:s3:::{self.bucket}/{self.prefix}*"],
+                        },
+                        {
+                            # without ListBucket, missing keys give AccessDenied rather than NoSuchKey
+                            "Effect": "Allow",
+                            "Action": ["s3:ListBucket"],
+                            "Resource": [f"arn:aws:s3:::{self.bucket}"],
+                        },
+                    ],
+                }
+            )
+        ]
+
+
+class DynamoDBStore(ResultStore):
+    """Stores results in a DynamoDB table, with a string partition key "key".
+    Enable TTL on the "expires" attribute to delete expired results."""
+
+    store_type = "dynamodb"
+
+    def __init__(self, table: str, ttl: Optional[float] = None):
+        """Initialize a DynamoDBStore
+
+        Args:
+            table (str): Name of the table
+            ttl (float): Time to live of results, in seconds.  Defaults to no expiry.
+        """
+        super().__init__(ttl)
+        self.table = table
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        import boto3
+
+        item = (
+            boto3.client("dynamodb")
+            .get_item(TableName=self.table, Key={"key": {"S": key}})
+            .get("Item")
+        )
+        if item is None:
+            return False, None
+        if "expires" in item and _expired(float(item["expires"]["N"])):
+            return False, None
+        return True, json.loads(item["value"]["S"])
+
+    def put(self, key: str, value: Any):
+        import boto3
+
+        item = {"key": {"S": key}, "value": {"S": json.dumps(value)}}
+        expires = _expires(self.ttl)
+        if expires is not None:
+            item["expires"] = {"N": str(int(expires))}
+        boto3.client("dynamodb").put_item(TableName=self.table, Item=item)
+
+    def options(self) -> Dict[str, Any]:
+        return {**super().options(), "table": self.table}
+
+    def policies(self) -> List[str]:
+        return [
+            json.dumps(
+                {
+                    "Version": "2012-10-17",
+                    "Statement": [
+                        {
+                            "Effect": "Allow",
+                            "Action": ["dynamodb:GetItem", "dynamodb:PutItem"],
+                            "Resource": [f"arn:aws:dynamodb:*:*:table/{self.table}"],
+                        }
+                    ],
+                }
+            )
+        ]
+
+
+STORES = {
+    store.store_type: store
+    for store in [DirectoryStore, SQLiteStore, S3Store, DynamoDBStore]
+}
+
+
+def store_from_options(options: Dict[str, Any]) -> ResultStore:
+    """Creates a store from its plain representation (see `ResultStore.options`)
+
+    Args:
+        options (dict): Options of the store
+    """
+    options = dict(options)
+    return STORES[options.pop("type")](**options)
+
+
+def memoize(
+    store: ResultStore,
+    code_fingerprint: str,
+    compute: Callable[[], Any],
+    arg_values: List[Any],
+) -> Tuple[Any, bool]:
+    """Looks up the result of a step in the store, and only computes (and
+        stores) it if it is not found.  Returns the result, and whether it
+        was found.
+
+    Args:
+        store (ResultStore): Store of the results
+        code_fingerprint (str): Hash of the code of the step
+        compute (callable): Computes the result
+        arg_values (list): Resolved arguments of the step
+    """
+    key = cache_key(code_fingerprint, arg_values)
+    hit, value = store.get(key)
+    if not hit:
+        value = compute()
+        store.put(key, value)
+    return value, hit
@@ -0,0 +1,259 @@
+from .step import Step, StepSelector, CompositeStep, FusedStep, MapStep
+from .serialization import Serializer
+from typing import List, Tuple, Optional, Any
+import zipfile
+import pickle
+import inspect
+import textwrap
+from hashlib import sha256
+import logging
+import os
+from importlib import resources as impresources
+
+logger = logging.getLogger(__name__)
+
+# Modules of this package used by the template (and available to step code,
+# eg the warm container caches).  They are packaged in a minimal
+# "step_in_line" package at the root of each Lambda zip.
+RUNTIME_MODULES = [
+    "serialization.py",
+    "memoization.py",
+    "warm_cache.py",
+    "instrumentation.py",
+]
+
+
+def remove_decorators(src: str) -> str:
+    """Removes any decorators from source code and
+            truncates code so that there is no space
+            in front of function definition
+
+    Args:
+        src (str): Source code for lambda
+    """
+    lines = []
+    has_function_def = False
+    for line in src.splitlines():
+        if line.lstrip().startswith("def"):
+            has_function_def = True
+        if has_function_def:
+            lines.append(line)
+    return textwrap.dedent("\n".join(lines))
+
+
+def get_python_code(python_template_path: str, step: Step) -> str:
+    """Generates full python code for lambda
+
+    Args:
+        python_template_path (str): Location of template python code
+        step (Step): Step to place inside template
+    """
+    code = remove_decorators(inspect.getsource(step.func))
+    logger.debug(f"Code for {step.name}: {code}")
+    with open(python_template_path, "r") as f:
+        template = f.read()
+    template = template.replace('"{{PUT_FUNCTION_HERE}}"', code)
+    template = template.replace('"{{PUT_FUNCTION_NAME_HERE}}"', step.func.__name__)
+    new_file_name = f"{step.func.__name__}.py"
+    with open(new_file_name, "w") as f:
+        f.write(template)
+    return new_file_name
+
+
+def write_zip_entry(zf: zipfile.ZipFile, arcname: str, data: bytes):
+    """Writes a file to a zip with a fixed timestamp and permissions, so
+            that packaging the same code always gives the same zip (and
+            the same `source_code_hash`).
+
+    Args:
+        zf (ZipFile): Zip to write to
+        arcname (str): Name of the file in the zip
+        data (bytes): Content of the file
+    """
+    info = zipfile.ZipInfo(arcname, date_time=(1980, 1, 1, 0, 0, 0))
+    info.external_attr = 0o644 << 16
+    zf.writestr(info, data)
+
+
+def code_fingerprint(step: Step) -> str:
+    """Hash of the code of a step's function, part of the key of its
+    cached results.
+
+    Args:
+        step (Step): The `Step`
+    """
+    return sha256(remove_decorators(inspect.getsource(step.func)).encode()).hexdigest()
+
+
+def _step_options(step: Step, serializer: Optional[Serializer] = None) -> dict:
+    """Options of a step read by the template, eg its serializer (its own,
+    or the given default)"""
+    options = {}
+    if not isinstance(step, MapStep):
+        serializer = step.serializer or serializer
+        if serializer is not None:
+            options["serializer"] = serializer.options()
+    if step.cache is not None:
+        options["cache"] = {
+            "store": step.cache.options(),
+            "code": code_fingerprint(step),
+        }
+    return options
+
+
+def _read_python_code(python_template_path: str, step: Step) -> bytes:
+    lambda_python_file = get_python_code(python_template_path, step)
+    with open(lambda_python_file, "rb") as f:
+        code = f.read()
+    os.remove(lambda_python_file)
+    return code
+
+
+def _pickled_arg(arg: Any) -> Any:
+    if isinstance(arg, Step):
+        return arg.name
+    if isinstance(arg, StepSelector):
+        return arg.to_arg()
+    return arg
+
+
+def _write_step_files(
+    zf: zipfile.ZipFile,
+    prefix: str,
+    python_template_path: str,
+    step: Step,
+    lambda_entry: str,
+    serializer: Optional[Serializer] = None,
+):
+    """Writes the code of a step, its pickled arguments and name, its
+    options (eg, its serializer), and for a `MapStep` the index of the
+    argument mapped over.  Steps passed as
+    arguments are replaced by their name, and selectors by a plain dict."""
+    write_zip_entry(
+        zf,
+        f"{prefix}{lambda_entry}.py",
+        _read_python_code(python_template_path, step),
+    )
+    write_zip_entry(
+        zf,
+        f"{prefix}args.pickle",
+        pickle.dumps([_pickled_arg(arg) for arg in step.args]),
+    )
+    write_zip_entry(zf, f"{prefix}name.pickle", pickle.dumps(step.name))
+    options = _step_options(step, serializer)
+    if options:
+        write_zip_entry(zf, f"{prefix}options.pickle", pickle.dumps(options))
+    if isinstance(step, MapStep):
+        write_zip_entry(zf, f"{prefix}map.pickle", pickle.dumps(step.map_index))
+
+
+def _write_runtime_modules(zf: zipfile.ZipFile):
+    """Writes the runtime modules, in a "step_in_line" package at the root
+    of the Lambda (eg, to encode and decode outputs)."""
+    write_zip_entry(zf, f"{__package__}/__init__.py", b"")
+    for module_file in RUNTIME_MODULES:
+        write_zip_entry(
+            zf,
+            f"{__package__}/{module_file}",
+            (impresources.files(__package__) / module_file).read_bytes(),
+        )
+
+
+def package_lambda(
+    python_template_path: str,
+    step: Step,
+    lambda_entry: str,
+    zip_name: Optional[str] = None,
+    serializer: Optional[Serializer] = None,
+) -> Tuple[str, str]:
+    """Creates zip of `Step` code for use in Lambda
+
+    Args:
+        python_template_path (str): Location of template python code
+        step (Step): `Step` to place inside template
+        lambda_entry (str): Name of python entry file
+        zip_name (str): Location of the generated zip.  Defaults to "{step.name}.zip" in the working directory.
+        serializer (Serializer): Optional serialization of the output, if the step does not set its own (eg, the pipeline's).
+    """
+    if zip_name is None:
+        zip_name = f"{step.name}.zip"
+
+    zf = zipfile.ZipFile(zip_name, mode="w")
+    _write_step_files(zf, "", python_template_path, step, lambda_entry, serializer)
+    _write_runtime_modules(zf)
+    zf.close()
+    with open(zip_name, "rb") as f:
+        data = f.read()
+        hash_sha256 = sha256(data).hexdigest()
+    logger.info(f"Successfully packaged files for Lambda {step.name}")
+
+    return zip_name, hash_sha256
+
+
+def package_dispatcher_lambda(
+    python_template_path: str,
+    dispatcher_template_path: str,
+    steps: List[Step],
+    lambda_entry: str,
+    zip_name: str,
+    serializer: Optional[Serializer] = None,
+) -> Tuple[str, str]:
+    """Creates a single zip containing the code of several `Step`s, routed
+            by a dispatcher entry point.  Each step is placed in its own
+            sub-directory, next to its pickled arguments.  The steps of a
+            `FusedStep` are routed to as a chain, run in sequence, and the
+            steps of a `PackedStep` are run concurrently.
+
+    Args:
+        python_template_path (str): Location of template python code for each step
+        dispatcher_template_path (str): Location of template python code for the dispatcher
+        steps (List[Step]): `Step`s to place in the dispatcher
+        lambda_entry (str): Name of python entry file
+        zip_name (str): Location of the generated zip
+        serializer (Serializer): Optional serialization of the outputs of the steps which do not set their own (eg, the pipeline's).
+    """
+    zf = zipfile.ZipFile(zip_name, mode="w")
+    with open(dispatcher_template_path, "rb") as f:
+        write_zip_entry(zf, f"{lambda_entry}.py", f.read())
+    module_dirs = []
+
+    def write_route(route_step: Step):
+        if isinstance(route_step, CompositeStep):
+            kind = "chain" if isinstance(route_step, FusedStep) else "pack"
+            return (kind, [write_route(sub_step) for sub_step in route_step.steps])
+        module_dir = f"step_{len(module_dirs)}"
+        module_dirs.append(module_dir)
+        _write_step_files(
+            zf,
+            f"{module_dir}/",
+            python_template_path,
+            route_step,
+            lambda_entry,
+            serializer,
+        )
+        return module_dir
+
+    routes = {step.name: write_route(step) for step in steps}
+    write_zip_entry(zf, "routes.pickle", pickle.dumps(routes))
+    _write_runtime_modules(zf)
+    zf.close()
+    with open(zip_name, "rb") as f:
+        data = f.read()
+        hash_sha256 = sha256(data).hexdigest()
+    logger.info(f"Successfully packaged files for dispatcher Lambda {zip_name}")
+
+    return zip_name, hash_sha256
+
+
+def group_steps_for_dispatcher(steps: List[Step]) -> List[List[Step]]:
+    """Groups `Step`s which can share a single dispatcher Lambda.  Steps
+            are compatible if they have the same runtime, layers, memory,
+            and environment variables.
+
+    Args:
+        steps (List[Step]): `Step`s to group
+    """
+    groups = {}
+    for step in steps:
+        groups.setdefault(step.compatibility_key(), []).append(step)
+    return list(groups.values())
@@ -1,39 +1,396 @@
 import logging
-from typing import Sequence, Optional, List, Callable, Any, Tuple
+from typing import (
+    Sequence,
+    Optional,
+    List,
+    Callable,
+    Any,
+    Tuple,
+    Dict,
+    Union,
+    Iterator,
+    Collection,
+)
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import heapq
+import threading
+import time
 import networkx as nx
-from .step import Step
-from .stepfunctions.steps import LambdaStep, Chain, Retry, Parallel, Graph
+from .step import Step, StepSelector, CompositeStep, FusedStep, PackedStep, MapStep
+from .serialization import Serializer
+from .memoization import memoize
+from .packaging import code_fingerprint
+from .profiling import Profiler
+from .runtimes import RuntimeStore, step_fingerprint, upward_ranks
+from .distributed import BlobRef, Coordinator
+from .stepfunctions.steps import (
+    LambdaStep,
+    Chain,
+    Retry,
+    Parallel,
+    Graph,
+    StepFunctionsStartExecutionStep,
+    Pass,
+    Map,
+    Choice,
+    State,
+)
 
 logger = logging.getLogger(__name__)
 
 
 def crawl_back(graph: nx.DiGraph, step: Step):
-    """Create the Graph of Steps
+    """Create the Graph of Steps.  Iterative, so that long chains do not
+        hit the recursion limit, and each Step is visited once, so that
+        shared dependencies (eg, diamonds, or the ancestors of several
+        output Steps) are not crawled repeatedly.
 
     Args:
         graph (DiGraph): The graph to populate with Steps
         step (Step): The `Step` to add to the graph
     """
-    for dependency in step.depends_on:
-        graph.add_edge(dependency, step)
-        crawl_back(graph, dependency)
+    if step in graph:
+        return  # already crawled, with its dependencies
+    visited = {step}
+    # depth first, adding nodes and edges in the same order as a recursive crawl
+    to_visit = [(step, iter(step.depends_on))]
+    if not step.depends_on:
+        graph.add_node(step)  # eg, a pipeline of a single step has no edges
+    while to_visit:
+        current, dependencies = to_visit[-1]
+        dependency = next(dependencies, None)
+        if dependency is None:
+            to_visit.pop()
+            continue
+        # Steps already in the graph were crawled by an earlier call
+        crawled = dependency in graph and dependency not in visited
+        graph.add_edge(dependency, current)
+        if dependency not in visited and not crawled:
+            visited.add(dependency)
+            if not dependency.depends_on:
+                graph.add_node(dependency)
+            to_visit.append((dependency, iter(dependency.depends_on)))
+
+
+def _contract_graph(graph: nx.DiGraph, node_map: Dict[Step, Step]) -> nx.DiGraph:
+    """Creates a new graph where each Step is replaced by node_map[step]"""
+    contracted_graph = nx.DiGraph()
+    contracted_graph.add_nodes_from(dict.fromkeys(node_map.values()))
+    for upstream, downstream in graph.edges:
+        if node_map[upstream] is not node_map[downstream]:
+            contracted_graph.add_edge(node_map[upstream], node_map[downstream])
+    return contracted_graph
+
+
+def _check_composite_names(graph: nx.DiGraph):
+    """Raises a ValueError if the name of a `CompositeStep` of the graph
+    (eg, "a_to_b") is also the name of another Step, since states and
+    outputs are keyed by step name."""
+    names = {}
+    for step in graph.nodes:
+        names.setdefault(step.name, []).append(step)
+    for name, steps in names.items():
+        if len(steps) > 1 and any(isinstance(s, CompositeStep) for s in steps):
+            raise ValueError(
+                f"Combined step name {name} is already used by another step: rename the step."
+            )
+
+
+def step_conditions(graph: nx.DiGraph) -> Dict[str, List[Step]]:
+    """Predicate Steps each Step is conditional on (see `when`), keyed by step
+        name.  A Step inherits the conditions of the Steps it depends on,
+        since it can not run without their outputs.
+
+    Args:
+        graph (DiGraph): The graph of Steps
+    """
+    conditions = {}
+    for step in nx.topological_sort(graph):
+        inherited = [
+            predicate
+            for dependency in graph.predecessors(step)
+            for predicate in conditions[dependency.name]
+        ]
+        conditions[step.name] = list(dict.fromkeys(inherited + step.conditions))
+    return conditions
+
+
+def fuse_linear_chains(graph: nx.DiGraph, exclude: Collection[str] = ()) -> nx.DiGraph:
+    """Fuses linear chains of Steps into `FusedStep`s.  An edge is part of
+        a chain if the upstream `Step` has exactly one downstream `Step`,
+        the downstream `Step` has exactly one upstream `Step`, both allow
+        fusing, and both have the same Lambda configuration.
+
+    Args:
+        graph (DiGraph): The graph of Steps
+        exclude (Collection[str]): Names of Steps which must not be fused (eg, conditional Steps)
+
+    Returns:
+        DiGraph: A new graph, with each chain replaced by a single `FusedStep`
+    """
+    chain_next = {}
+    chain_previous = {}
+    for upstream, downstream in graph.edges:
+        if (
+            graph.out_degree(upstream) == 1
+            and graph.in_degree(downstream) == 1
+            and upstream.fuse
+            and downstream.fuse
+            and upstream.name not in exclude
+            and downstream.name not in exclude
+            and upstream.compatibility_key() == downstream.compatibility_key()
+        ):
+            chain_next[upstream] = downstream
+            chain_previous[downstream] = upstream
+
+    node_map = {}
+    for step in nx.topological_sort(graph):
+        if step in chain_previous:
+            continue  # already part of a chain started upstream
+        chain = [step]
+        while chain[-1] in chain_next:
+            chain.append(chain_next[chain[-1]])
+        fused = FusedStep(chain) if len(chain) > 1 else step
+        for chain_step in chain:
+            node_map[chain_step] = fused
+
+    fused_graph = _contract_graph(graph, node_map)
+    _check_composite_names(fused_graph)
+    logger.debug(
+        f"Fused {graph.number_of_nodes()} steps into {fused_graph.number_of_nodes()}"
+    )
+    return fused_graph
+
+
+def estimate_duration(step: Step, durations: Dict[str, float]) -> Optional[float]:
+    """Estimated run time of a Step, in seconds.  Profiled timings take
+        precedence over the duration hint of the Step.
+
+    Args:
+        step (Step): The `Step` to estimate
+        durations (dict): Profiled timings, keyed by step name
+    """
+    if isinstance(step, CompositeStep):
+        estimates = [estimate_duration(s, durations) for s in step.steps]
+        if None in estimates:
+            return None
+        return sum(estimates) if isinstance(step, FusedStep) else max(estimates)
+    return durations.get(step.name, step.duration)
+
+
+def pack_siblings(
+    graph: nx.DiGraph,
+    durations: Dict[str, float],
+    max_duration: float,
+    max_size: int,
+    exclude: Collection[str] = (),
+) -> nx.DiGraph:
+    """Packs small Steps of the same topological generation into `PackedStep`s.
+        Steps in the same generation never depend on each other, so they
+        can run concurrently in one Lambda invocation.  A Step is small if
+        its estimated duration is at most max_duration; Steps without a
+        duration hint or profiled timing are never packed.
+
+    Args:
+        graph (DiGraph): The graph of Steps
+        durations (dict): Profiled timings, keyed by step name
+        max_duration (float): Maximum duration, in seconds, of a Step to pack
+        max_size (int): Maximum number of Steps in a `PackedStep`
+        exclude (Collection[str]): Names of Steps which must not be packed (eg, conditional Steps)
+
+    Returns:
+        DiGraph: A new graph, with packed Steps replaced by `PackedStep`s
+    """
+    node_map = {}
+    for layer in nx.topological_generations(graph):
+        small_steps = {}
+        for step in layer:
+            node_map[step] = step
+            if isinstance(step, MapStep) or step.name in exclude:
+                continue
+            duration = estimate_duration(step, durations)
+            if duration is not None and duration <= max_duration:
+                small_steps.setdefault(step.compatibility_key(), []).append(step)
+        for steps in small_steps.values():
+            for index in range(0, len(steps), max_size):
+                pack = steps[index : index + max_size]
+                if len(pack) > 1:
+                    packed = PackedStep(pack)
+                    for step in pack:
+                        node_map[step] = packed
+    packed_graph = _contract_graph(graph, node_map)
+    _check_composite_names(packed_graph)
+    logger.debug(
+        f"Packed {graph.number_of_nodes()} steps into {packed_graph.number_of_nodes()}"
+    )
+    return packed_graph
+
+
+# Step Functions history events per state, used to estimate the size of an
+# execution's history (limited to 25,000 events).
+EXECUTION_EVENTS = 2  # ExecutionStarted, ExecutionSucceeded
+TASK_EVENTS = (
+    5  # TaskStateEntered, TaskScheduled, TaskStarted, TaskSucceeded, TaskStateExited
+)
+RETRY_EVENTS = 3  # TaskScheduled, TaskStarted, TaskFailed
+PARALLEL_EVENTS = 4  # ParallelStateEntered, ParallelStateStarted, ParallelStateSucceeded, ParallelStateExited
+PASS_EVENTS = 2  # PassStateEntered, PassStateExited
+MAP_EVENTS = 4  # MapStateEntered, MapStateStarted, MapStateSucceeded, MapStateExited
+MAP_ITERATION_EVENTS = 2  # MapIterationStarted, MapIterationSucceeded
+CHOICE_EVENTS = 2  # ChoiceStateEntered, ChoiceStateExited
+MAP_STATES = 5  # see convert_map_step: Parallel, 2 Pass, Map and Task states
+CONDITION_STATES = 2  # see _wrap_branch: Choice and Pass states
+PAYLOAD_LIMIT = 262144  # bytes, of the input or output of a state
+
+
+def _map_batches(step: MapStep) -> int:
+    """Number of iterations of a Map step, if its items are static (else 1)"""
+    if isinstance(step.items, (Step, StepSelector)):
+        return 1
+    return -(-len(step.items) // (step.batch_size or 1))
+
+
+def _step_states(step: Step, conditional: Collection[str]) -> int:
+    """Number of states generated for a Step (see `_wrap_branch`)"""
+    states = MAP_STATES if isinstance(step, MapStep) else 1
+    if step.name in conditional:
+        # a Map step already runs in a Parallel state with a passthrough branch
+        states += CONDITION_STATES + (0 if isinstance(step, MapStep) else 2)
+    return states
+
+
+def estimate_layer_states(layer: List[Step], conditional: Collection[str] = ()) -> int:
+    """Number of states generated for a layer of Steps: a single Task, or
+        a Parallel state with a Task per branch.  Map steps and conditional
+        steps have a few more states (see `convert_map_step` and
+        `convert_conditional_step`).
+
+    Args:
+        layer (list): Steps which run concurrently
+        conditional (Collection[str]): Names of the conditional Steps
+    """
+    states = sum(_step_states(step, conditional) for step in layer)
+    return states if len(layer) == 1 else states + 1
+
+
+def estimate_layer_events(layer: List[Step], conditional: Collection[str] = ()) -> int:
+    """Worst case (ie, every retry used, and every conditional step run)
+        number of history events of a layer of Steps.  The iterations of
+        a distributed Map step are child executions with their own
+        history, and the number of iterations of a Map step over the
+        output of another step is unknown (so counted as one).
+
+    Args:
+        layer (list): Steps which run concurrently
+        conditional (Collection[str]): Names of the conditional Steps
+    """
+    events = 0
+    for step in layer:
+        task_events = TASK_EVENTS + RETRY_EVENTS * step.retry_count
+        if step.name in conditional:
+            events += CHOICE_EVENTS
+            if not isinstance(step, MapStep):
+                events += PARALLEL_EVENTS + PASS_EVENTS
+        if not isinstance(step, MapStep):
+            events += task_events
+            continue
+        events += PARALLEL_EVENTS + 2 * PASS_EVENTS + MAP_EVENTS
+        if not step.distributed:
+            events += _map_batches(step) * (MAP_ITERATION_EVENTS + task_events)
+    return events if len(layer) == 1 else events + PARALLEL_EVENTS
+
+
+def partition_layers(
+    graph: nx.DiGraph,
+    layers: List[List[Step]],
+    max_states: int,
+    max_events: int,
+    conditional: Collection[str] = (),
+) -> List[List[List[Step]]]:
+    """Splits the layers of a graph into consecutive partitions, each of which
+        stays within max_states states and max_events history events.  When
+        a partition is full, it is cut at the boundary with the fewest edges
+        crossing it, among the boundaries in its second half.
+
+    Args:
+        graph (DiGraph): The graph of Steps
+        layers (list): Topological generations of the graph
+        max_states (int): Maximum number of states per partition
+        max_events (int): Maximum number of history events per partition
+        conditional (Collection[str]): Names of the conditional Steps
+
+    Returns:
+        list: Partitions, each a list of layers
+    """
+    layer_index = {step: index for index, layer in enumerate(layers) for step in layer}
+    # cuts[b] is the number of edges crossing the boundary after layer b
+    cuts = [0] * (len(layers) + 1)
+    for upstream, downstream in graph.edges:
+        cuts[layer_index[upstream]] += 1
+        cuts[layer_index[downstream]] -= 1
+    for index in range(1, len(cuts)):
+        cuts[index] += cuts[index - 1]
+
+    def exceeds_limits(start: int, end: int) -> bool:
+        states = sum(
+            estimate_layer_states(layer, conditional) for layer in layers[start:end]
+        )
+        events = EXECUTION_EVENTS + sum(
+            estimate_layer_events(layer, conditional) for layer in layers[start:end]
+        )
+        return states > max_states or events > max_events
+
+    partitions = []
+    start = 0
+    for end in range(len(layers)):
+        while end > start and exceeds_limits(start, end + 1):
+            candidates = range(end - 1, start + (end - start) // 2 - 1, -1)
+            boundary = min(candidates, key=lambda index: cuts[index])
+            partitions.append(layers[start : boundary + 1])
+            start = boundary + 1
+        if exceeds_limits(start, end + 1):
+            logger.warning(
+                f"Layer {end} exceeds the partition limits on its own, and can not be split"
+            )
+    partitions.append(layers[start:])
+    return partitions
 
 
 def convert_step_to_lambda(
-    step: Step, generate_step_name: Callable[[Step], str]
+    step: Step,
+    generate_step_name: Callable[[Step], str],
+    dispatcher: bool = False,
+    state_id: Optional[str] = None,
+    **kwargs,
 ) -> LambdaStep:
     """Create Lambda from Step
 
     Args:
         step (Step): The `Step` to convert to a lambda
         generate_step_name (callable): Generates the ARN of the Lambda from the step
+        dispatcher (bool): If True, the Lambda is a shared dispatcher and the step name is passed along with the input so the dispatcher can route to the step.
+        state_id (str): Name of the state.  Defaults to the name of the step.
+        kwargs: Additional fields of the state (eg, output_path)
     """
+    if dispatcher:
+        payload = {
+            "Payload": {
+                "StepName": step.name,  # used by the dispatcher to route to the step
+                "Input.$": "$",
+            }
+        }
+    else:
+        payload = {
+            "Payload.$": "$"  # pass in all the possible values, including outputs from previous steps
+        }
     lambda_state = LambdaStep(
-        state_id=step.name,
+        state_id=state_id or step.name,
         parameters={
             "FunctionName": generate_step_name(step),  # the function arn
-            "Payload.$": "$",  # pass in all the possible values, including outputs from previous steps
+            **payload,
         },
+        **kwargs,
     )
     if step.retry_count > 0:
         lambda_state.add_retry(
@@ -48,10 +405,366 @@ def convert_step_to_lambda(
     return lambda_state
 
 
+def step_names(step: Step) -> List[str]:
+    """Names of the outputs a Step adds to the payload: its own name, or the
+    names of the steps run by a `CompositeStep`."""
+    if isinstance(step, CompositeStep):
+        return [name for sub_step in step.steps for name in step_names(sub_step)]
+    return [step.name]
+
+
+def _branch_payload_path(
+    layers: List[List[Step]],
+    layer_number: int,
+    step: Step,
+    name: str,
+    conditional: Collection[str],
+) -> str:
+    """JSONPath to the payload containing the output of the step `name`, in
+    the output of the branch running `step` in layer `layer_number`."""
+    if not isinstance(step, MapStep) and step.name not in conditional:
+        return "$.Payload"  # the Lambda output, which accumulates all outputs
+    if name == step.name:
+        return "$[1].Payload"
+    return "$[0]" + payload_path(layers, layer_number - 1, name, conditional)[1:]
+
+
+def payload_path(
+    layers: List[List[Step]],
+    layer_number: int,
+    name: str,
+    conditional: Collection[str] = (),
+) -> str:
+    """JSONPath to the payload containing the output of the step `name`, in
+    the output of layer `layer_number`.  The output of a layer with a single
+    Lambda is the Lambda's result, whose "Payload" accumulates the outputs
+    of all previous steps.  The output of a Parallel state is the list of
+    the outputs of its branches, and Map steps and conditional steps output
+    a list of their input and of their own payload (see `_wrap_branch`).
+
+    Args:
+        layers (list): Compiled layers of the pipeline
+        layer_number (int): Index of the layer
+        name (str): Name of the step whose output is needed
+        conditional (Collection[str]): Names of the conditional Steps
+    """
+    if layer_number < 0:
+        raise ValueError(f"The output of step {name} is not available")
+    layer = layers[layer_number]
+    if len(layer) == 1:
+        return _branch_payload_path(layers, layer_number, layer[0], name, conditional)
+    branch = next(
+        (index for index, step in enumerate(layer) if name in step_names(step)), 0
+    )
+    return f"$[{branch}]" + (
+        _branch_payload_path(layers, layer_number, layer[branch], name, conditional)[1:]
+    )
+
+
+def _condition_rule(
+    conditions: Sequence[Step],
+    layers: List[List[Step]],
+    layer_number: int,
+    conditional: Collection[str],
+) -> dict:
+    """Choice rule matching when every predicate returned True.  The output
+    of a predicate is absent if the predicate was itself skipped."""
+    rules = []
+    for predicate in conditions:
+        path = payload_path(layers, layer_number - 1, predicate.name, conditional)
+        variable = f"{path}.{predicate.name}"
+        rules.append({"Variable": variable, "IsPresent": True})
+        rules.append({"Variable": variable, "BooleanEquals": True})
+    return {"And": rules}
+
+
+def _wrap_branch(
+    step: Step,
+    state_id: str,
+    branch: Union[State, Chain],
+    conditions: Sequence[Step],
+    layers: List[List[Step]],
+    layer_number: int,
+    conditional: Collection[str],
+) -> Parallel:
+    """Runs the states of a step in a Parallel state next to a passthrough
+    branch, so that the output of the previous steps is passed on as well.
+    If the step is conditional, a Choice state runs the states only if every
+    predicate returned True, and otherwise outputs an empty payload."""
+    if conditions:
+        choice = Choice(f"{step.name} condition")
+        choice.add_choice(
+            _condition_rule(conditions, layers, layer_number, conditional), branch
+        )
+        choice.default_choice(Pass(f"{step.name} skipped", result={"Payload": {}}))
+        branch = choice
+    wrapper = Parallel(state_id)
+    wrapper.add_branch(Pass(f"{step.name} passthrough"))
+    wrapper.add_branch(branch)
+    return wrapper
+
+
+def _iteration_payload(
+    step: MapStep,
+    layers: List[List[Step]],
+    layer_number: int,
+    conditional: Collection[str],
+) -> dict:
+    """Parameters passing each iteration of a Map step the outputs of the
+    steps its function depends on.  For selectors (eg `step_result["rows"]`),
+    only the selected field is passed.  JSONPath selects the leading string
+    keys of a selector; list indices are applied in the Lambda."""
+    selections = {}  # step name -> prefixes of keys to select
+    for index, arg in enumerate(step.args):
+        if index == step.map_index:
+            continue
+        if isinstance(arg, Step):
+            selections.setdefault(arg.name, []).append(())
+        elif isinstance(arg, StepSelector):
+            prefix = []
+            for key in arg.keys:
+                if not isinstance(key, str):
+                    break
+                prefix.append(key)
+            selections.setdefault(arg.step.name, []).append(tuple(prefix))
+
+    payload = {}
+    for name, prefixes in selections.items():
+        path = payload_path(layers, layer_number - 1, name, conditional)
+        path = f"$.Input{path[1:]}.{name}"
+        for prefix in dict.fromkeys(prefixes):
+            if any(
+                other != prefix and prefix[: len(other)] == other for other in prefixes
+            ):
+                continue  # a parent field is already selected
+            if not prefix:
+                payload[f"{name}.$"] = path
+                continue
+            fields = payload.setdefault(name, {})
+            for key in prefix[:-1]:
+                fields = fields.setdefault(key, {})
+            fields[f"{prefix[-1]}.$"] = path + "".join(f".{key}" for key in prefix)
+    return payload
+
+
+def convert_map_step(
+    step: MapStep,
+    generate_step_name: Callable[[Step], str],
+    dispatcher: bool,
+    layers: List[List[Step]],
+    layer_number: int,
+    conditions: Sequence[Step] = (),
+    conditional: Collection[str] = (),
+) -> Parallel:
+    """Create a Map state from a MapStep.  A Pass state gathers the items
+        (static items are batched here, items output by a step are batched
+        with States.ArrayPartition), and the Map state invokes the Lambda
+        once per batch, with the outputs of the other steps the function
+        depends on.  The results of all batches are flattened into a list.
+        The Map state runs in a Parallel state next to a passthrough branch,
+        so that the output of the previous steps is passed on as well.
+
+    Args:
+        step (MapStep): The `MapStep` to convert
+        generate_step_name (callable): Generates the ARN of the Lambda from the step
+        dispatcher (bool): If True, the Lambda is a shared dispatcher which routes on the step name.
+        layers (list): Compiled layers of the pipeline
+        layer_number (int): Index of the layer of the step
+        conditions (Sequence[Step]): Predicate Steps the step is conditional on
+        conditional (Collection[str]): Names of the conditional Steps
+    """
+    payload = _iteration_payload(step, layers, layer_number, conditional)
+    batched = step.batch_size is not None and step.batch_size > 1
+    item_batcher = None
+    if isinstance(step.items, (Step, StepSelector)):
+        if isinstance(step.items, StepSelector):
+            items_name = step.items.step.name
+            items_field = step.items.to_jsonpath()
+        else:
+            items_name = step.items.name
+            items_field = ""
+        items_path = payload_path(layers, layer_number - 1, items_name, conditional)
+        items_path = f"{items_path}.{items_name}{items_field}"
+        if batched and not step.distributed:
+            items = {
+                "MapItems.$": f"States.ArrayPartition({items_path}, {step.batch_size})"
+            }
+        else:
+            items = {"MapItems.$": items_path}
+    elif batched and not step.distributed:
+        items = {
+            "MapItems": [
+                list(step.items[index : index + step.batch_size])
+                for index in range(0, len(step.items), step.batch_size)
+            ]
+        }
+    else:
+        items = {"MapItems": list(step.items)}
+
+    if batched and step.distributed:
+        item_batcher = {"MaxItemsPerBatch": step.batch_size}
+        item_selector = {"MapItem.$": "$$.Map.Item.Value", "Payload": payload}
+    elif batched:
+        item_selector = {"MapItems.$": "$$.Map.Item.Value", "Payload": payload}
+    else:
+        item_selector = {
+            "MapItems.$": "States.Array($$.Map.Item.Value)",
+            "Payload": payload,
+        }
+
+    map_state = Map(
+        step.name,
+        items_path="$.MapItems",
+        max_concurrency=step.max_concurrency,
+        item_selector=item_selector,
+        item_batcher=item_batcher,
+        result_selector={"Payload": {f"{step.name}.$": "$[*][*]"}},
+    )
+    map_state.attach_processor(
+        convert_step_to_lambda(
+            step,
+            generate_step_name,
+            dispatcher,
+            state_id=f"{step.name} iteration",
+            output_path="$.Payload",  # the list of results of the batch
+        ),
+        mode="DISTRIBUTED" if step.distributed else "INLINE",
+        execution_type="STANDARD" if step.distributed else None,
+    )
+    wrapper = _wrap_branch(
+        step,
+        f"map {step.name}",
+        Chain(
+            [
+                Pass(f"{step.name} items", parameters={**items, "Input.$": "$"}),
+                map_state,
+            ]
+        ),
+        conditions,
+        layers,
+        layer_number,
+        conditional,
+    )
+    logger.debug(f"Converted {step.name} to Map")
+    return wrapper
+
+
+def convert_conditional_step(
+    step: Step,
+    generate_step_name: Callable[[Step], str],
+    dispatcher: bool,
+    layers: List[List[Step]],
+    layer_number: int,
+    conditions: Sequence[Step],
+    conditional: Collection[str],
+) -> Parallel:
+    """Create a Choice state running the Lambda of a conditional Step only if
+        every predicate returned True.  The Choice state runs in a Parallel
+        state next to a passthrough branch, so that the output is the same
+        whether or not the step is skipped.
+
+    Args:
+        step (Step): The conditional `Step` to convert
+        generate_step_name (callable): Generates the ARN of the Lambda from the step
+        dispatcher (bool): If True, the Lambda is a shared dispatcher which routes on the step name.
+        layers (list): Compiled layers of the pipeline
+        layer_number (int): Index of the layer of the step
+        conditions (Sequence[Step]): Predicate Steps the step is conditional on
+        conditional (Collection[str]): Names of the conditional Steps
+    """
+    wrapper = _wrap_branch(
+        step,
+        f"when {step.name}",
+        convert_step_to_lambda(step, generate_step_name, dispatcher),
+        conditions,
+        layers,
+        layer_number,
+        conditional,
+    )
+    logger.debug(f"Converted {step.name} to Choice")
+    return wrapper
+
+
+def run_map_locally(step: MapStep, args: List[Any]) -> List[Any]:
+    """Runs the function of a MapStep once per item, in a thread pool of at
+        most max_concurrency workers, and gathers the results in order.
+
+    Args:
+        step (MapStep): The `MapStep` to run
+        args (list): Resolved arguments of the step, including the items to map over
+    """
+
+    def run_item(item):
+        return step.func(*args[: step.map_index], item, *args[step.map_index + 1 :])
+
+    with ThreadPoolExecutor(max_workers=step.max_concurrency) as executor:
+        return list(executor.map(run_item, args[step.map_index]))
+
+
 def _default_lambda_name(s: Step) -> str:
     return "${aws_lambda_function." + s.name + "lambda.arn}"
 
 
+def _default_state_machine_name(name: str) -> str:
+    return "${aws_sfn_state_machine." + name + ".arn}"
+
+
+class StateMachineSpec:
+    """A state machine generated from a pipeline.  Its items run in sequence:
+    each item is either a layer of Steps which run concurrently, or the
+    name of a child state machine to start and wait for."""
+
+    def __init__(
+        self,
+        name: str,
+        workflow_type: str,
+        items: List[Union[List[Step], str]],
+        pipeline_layers: List[List[Step]],
+        conditions: Optional[Dict[str, List[Step]]] = None,
+    ):
+        """Initialize a StateMachineSpec
+
+        Args:
+            name (str): Name of the state machine
+            workflow_type (str): "STANDARD" or "EXPRESS"
+            items (list): Layers of Steps, or names of child state machines
+            pipeline_layers (list): Compiled layers of the whole pipeline
+            conditions (dict): Predicate Steps each Step is conditional on, keyed by step name
+        """
+        self.name = name
+        self.workflow_type = workflow_type
+        self.items = items
+        self.pipeline_layers = pipeline_layers
+        self.conditions = conditions if conditions else {}
+        self.conditional = {
+            name for name, predicates in self.conditions.items() if predicates
+        }
+        self.layer_index = {
+            step.name: index
+            for index, layer in enumerate(pipeline_layers)
+            for step in layer
+        }
+
+
+class _LocalRun:
+    """State of a single local run, so that concurrent runs of a pipeline
+    do not share it."""
+
+    def __init__(self, coordinator: Optional[Coordinator] = None):
+        """Initialize a _LocalRun
+
+        Args:
+            coordinator (Coordinator): Optional (started) `Coordinator` running the steps
+        """
+        self.coordinator = coordinator
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def count_cache_lookup(self, hit: bool):
+        with self._lock:
+            self.cache_stats["hits" if hit else "misses"] += 1
+
+
 class Pipeline:
     def __init__(
         self,
@@ -59,18 +772,73 @@ class Pipeline:
         steps: Optional[Sequence[Step]] = None,
         schedule: Optional[str] = None,  # cron
         generate_step_name: Callable[[Step], str] = _default_lambda_name,
+        dispatcher: bool = False,
+        fuse: bool = False,
+        pack: bool = False,
+        durations: Optional[Dict[str, float]] = None,
+        pack_max_duration: float = 1.0,
+        pack_max_size: int = 10,
+        partition: bool = False,
+        max_partition_states: int = 500,
+        max_partition_events: int = 20000,
+        generate_state_machine_name: Callable[[str], str] = _default_state_machine_name,
+        workflow_type: str = "STANDARD",
+        nest_express: bool = False,
+        express_max_duration: float = 240.0,
+        serializer: Optional[Serializer] = None,
     ):
         """Initialize a Pipeline
 
         Args:
             name (str): The name of the pipeline.
             steps (Sequence[Step]): The list of the non-conditional Steps associated with the pipeline.
+            schedule (str): Optional cron or rate expression to schedule the pipeline.
+            generate_step_name (callable): Generates the ARN of the Lambda from the step.
+            dispatcher (bool): If True, compatible steps are packaged into a single dispatcher Lambda which routes on the step name.  Defaults to False (one Lambda per step).
+            fuse (bool): If True, linear chains of steps are fused into a single Lambda invocation.  Steps can opt out with `fuse=False`.  Defaults to False.
+            pack (bool): If True, small independent steps of the same layer are packed into a single Lambda invocation which runs them concurrently.  Defaults to False.
+            durations (dict): Profiled timings of steps, in seconds, keyed by step name.  Take precedence over the `duration` hint of the steps.
+            pack_max_duration (float): Maximum duration, in seconds, of a step to be packed.  Defaults to 1 second.
+            pack_max_size (int): Maximum number of steps packed into one invocation.  Defaults to 10.
+            partition (bool): If True, pipelines which exceed max_partition_states or max_partition_events are split into child state machines, started in sequence by a parent state machine.  Defaults to False.
+            max_partition_states (int): Maximum number of states per child state machine.  Defaults to 500.
+            max_partition_events (int): Maximum (estimated, worst case) number of history events per child execution.  Defaults to 20,000, below the 25,000 limit.
+            generate_state_machine_name (callable): Generates the ARN of a child state machine from its name.
+            workflow_type (str): "STANDARD" or "EXPRESS".  Express workflows are billed by duration rather than by state transition, but executions are limited to 5 minutes.  Defaults to "STANDARD".
+            nest_express (bool): If True, runs of consecutive short layers of steps are moved into nested Express state machines, started synchronously from the Standard parent.  Requires durations (declared or profiled) of the steps; steps with retries are never nested.  Defaults to False.
+            express_max_duration (float): Maximum estimated duration, in seconds, of a nested Express state machine.  Defaults to 240, leaving headroom below the 5 minute limit.
+            serializer (Serializer): Optional serialization of the outputs of the steps which do not set their own serializer.  Defaults to plain JSON.
         """
         self.name = name
         self.steps = steps if steps else []
         self.graph = nx.DiGraph()
         self.generate_step_name = generate_step_name
         self.schedule = schedule
+        self.dispatcher = dispatcher
+        self.fuse = fuse
+        self.pack = pack
+        self.durations = durations if durations else {}
+        self.pack_max_duration = pack_max_duration
+        self.pack_max_size = pack_max_size
+        self.partition = partition
+        self.max_partition_states = max_partition_states
+        self.max_partition_events = max_partition_events
+        self.generate_state_machine_name = generate_state_machine_name
+        if workflow_type not in ("STANDARD", "EXPRESS"):
+            raise ValueError(
+                f"Unknown workflow type {workflow_type}: must be STANDARD or EXPRESS"
+            )
+        if workflow_type == "EXPRESS" and (partition or nest_express):
+            raise ValueError(
+                "Express workflows can not wait for child state machines: partition and nest_express require a STANDARD workflow."
+            )
+        self.workflow_type = workflow_type
+        self.nest_express = nest_express
+        self.express_max_duration = express_max_duration
+        self.serializer = serializer
+        self.cache_stats = {"hits": 0, "misses": 0}  # of the latest local run
+        self._cache_stats_lock = threading.Lock()
+        self._compiled_graph = None
         for step in steps:
             crawl_back(self.graph, step)
         if not nx.is_directed_acyclic_graph(self.graph):
@@ -79,11 +847,44 @@ class Pipeline:
             raise ValueError(
                 "Non-unique Step names!  Step names must be unique or a unique name must be passed to the @step decorator."
             )
+        if workflow_type == "EXPRESS" and self.uses_distributed_map():
+            raise ValueError(
+                "Express workflows can not run distributed Map states: distributed=True requires a STANDARD workflow."
+            )
+        self._check_serializers()
 
     def _check_uniqueness_of_names(self) -> bool:
         num_steps = len(self.get_steps())
         return len(set(step.name for step in self.get_steps())) == num_steps
 
+    def _serializer_for(self, step: Step) -> Optional[Serializer]:
+        """Serializer of the output of a step: its own, or the pipeline's
+        (Map steps do not support a serializer).  The steps are left
+        unchanged, since they can be shared by several pipelines."""
+        if isinstance(step, MapStep):
+            return None
+        return step.serializer or self.serializer
+
+    def _check_serializers(self):
+        """Outputs which states read with JSONPath (the output of a predicate,
+        the items of a Map step, and fields selected for Map iterations)
+        must be plain JSON."""
+        for step in self.graph.nodes:
+            read_by_states = list(step.conditions)
+            if isinstance(step, MapStep):
+                read_by_states += [
+                    arg if isinstance(arg, Step) else arg.step
+                    for index, arg in enumerate(step.args)
+                    if isinstance(arg, StepSelector)
+                    or (isinstance(arg, Step) and index == step.map_index)
+                ]
+            for source in read_by_states:
+                serializer = self._serializer_for(source)
+                if serializer is not None and not serializer.is_json_native():
+                    raise ValueError(
+                        f"Step {step.name} reads the output of step {source.name} with JSONPath, so {source.name} can not encode its output."
+                    )
+
     def get_steps(self) -> List[Step]:
         """Gets all steps, guaranteed to be unique."""
         return self.graph.nodes
@@ -96,51 +897,531 @@ class Pipeline:
         """
         return list(nx.topological_generations(self.graph))
 
-    def generate_step_functions(self) -> dict:
-        """Create Step Function workflow definition"""
+    def step_conditions(self) -> Dict[str, List[Step]]:
+        """Predicate Steps each Step is conditional on, keyed by step name."""
+        return step_conditions(self.graph)
+
+    def compile_graph(self) -> nx.DiGraph:
+        """Applies the compiler passes (eg, fusing linear chains) to the graph of Steps.
+        The result is the graph of Steps which are deployed as Lambdas.
+        Conditional Steps are never fused or packed.  The result is computed
+        once, and recomputed only if the compiler options change."""
+        options = (
+            self.fuse,
+            self.pack,
+            tuple(sorted(self.durations.items())),
+            self.pack_max_duration,
+            self.pack_max_size,
+        )
+        if self._compiled_graph is not None and self._compiled_graph[0] == options:
+            return self._compiled_graph[1]
+        graph = self.graph
+        conditional = [
+            name for name, predicates in self.step_conditions().items() if predicates
+        ]
+        if self.fuse:
+            graph = fuse_linear_chains(graph, conditional)
+        if self.pack:
+            graph = pack_siblings(
+                graph,
+                self.durations,
+                self.pack_max_duration,
+                self.pack_max_size,
+                conditional,
+            )
+        self._compiled_graph = (options, graph)
+        return graph
+
+    def get_compiled_steps(self) -> List[Step]:
+        """Gets all steps after the compiler passes, guaranteed to be unique."""
+        return list(self.compile_graph().nodes)
+
+    def generate_compiled_layers(self) -> List[List[Step]]:
+        """
+        Create indexed sets of steps, after the compiler passes.
+        """
+        return list(nx.topological_generations(self.compile_graph()))
+
+    def _uses_dispatcher(self, step: Step) -> bool:
+        return self.dispatcher or isinstance(step, CompositeStep)
+
+    def _nest_express_segments(
+        self,
+        layers: List[List[Step]],
+        segment_names: Iterator[str],
+        pipeline_layers: List[List[Step]],
+        conditions: Dict[str, List[Step]],
+    ) -> Tuple[List[Union[List[Step], str]], Dict[str, "StateMachineSpec"]]:
+        """Replaces runs of short layers by nested Express state machines.
+        Returns the items of the enclosing state machine, and the nested
+        state machines."""
+        items = []
+        segments = {}
+        run = []
+        run_duration = 0.0
+        conditional = [name for name, predicates in conditions.items() if predicates]
+
+        def flush():
+            if sum(estimate_layer_states(layer, conditional) for layer in run) >= 2:
+                segment_name = next(segment_names)
+                segments[segment_name] = StateMachineSpec(
+                    segment_name, "EXPRESS", list(run), pipeline_layers, conditions
+                )
+                items.append(segment_name)
+            else:  # a single Task gains nothing from nesting
+                items.extend(run)
+            run.clear()
+
+        for layer in layers:
+            durations = [estimate_duration(step, self.durations) for step in layer]
+            duration = (
+                None
+                if None in durations
+                or any(
+                    step.retry_count > 0 or isinstance(step, MapStep) for step in layer
+                )
+                else max(durations)
+            )
+            if duration is not None and run_duration + duration <= (
+                self.express_max_duration
+            ):
+                run.append(layer)
+                run_duration += duration
+                continue
+            flush()
+            run_duration = 0.0
+            if duration is not None and duration <= self.express_max_duration:
+                run.append(layer)
+                run_duration = duration
+            else:
+                items.append(layer)
+        flush()
+        return items, segments
+
+    def generate_state_machines(self) -> Dict[str, "StateMachineSpec"]:
+        """Creates the specification of every state machine generated for the
+        pipeline, keyed by name.  The first is the parent state machine,
+        named after the pipeline.  Unless the pipeline is partitioned or
+        nests Express segments, it is the only state machine."""
+        graph = self.compile_graph()
+        layers = list(nx.topological_generations(graph))
+        conditions = self.step_conditions()
+        partitions = [layers]
+        if self.partition:
+            partitions = partition_layers(
+                graph,
+                layers,
+                self.max_partition_states,
+                self.max_partition_events,
+                [name for name, predicates in conditions.items() if predicates],
+            )
+        partition_names = [self.name]
+        if len(partitions) > 1:
+            partition_names = [
+                f"{self.name}_part_{index}" for index in range(len(partitions))
+            ]
+
+        state_machines = {}
+        if len(partitions) > 1:
+            state_machines[self.name] = StateMachineSpec(
+                self.name, self.workflow_type, partition_names, layers, conditions
+            )
+        segment_names = (f"{self.name}_express_{index}" for index in count())
+        for partition_name, partition in zip(partition_names, partitions):
+            segments = {}
+            items = partition
+            if self.nest_express:
+                items, segments = self._nest_express_segments(
+                    partition, segment_names, layers, conditions
+                )
+            state_machines[partition_name] = StateMachineSpec(
+                partition_name, self.workflow_type, items, layers, conditions
+            )
+            state_machines.update(segments)
+        return state_machines
+
+    def _convert_step(self, spec: StateMachineSpec, step: Step) -> State:
+        conditions = spec.conditions.get(step.name, [])
+        if isinstance(step, MapStep):
+            return convert_map_step(
+                step,
+                self.generate_step_name,
+                self._uses_dispatcher(step),
+                spec.pipeline_layers,
+                spec.layer_index[step.name],
+                conditions,
+                spec.conditional,
+            )
+        if conditions:
+            return convert_conditional_step(
+                step,
+                self.generate_step_name,
+                self._uses_dispatcher(step),
+                spec.pipeline_layers,
+                spec.layer_index[step.name],
+                conditions,
+                spec.conditional,
+            )
+        return convert_step_to_lambda(
+            step, self.generate_step_name, self._uses_dispatcher(step)
+        )
+
+    def uses_distributed_map(self) -> bool:
+        """Whether any step runs as a distributed Map state, which starts
+        child executions of the state machine it belongs to."""
+        return any(
+            isinstance(step, MapStep) and step.distributed for step in self.get_steps()
+        )
+
+    def generate_definition(self, spec: "StateMachineSpec") -> dict:
+        """Creates the definition of a state machine running its items in
+        sequence: a Task (or a Parallel state of Tasks) per layer of Steps,
+        and a Task starting and waiting for each child state machine.
+
+        Args:
+            spec (StateMachineSpec): The state machine, from `generate_state_machines`
+        """
         dag_lambda = []
-        for index, layer in enumerate(self.generate_layers()):
-            if len(layer) == 1:
+        for item in spec.items:
+            if isinstance(item, str):
                 dag_lambda.append(
-                    convert_step_to_lambda(layer[0], self.generate_step_name)
+                    StepFunctionsStartExecutionStep(
+                        item,
+                        parameters={
+                            "StateMachineArn": self.generate_state_machine_name(item),
+                            "Input.$": "$",
+                        },
+                        output_path="$.Output",  # the output of the child execution
+                    )
                 )
+            elif len(item) == 1:
+                dag_lambda.append(self._convert_step(spec, item[0]))
             else:
-                parallel_state = Parallel(f"parallel at {index}")
-                for step in layer:
-                    parallel_state.add_branch(
-                        convert_step_to_lambda(step, self.generate_step_name)
-                    )
+                parallel_state = Parallel(
+                    f"parallel at {spec.layer_index[item[0].name]}"
+                )
+                for step in item:
+                    parallel_state.add_branch(self._convert_step(spec, step))
                 dag_lambda.append(parallel_state)
         chain = Chain(dag_lambda)
         workflow = Graph(
             chain
         )  # Workflow(name=self.name, definition=chain, role="doesnotmatter")
-        logger.debug(f"Converted {self.name} to step function Workflow")
         return workflow.to_dict()
 
+    def generate_step_functions(self, state_machine_name: Optional[str] = None) -> dict:
+        """Create Step Function workflow definition.  If the pipeline is
+        partitioned, this is the parent state machine, which starts each
+        child state machine in sequence and passes the output of each
+        child on to the next.
+
+        Args:
+            state_machine_name (str): Optional name of a child state machine to generate instead of the parent.
+        """
+        state_machines = self.generate_state_machines()
+        definition = self.generate_definition(
+            state_machines[state_machine_name or self.name]
+        )
+        logger.debug(f"Converted {self.name} to step function Workflow")
+        return definition
+
+    def generate_child_step_functions(self) -> Dict[str, dict]:
+        """Create the Step Function workflow definitions of the child state
+        machines, keyed by name, such that every child comes after the
+        children it starts.  Empty if the pipeline is neither partitioned
+        nor nests Express segments."""
+        state_machines = self.generate_state_machines()
+        return {
+            name: self.generate_definition(state_machines[name])
+            for name in reversed(list(state_machines)[1:])
+        }
+
+    def partition_report(self) -> List[Dict[str, Any]]:
+        """Estimated size of each state machine: the workflow type, the number
+        of steps run directly, states, and worst case history events per
+        execution."""
+        report = []
+        for name, spec in self.generate_state_machines().items():
+            layers = [item for item in spec.items if not isinstance(item, str)]
+            children = len(spec.items) - len(layers)
+            report.append(
+                {
+                    "name": name,
+                    "type": spec.workflow_type,
+                    "steps": sum(len(layer) for layer in layers),
+                    "states": children
+                    + sum(
+                        estimate_layer_states(layer, spec.conditional)
+                        for layer in layers
+                    ),
+                    "events": EXECUTION_EVENTS
+                    + TASK_EVENTS * children
+                    + sum(
+                        estimate_layer_events(layer, spec.conditional)
+                        for layer in layers
+                    ),
+                }
+            )
+        return report
+
+    def step_ranks(self, runtimes: Optional[RuntimeStore] = None) -> Dict[str, float]:
+        """Estimated longest path, in seconds, from the start of each step to
+            the end of the pipeline, keyed by step name.  Run times recorded in
+            runtimes take precedence over profiled durations and duration hints.
+
+        Args:
+            runtimes (RuntimeStore): Optional history of the run times of the steps
+        """
+        durations = {}
+        for step in self.graph.nodes:
+            duration = estimate_duration(step, self.durations)
+            if duration is not None:
+                durations[step.name] = duration
+        if runtimes is not None:
+            durations.update(runtimes.estimates(list(self.graph.nodes)))
+        return upward_ranks(self.graph, durations)
+
     def set_generate_step_name(self, generate_step_name: Callable[[Step], str]):
         self.generate_step_name = generate_step_name
 
-    def local_run(self) -> List[List[Tuple[str, Any]]]:
+    def set_generate_state_machine_name(
+        self, generate_state_machine_name: Callable[[str], str]
+    ):
+        self.generate_state_machine_name = generate_state_machine_name
+
+    def _run_step_locally(self, run: _LocalRun, step: Step, args: List[Any]) -> Any:
+        """Runs a step (on a worker, for distributed runs), or looks up its
+        result in its cache.  Returns the (encoded, if the step has a
+        serializer) output."""
+
+        def compute():
+            if run.coordinator is not None:
+                output = run.coordinator.run_step(
+                    step, args, self._serializer_for(step)
+                )
+                # cached results must be JSON, rather than a reference
+                return output if step.cache is None else run.coordinator.resolve(output)
+            if isinstance(step, MapStep):
+                return run_map_locally(step, args)
+            output = step.func(*args)
+            serializer = self._serializer_for(step)
+            if serializer is not None:
+                output = serializer.encode(output)
+            return output
+
+        if step.cache is None:
+            return compute()
+        output, hit = memoize(step.cache, code_fingerprint(step), compute, args)
+        run.count_cache_lookup(hit)
+        logger.debug(f"Cache {'hit' if hit else 'miss'} for step {step.name}")
+        return output
+
+    def _local_step(
+        self,
+        run: _LocalRun,
+        step: Step,
+        outputs: Dict[str, Any],
+        conditions: Dict[str, List[Step]],
+        profiler: Optional[Profiler],
+        ready: Optional[float] = None,
+        timings: Optional[Dict[str, float]] = None,
+    ) -> Tuple[bool, Any]:
+        """Runs a step of a local run, once its dependencies have run.
+        Returns whether it ran (it is skipped if its predicates did not all
+        return True), and its output as received by downstream steps.  The
+        duration of the step is added to timings, if given."""
+        if any(
+            outputs.get(predicate.name) is not True
+            for predicate in conditions[step.name]
+        ):
+            logger.debug(f"Skipped step {step.name}")
+            return False, None
+        args = []
+        for arg in step.args:
+            if isinstance(arg, Step):
+                args.append(outputs[arg.name])
+            elif isinstance(arg, StepSelector):
+                args.append(arg.select(outputs[arg.step.name]))
+            else:
+                args.append(arg)
+        start = time.perf_counter()
+        if profiler is None:
+            output = self._run_step_locally(run, step, args)
+        else:
+            output = profiler.run(
+                step.name, lambda: self._run_step_locally(run, step, args), ready
+            )
+        if timings is not None:
+            timings[step.name] = time.perf_counter() - start
+        serializer = self._serializer_for(step)
+        if serializer is not None and not isinstance(output, BlobRef):
+            # as received by downstream steps
+            output = serializer.decode(output)
+        if logger.isEnabledFor(logging.DEBUG):  # outputs can be large
+            logger.debug(f"Output from step {step.name}: {output}")
+        return True, output
+
+    def _run_in_parallel(
+        self,
+        run: _LocalRun,
+        conditions: Dict[str, List[Step]],
+        profiler: Optional[Profiler],
+        max_workers: int,
+        ranks: Dict[str, float],
+        timings: Dict[str, float],
+        memory_budget: Optional[int] = None,
+        cpu_budget: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """Runs each step once its dependencies have run, in a thread pool.
+        When more steps are ready than there are idle workers, the steps with
+        the highest rank (the longest remaining path) start first.  A step
+        only starts if its memory_size and cpus fit in what is left of the
+        budgets; smaller ready steps fill the capacity left meanwhile.
+        Returns the outputs of the steps which ran."""
+        outputs = {}
+        remaining = {step: self.graph.in_degree(step) for step in self.graph.nodes}
+        queue = []  # (-rank, order, ready, step) of the ready steps
+        order = count()
+        in_use = {"memory": 0, "cpus": 0.0}
+
+        def demand(step: Step) -> Tuple[int, float]:
+            return step.memory_size, 1.0 if step.cpus is None else step.cpus
+
+        def fits(step: Step) -> bool:
+            if not running:
+                # a step larger than the budget runs on its own
+                return True
+            memory, cpus = demand(step)
+            return (
+                memory_budget is None or in_use["memory"] + memory <= memory_budget
+            ) and (cpu_budget is None or in_use["cpus"] + cpus <= cpu_budget)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running = {}
+
+            def push(step: Step):
+                ready = None if profiler is None else profiler.now()
+                heapq.heappush(queue, (-ranks[step.name], next(order), ready, step))
+
+            def submit_ready():
+                waiting = []  # ready steps which do not fit in the budget
+                while queue and len(running) < max_workers:
+                    item = heapq.heappop(queue)
+                    _, _, ready, step = item
+                    if not fits(step):
+                        logger.debug(f"Step {step.name} waits for resources")
+                        waiting.append(item)
+                        continue
+                    memory, cpus = demand(step)
+                    in_use["memory"] += memory
+                    in_use["cpus"] += cpus
+                    future = executor.submit(
+                        self._local_step,
+                        run,
+                        step,
+                        outputs,
+                        conditions,
+                        profiler,
+                        ready,
+                        timings,
+                    )
+                    running[future] = step
+                for item in waiting:
+                    heapq.heappush(queue, item)
+
+            for step, in_degree in remaining.items():
+                if in_degree == 0:
+                    push(step)
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    memory, cpus = demand(step)
+                    in_use["memory"] -= memory
+                    in_use["cpus"] -= cpus
+                    try:
+                        ran, output = future.result()
+                    except BaseException:
+                        for other in running:
+                            other.cancel()
+                        raise
+                    if ran:
+                        outputs[step.name] = output
+                    for downstream in self.graph.successors(step):
+                        remaining[downstream] -= 1
+                        if remaining[downstream] == 0:
+                            push(downstream)
+                submit_ready()
+        return outputs
+
+    def local_run(
+        self,
+        max_workers: int = 1,
+        profiler: Optional[Profiler] = None,
+        runtimes: Optional[RuntimeStore] = None,
+        memory_budget: Optional[int] = None,
+        cpu_budget: Optional[float] = None,
+        coordinator: Optional[Coordinator] = None,
+    ) -> List[List[Tuple[str, Any]]]:
         """
         Runs pipeline locally, with no AWS dependency.
-        Returns all intermediary outputs.
+        Returns all intermediary outputs.  Conditional steps whose
+        predicates did not all return True are skipped, and have no output.
+        Steps with a cache only run if their result is not found; the
+        number of cache hits and misses of the latest run is kept in
+        `cache_stats`.  Concurrent runs of a pipeline do not share state.
+
+        Args:
+            max_workers (int): Maximum number of steps to run concurrently, in threads.  With more than one worker, each step starts as soon as its dependencies have run and a worker is idle, steps on the longest remaining path first.  Defaults to 1 (steps run one at a time, layer by layer).
+            profiler (Profiler): Optional profiler recording the time, memory, and output size of each step.
+            runtimes (RuntimeStore): Optional history of the run times of the steps, keyed by step name and code.  The durations of this run are recorded, and estimate the remaining path of each step (otherwise, durations and duration hints are used).
+            memory_budget (int): Optional memory, in MB, of the steps running concurrently, each weighing its `memory_size`.  A ready step waits until it fits, while smaller ready steps start.  A step larger than the budget runs on its own.  Only applies with more than one worker.
+            cpu_budget (float): Optional number of CPUs of the steps running concurrently, each weighing its `cpus` (1 by default).  Only applies with more than one worker.
+            coordinator (Coordinator): Optional (started) `Coordinator`, to run the steps on its workers, possibly on other machines.  max_workers then bounds the number of steps handed to workers at once.  Outputs put in its blob store are returned as `BlobRef`s (see `Coordinator.resolve`).
         """
-        outputs = {}  # contains all intermediary output
-        output_arr = (
-            []
-        )  # contains all intermediary output, in the shape of the steps given by the topological generations
-        for layer in self.generate_layers():
-            layer_output = []
-            for step in layer:
-                args = []
-                for arg in step.args:
-                    if isinstance(arg, Step):
-                        args.append(outputs[arg.name])
-                    else:
-                        args.append(arg)
-                outputs[step.name] = step.func(*args)
-                logger.debug(f"Output from step {step.name}: {outputs[step.name]}")
-                layer_output.append((step.name, outputs[step.name]))
-            output_arr.append(layer_output)
-        return output_arr
+        conditions = self.step_conditions()
+        run = _LocalRun(coordinator)
+        layers = self.generate_layers()
+        timings = {}
+        if profiler is not None:
+            profiler.start()
+        try:
+            if max_workers > 1:
+                outputs = self._run_in_parallel(
+                    run,
+                    conditions,
+                    profiler,
+                    max_workers,
+                    self.step_ranks(runtimes),
+                    timings,
+                    memory_budget,
+                    cpu_budget,
+                )
+            else:
+                outputs = {}  # contains all intermediary output
+                for layer in layers:
+                    for step in layer:
+                        ran, output = self._local_step(
+                            run, step, outputs, conditions, profiler, timings=timings
+                        )
+                        if ran:
+                            outputs[step.name] = output
+        finally:
+            with self._cache_stats_lock:
+                self.cache_stats = dict(run.cache_stats)
+            if profiler is not None:
+                profiler.stop()
+            if runtimes is not None and timings:
+                steps = {step.name: step for step in self.graph.nodes}
+                runtimes.record(
+                    {
+                        (name, step_fingerprint(steps[name])): duration
+                        for name, duration in timings.items()
+                    }
+                )
+        # contains all intermediary output, in the shape of the steps given by the topological generations
+        return [
+            [(step.name, outputs[step.name]) for step in layer if step.name in outputs]
+            for layer in layers
+        ]
@@ -0,0 +1,205 @@
+from typing import List, Optional, Dict
+import json
+from hashlib import sha256
+
+# IAM documents shared by the cdktf (`tf`) and native JSON (`tf_json`) Terraform generators.
+
+LAMBDA_ASSUME_ROLE_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Action": "sts:AssumeRole",
+            "Principal": {"Service": ["lambda.amazonaws.com"]},
+        }
+    ],
+}
+
+LAMBDA_LOGGING_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Action": [
+                "logs:CreateLogGroup",
+                "logs:CreateLogStream",
+                "logs:PutLogEvents",
+            ],
+            "Resource": ["arn:aws:logs:*:*:*"],
+        },
+    ],
+}
+
+
+def policy_hash(policy: str) -> str:
+    """Content hash of an IAM policy.  Policies which are valid JSON are
+        normalized first, so formatting differences do not matter.
+
+    Args:
+        policy (str): IAM policy, in JSON
+    """
+    try:
+        policy = json.dumps(json.loads(policy), sort_keys=True)
+    except ValueError:
+        pass
+    return sha256(policy.encode()).hexdigest()[:16]
+
+
+def event_bridge_assume_role_policy() -> dict:
+    """IAM assume role policy for the Event Bridge role which starts the step function"""
+    return {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Principal": {"Service": "events.amazonaws.com"},
+                "Action": "sts:AssumeRole",
+            }
+        ],
+    }
+
+
+def event_bridge_policy(step_function_arn: str) -> dict:
+    """IAM policy allowing Event Bridge to start the step function
+
+    Args:
+        step_function_arn (str): ARN of the step function pipeline
+    """
+    return {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Action": ["states:StartExecution"],
+                "Resource": step_function_arn,
+            }
+        ],
+    }
+
+
+def step_function_assume_role_policy(aws_region: str) -> dict:
+    """IAM assume role policy for the step function role
+
+    Args:
+        aws_region (str): AWS Region
+    """
+    return {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Action": "sts:AssumeRole",
+                "Principal": {
+                    "Service": [
+                        f"states.{aws_region}.amazonaws.com",
+                        "events.amazonaws.com",
+                    ]
+                },
+            }
+        ],
+    }
+
+
+def step_function_policy(
+    lambda_arns: List[str],
+    child_state_machines: Optional[Dict[str, str]] = None,
+    distributed_map_state_machines: Optional[List[str]] = None,
+) -> dict:
+    """IAM policy allowing the step function to invoke Lambdas, log, and trace.
+        If there are child state machines, also allows starting them and
+        waiting for their completion (which uses an Event Bridge rule
+        managed by Step Functions).  If there are distributed Map states,
+        also allows the state machines to start their own child executions.
+
+    Args:
+        lambda_arns (list): ARNs of Lambdas invoked by the step function
+        child_state_machines (dict): Optional ARNs of child state machines, keyed by name
+        distributed_map_state_machines (list): Optional names of the state machines running distributed Map states
+    """
+    policy = {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Action": ["lambda:InvokeFunction"],
+                "Resource": lambda_arns,
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "logs:CreateLogDelivery",
+                    "logs:CreateLogStream",
+                    "logs:GetLogDelivery",
+                    "logs:UpdateLogDelivery",
+                    "logs:DeleteLogDelivery",
+                    "logs:ListLogDeliveries",
+                    "logs:PutLogEvents",
+                    "logs:PutResourcePolicy",
+                    "logs:DescribeResourcePolicies",
+                    "logs:DescribeLogGroups",
+                ],
+                "Resource": ["*"],
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "xray:PutTraceSegments",
+                    "xray:PutTelemetryRecords",
+                    "xray:GetSamplingRules",
+                    "xray:GetSamplingTargets",
+                ],
+                "Resource": ["*"],
+            },
+        ],
+    }
+    if child_state_machines:
+        policy["Statement"] += [
+            {
+                "Effect": "Allow",
+                "Action": ["states:StartExecution"],
+                "Resource": list(child_state_machines.values()),
+            },
+            {
+                "Effect": "Allow",
+                "Action": ["states:DescribeExecution", "states:StopExecution"],
+                "Resource": [
+                    arn
+                    for name in child_state_machines
+                    for arn in [
+                        f"arn:aws:states:*:*:execution:{name}:*",
+                        f"arn:aws:states:*:*:express:{name}:*:*",
+                    ]
+                ],
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "events:PutTargets",
+                    "events:PutRule",
+                    "events:DescribeRule",
+                ],
+                "Resource": [
+                    "arn:aws:events:*:*:rule/StepFunctionsGetEventsForStepFunctionsExecutionRule"
+                ],
+            },
+        ]
+    if distributed_map_state_machines:
+        policy["Statement"] += [
+            {
+                "Effect": "Allow",
+                "Action": ["states:StartExecution"],
+                "Resource": [
+                    f"arn:aws:states:*:*:stateMachine:{name}"
+                    for name in distributed_map_state_machines
+                ],
+            },
+            {
+                "Effect": "Allow",
+                "Action": ["states:DescribeExecution", "states:StopExecution"],
+                "Resource": [
+                    f"arn:aws:states:*:*:execution:{name}/*"
+                    for name in distributed_map_state_machines
+                ],
+            },
+        ]
+    return policy
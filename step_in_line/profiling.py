@@ -0,0 +1,251 @@
+"""Profiling of local runs.  A `Profiler` passed to `Pipeline.local_run`
+records, for each step, its wall and CPU time, the peak memory it allocated,
+the size of its output, and (when steps run in parallel) how long it waited
+for a worker once its dependencies had finished.  Profiles are exported as a
+Chrome trace (viewable in chrome://tracing or https://ui.perfetto.dev) and a
+summary table, with the critical path of the pipeline.
+"""
+
+import json
+import pickle
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import networkx as nx
+
+
+def output_size(output: Any) -> Optional[int]:
+    """Size in bytes of an output as passed between Lambdas (JSON), or
+        pickled if it is not JSON serializable.
+
+    Args:
+        output: The (encoded, if the step has a serializer) output of a step
+    """
+    try:
+        return len(json.dumps(output).encode())
+    except (TypeError, ValueError):
+        try:
+            return len(pickle.dumps(output))
+        except Exception:
+            return None
+
+
+class StepProfile:
+    """Measurements of a single step.  Times are in seconds, relative to the
+    start of the profiler."""
+
+    def __init__(
+        self,
+        name: str,
+        ready: float,
+        start: float,
+        end: float,
+        cpu: float,
+        thread: int,
+        peak_memory: Optional[int],
+        output_bytes: Optional[int],
+    ):
+        self.name = name
+        self.ready = ready
+        self.start = start
+        self.end = end
+        self.cpu = cpu
+        self.thread = thread
+        self.peak_memory = peak_memory
+        self.output_bytes = output_bytes
+
+    @property
+    def wall(self) -> float:
+        return self.end - self.start
+
+    @property
+    def queued(self) -> float:
+        """Time between the step's dependencies finishing and it starting"""
+        return self.start - self.ready
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "queued": self.queued,
+            "peak_memory": self.peak_memory,
+            "output_bytes": self.output_bytes,
+        }
+
+
+class Profiler:
+    """Records a `StepProfile` for each step of a local run"""
+
+    def __init__(self, memory: bool = True, process_cpu: bool = False):
+        """Initialize a Profiler
+
+        Args:
+            memory (bool): Whether to trace the peak memory allocated by each step, with tracemalloc.  Tracing slows down allocations.  Only steps which do not overlap with other steps get a peak; in parallel runs, it is None for overlapping steps.  Defaults to True.
+            process_cpu (bool): Whether to measure the CPU time of the whole process, including the threads a step starts (eg, Map steps), rather than of the thread running the step.  Only meaningful if steps run one at a time.  Defaults to False.
+        """
+        self.memory = memory
+        self._cpu_time = time.process_time if process_cpu else time.thread_time
+        self.profiles = {}  # step name -> StepProfile
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._in_flight = {}  # step name -> whether it overlapped with another step
+        self._threads = {}  # thread ident -> small id, for the trace
+        self._started_tracing = False
+
+    def now(self) -> float:
+        """Time, in seconds, since the profiler started"""
+        return time.perf_counter() - self._origin
+
+    def start(self):
+        """Starts tracing memory, if enabled and not already tracing"""
+        self._origin = time.perf_counter()
+        self.profiles = {}
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        """Stops tracing memory, if this profiler started it"""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def run(
+        self,
+        name: str,
+        run: Callable[[], Any],
+        ready: Optional[float] = None,
+    ) -> Any:
+        """Runs a step and records its profile.  Returns its output.
+
+        Args:
+            name (str): Name of the step
+            run (callable): Runs the step, and returns its output
+            ready (float): Time (see `now`) at which the step's dependencies had finished.  Defaults to when it starts.
+        """
+        tracing = self.memory and tracemalloc.is_tracing()
+        with self._lock:
+            for other in self._in_flight:
+                self._in_flight[other] = True
+            self._in_flight[name] = bool(self._in_flight)
+            if tracing and not self._in_flight[name]:
+                tracemalloc.reset_peak()
+            baseline_memory = tracemalloc.get_traced_memory()[0] if tracing else 0
+            thread = self._threads.setdefault(
+                threading.get_ident(), len(self._threads) + 1
+            )
+        start = self.now()
+        cpu_start = self._cpu_time()
+        try:
+            output = run()
+        finally:
+            cpu = self._cpu_time() - cpu_start
+            end = self.now()
+            with self._lock:
+                overlapped = self._in_flight.pop(name)
+                peak_memory = None
+                if tracing and not overlapped:
+                    peak_memory = max(
+                        tracemalloc.get_traced_memory()[1] - baseline_memory, 0
+                    )
+        self.profiles[name] = StepProfile(
+            name,
+            start if ready is None else min(ready, start),
+            start,
+            end,
+            cpu,
+            thread,
+            peak_memory,
+            output_size(output),
+        )
+        return output
+
+    def critical_path(self, graph: nx.DiGraph) -> List[str]:
+        """Names of the steps on the longest path, by wall time, through the
+            graph of steps: the steps which bound the duration of the run.
+
+        Args:
+            graph (DiGraph): The graph of Steps, eg `pipeline.graph`
+        """
+        finish = {}  # step -> wall time of the longest path ending at it
+        previous_on_path = {}
+        for step in nx.topological_sort(graph):
+            profile = self.profiles.get(step.name)
+            previous = max(graph.predecessors(step), key=finish.get, default=None)
+            finish[step] = (0.0 if profile is None else profile.wall) + (
+                0.0 if previous is None else finish[previous]
+            )
+            previous_on_path[step] = previous
+        step = max(finish, key=finish.get, default=None)
+        path = []
+        while step is not None:
+            path.append(step.name)
+            step = previous_on_path[step]
+        return [name for name in reversed(path) if name in self.profiles]
+
+    def summary(self, graph: Optional[nx.DiGraph] = None) -> str:
+        """Table of the profiles, slowest step first, with the critical path
+            if the graph of steps is given.
+
+        Args:
+            graph (DiGraph): Optional graph of Steps, eg `pipeline.graph`
+        """
+
+        def fmt(value: Optional[int]) -> str:
+            return "-" if value is None else f"{value:,}"
+
+        lines = [
+            f"{'step':<32} {'wall (ms)':>10} {'cpu (ms)':>10} {'queued (ms)':>12} {'peak (bytes)':>14} {'output (bytes)':>15}"
+        ]
+        for profile in sorted(self.profiles.values(), key=lambda p: -p.wall):
+            lines.append(
+                f"{profile.name:<32} {1000 * profile.wall:>10.2f} {1000 * profile.cpu:>10.2f} {1000 * profile.queued:>12.2f} {fmt(profile.peak_memory):>14} {fmt(profile.output_bytes):>15}"
+            )
+        if graph is not None:
+            path = self.critical_path(graph)
+            total = sum(self.profiles[name].wall for name in path)
+            lines.append(f"critical path ({1000 * total:.2f} ms): {' -> '.join(path)}")
+        return "\n".join(lines)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Profiles in the Chrome trace event format: a complete event per
+        step, on the track of the thread it ran in, and an async event for
+        the time it waited for a worker."""
+        events = []
+        for index, profile in enumerate(self.profiles.values()):
+            events.append(
+                {
+                    "name": profile.name,
+                    "cat": "step",
+                    "ph": "X",
+                    "ts": 1e6 * profile.start,
+                    "dur": 1e6 * profile.wall,
+                    "pid": 1,
+                    "tid": profile.thread,
+                    "args": {
+                        "cpu_ms": 1000 * profile.cpu,
+                        "queued_ms": 1000 * profile.queued,
+                        "peak_memory_bytes": profile.peak_memory,
+                        "output_bytes": profile.output_bytes,
+                    },
+                }
+            )
+            if profile.queued > 0:
+                # async events, so that overlapping waits get their own tracks
+                queued = {"name": profile.name, "cat": "queued", "id": index, "pid": 1}
+                events.append({**queued, "ph": "b", "ts": 1e6 * profile.ready})
+                events.append({**queued, "ph": "e", "ts": 1e6 * profile.start})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: Path):
+        """Writes the profiles as a Chrome trace JSON file
+
+        Args:
+            path (Path): Location of the file, eg "trace.json"
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
@@ -0,0 +1,139 @@
+from importlib import resources as impresources
+from .step import Step, CompositeStep
+from .pipeline import Pipeline
+from .packaging import package_lambda, package_dispatcher_lambda
+from .policies import policy_hash
+from .serialization import Serializer
+from typing import Dict, List, Optional
+from pathlib import Path
+from hashlib import sha256
+import tempfile
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def lambda_fingerprint(
+    step: Step,
+    template_file: str,
+    dispatcher_template_file: str,
+    serializer: Optional[Serializer] = None,
+) -> str:
+    """Content hash of the Lambda of a step: its packaged code (including the
+        step's name and arguments), runtime, layers, memory, environment
+        variables, and policies.  Steps with the same fingerprint can share
+        a single Lambda.
+
+    Args:
+        step (Step): The `Step`
+        template_file (str): Location of template file to populate.
+        dispatcher_template_file (str): Location of the dispatcher template file, used for `CompositeStep`s.
+        serializer (Serializer): Optional serialization of the output, if the step does not set its own (eg, the pipeline's).
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_name = str(Path(tmp_dir, "lambda.zip"))
+        if isinstance(step, CompositeStep):
+            _, code_hash = package_dispatcher_lambda(
+                template_file,
+                dispatcher_template_file,
+                [step],
+                "index",
+                zip_name,
+                serializer,
+            )
+        else:
+            _, code_hash = package_lambda(
+                template_file, step, "index", zip_name, serializer
+            )
+    configuration = {
+        "code": code_hash,
+        "runtime": step.python_runtime,
+        "layers": list(step.layers or []),
+        "memory_size": step.memory_size,
+        "env_variables": sorted(step.env_variables.items()),
+        "policies": sorted(policy_hash(policy) for policy in step.additional_policies),
+    }
+    return sha256(json.dumps(configuration, sort_keys=True).encode()).hexdigest()
+
+
+class LambdaRegistry:
+    """Lambdas shared by several pipelines.  Steps (of any pipeline) whose
+    Lambdas have the same fingerprint are deployed once, by a registry stack
+    (`StepInLineRegistryJson` or `step_in_line.tf.StepInLineRegistry`), and
+    the pipeline stacks reference them by function name."""
+
+    def __init__(
+        self,
+        name: str = "step_in_line_shared",
+        template_file: str = impresources.files(__package__) / "template_lambda.py",
+        dispatcher_template_file: str = impresources.files(__package__)
+        / "template_dispatcher.py",
+    ):
+        """Initialize a LambdaRegistry
+
+        Args:
+            name (str): Prefix of the names of the shared Lambdas.  Defaults to "step_in_line_shared".
+            template_file (str): Location of template file to populate.  Defaults to internal template, but a custom file can be provided.
+            dispatcher_template_file (str): Location of the dispatcher template file, used for fused and packed steps.
+        """
+        self.name = name
+        self.template_file = template_file
+        self.dispatcher_template_file = dispatcher_template_file
+        self.steps = {}  # fingerprint -> first Step registered with it
+        self.serializers = {}  # fingerprint -> default serializer of its pipeline
+        self.pipelines = {}  # pipeline name -> {step name: fingerprint}
+
+    def register(self, pipeline: Pipeline) -> Dict[str, str]:
+        """Registers the (compiled) steps of a pipeline.  Returns the name
+            of the shared Lambda of each step, keyed by step name.
+            Registering a pipeline again (eg, after changing it) replaces
+            its steps, and the Lambdas no other pipeline uses are removed.
+
+        Args:
+            pipeline (Pipeline): The pipeline.  Dispatcher mode is not supported, since a dispatcher Lambda is specific to its pipeline.
+        """
+        if pipeline.dispatcher:
+            raise ValueError(
+                f"Pipeline {pipeline.name} is in dispatcher mode, which can not share Lambdas"
+            )
+        fingerprints = {}
+        for step in pipeline.get_compiled_steps():
+            fingerprint = lambda_fingerprint(
+                step,
+                self.template_file,
+                self.dispatcher_template_file,
+                pipeline.serializer,
+            )
+            if fingerprint not in self.steps:
+                self.steps[fingerprint] = step
+                self.serializers[fingerprint] = pipeline.serializer
+            fingerprints[step.name] = fingerprint
+        self.pipelines[pipeline.name] = fingerprints
+        used = set(
+            fingerprint
+            for step_fingerprints in self.pipelines.values()
+            for fingerprint in step_fingerprints.values()
+        )
+        for fingerprint in [f for f in self.steps if f not in used]:
+            del self.steps[fingerprint]
+            del self.serializers[fingerprint]
+        logger.info(
+            f"Registered {len(fingerprints)} steps of pipeline {pipeline.name}, {len(self.steps)} distinct Lambdas in total"
+        )
+        return {
+            step_name: self.function_name(fingerprint)
+            for step_name, fingerprint in fingerprints.items()
+        }
+
+    def lambda_name(self, fingerprint: str) -> str:
+        """Name of the Terraform resources of a shared Lambda"""
+        return f"{self.steps[fingerprint].name}_{fingerprint[:12]}"
+
+    def function_name(self, fingerprint: str) -> str:
+        """Function name of a shared Lambda"""
+        return f"{self.name}_{self.lambda_name(fingerprint)}"
+
+    def shared_steps(self) -> List[Step]:
+        """The step of each distinct Lambda"""
+        return list(self.steps.values())
@@ -0,0 +1,182 @@
+"""History of the run times of steps across local runs.  Durations are keyed
+by step name and a hash of the step's code, so that changing a step's code
+starts its history afresh.  `Pipeline.local_run` records the duration of
+each step it runs, and schedules ready steps by their estimated longest
+remaining path to the end of the pipeline (the "upward rank" of HEFT), so
+the critical path gets a worker first.
+"""
+
+import json
+import os
+import sqlite3
+import statistics
+import time
+from abc import ABC, abstractmethod
+from contextlib import closing
+from typing import Dict, List, Optional, Tuple
+
+import networkx as nx
+
+from .packaging import code_fingerprint
+from .step import Step
+
+
+def step_fingerprint(step: Step) -> str:
+    """Hash of the code of a step, or an empty string if its source is not
+        available (eg, functions defined in an interactive session).
+
+    Args:
+        step (Step): The `Step`
+    """
+    try:
+        return code_fingerprint(step)
+    except (OSError, TypeError):
+        return ""
+
+
+class RuntimeStore(ABC):
+    """Base class of the stores of the run times of steps.  Estimates are
+    the median of the most recent durations of a step."""
+
+    def __init__(self, window: int = 10):
+        """Initialize a RuntimeStore
+
+        Args:
+            window (int): Number of recent durations of a step used to estimate its run time.  Defaults to 10.
+        """
+        self.window = window
+
+    @abstractmethod
+    def durations(self, name: str, fingerprint: str) -> List[float]:
+        """Recorded durations of a step, oldest first, in seconds
+
+        Args:
+            name (str): Name of the step
+            fingerprint (str): Hash of the code of the step
+        """
+
+    @abstractmethod
+    def record(self, durations: Dict[Tuple[str, str], float]):
+        """Records the durations of the steps of a run.
+
+        Args:
+            durations (dict): Durations, in seconds, keyed by step name and code fingerprint
+        """
+
+    def estimate(self, name: str, fingerprint: str) -> Optional[float]:
+        """Estimated run time of a step, in seconds, or None if it was never
+            recorded.
+
+        Args:
+            name (str): Name of the step
+            fingerprint (str): Hash of the code of the step
+        """
+        durations = self.durations(name, fingerprint)[-self.window :]
+        return statistics.median(durations) if durations else None
+
+    def estimates(self, steps: List[Step]) -> Dict[str, float]:
+        """Estimated run times of the steps with a history, keyed by step name
+
+        Args:
+            steps (list): The Steps
+        """
+        estimates = {}
+        for step in steps:
+            estimate = self.estimate(step.name, step_fingerprint(step))
+            if estimate is not None:
+                estimates[step.name] = estimate
+        return estimates
+
+
+class JSONRuntimeStore(RuntimeStore):
+    """Stores run times in a JSON file"""
+
+    def __init__(self, path: str, window: int = 10):
+        """Initialize a JSONRuntimeStore
+
+        Args:
+            path (str): Location of the JSON file
+            window (int): Number of recent durations of a step used to estimate its run time.  Defaults to 10.
+        """
+        super().__init__(window)
+        self.path = path
+
+    def _load(self) -> Dict[str, Dict[str, List[float]]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def durations(self, name: str, fingerprint: str) -> List[float]:
+        return self._load().get(name, {}).get(fingerprint, [])
+
+    def record(self, durations: Dict[Tuple[str, str], float]):
+        history = self._load()
+        for (name, fingerprint), duration in durations.items():
+            recorded = history.setdefault(name, {}).setdefault(fingerprint, [])
+            recorded.append(duration)
+            del recorded[: -self.window]
+        with open(self.path, "w") as f:
+            json.dump(history, f)
+
+
+class SQLiteRuntimeStore(RuntimeStore):
+    """Stores run times in a SQLite database"""
+
+    def __init__(self, path: str, window: int = 10):
+        """Initialize a SQLiteRuntimeStore
+
+        Args:
+            path (str): Location of the database file
+            window (int): Number of recent durations of a step used to estimate its run time.  Defaults to 10.
+        """
+        super().__init__(window)
+        self.path = path
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS runtimes (name TEXT, fingerprint TEXT, duration REAL, recorded REAL)"
+        )
+        return connection
+
+    def durations(self, name: str, fingerprint: str) -> List[float]:
+        with closing(self._connect()) as connection, connection:
+            rows = connection.execute(
+                "SELECT duration FROM runtimes WHERE name = ? AND fingerprint = ? ORDER BY recorded DESC, rowid DESC LIMIT ?",
+                (name, fingerprint, self.window),
+            ).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def record(self, durations: Dict[Tuple[str, str], float]):
+        recorded = time.time()
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "INSERT INTO runtimes VALUES (?, ?, ?, ?)",
+                [
+                    (name, fingerprint, duration, recorded)
+                    for (name, fingerprint), duration in durations.items()
+                ],
+            )
+
+
+def upward_ranks(
+    graph: nx.DiGraph, durations: Dict[str, float], default: Optional[float] = None
+) -> Dict[str, float]:
+    """Longest path, in estimated run time, from the start of each step to
+        the end of the pipeline (the step's own duration included).  Ready
+        steps with a higher rank are on a longer path, so should start first.
+
+    Args:
+        graph (DiGraph): The graph of Steps
+        durations (dict): Estimated run times of steps, in seconds, keyed by step name
+        default (float): Run time of the steps with no estimate.  Defaults to the mean of the estimates, or 1 second if there are none.
+    """
+    if default is None:
+        known = [durations[step.name] for step in graph if step.name in durations]
+        default = statistics.mean(known) if known else 1.0
+    ranks = {}
+    for step in reversed(list(nx.topological_sort(graph))):
+        downstream = max((ranks[s.name] for s in graph.successors(step)), default=0.0)
+        ranks[step.name] = durations.get(step.name, default) + downstream
+    return ranks
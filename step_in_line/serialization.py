@@ -0,0 +1,174 @@
+"""Serialization of the outputs of steps.  Outputs are passed between Lambdas
+as JSON by Step Functions, within its payload size limit.  A `Serializer`
+encodes an output as JSON (optionally compressed), msgpack, or Arrow IPC
+(for tables), and wraps binary data in base64.  Encoded outputs are decoded
+transparently by the Lambdas of downstream steps.
+
+This module is packaged with each Lambda, so it only depends on the standard
+library.  msgpack, pyarrow, and zstandard are imported when used, and must
+be available to the Lambda (eg, in a layer) to use them.
+"""
+
+import base64
+import gzip
+import io
+import json
+from typing import Any, Optional
+
+# Key of an encoded output, eg {ENCODED_KEY: {"format": "msgpack", "compression": "zstd", "data": "<base64>"}}
+ENCODED_KEY = "__step_in_line_encoded__"
+
+FORMATS = ("json", "msgpack", "arrow")
+COMPRESSIONS = ("gzip", "zstd")
+
+
+def _dumps(value: Any, format: str) -> bytes:
+    if format == "json":
+        return json.dumps(value).encode()
+    if format == "msgpack":
+        import msgpack
+
+        return msgpack.packb(value, use_bin_type=True)
+    import pyarrow as pa
+
+    if not isinstance(value, pa.Table):
+        value = pa.Table.from_pandas(value)  # eg, a pandas DataFrame
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, value.schema) as writer:
+        writer.write_table(value)
+    return sink.getvalue()
+
+
+def _loads(data: bytes, format: str) -> Any:
+    if format == "json":
+        return json.loads(data)
+    if format == "msgpack":
+        import msgpack
+
+        return msgpack.unpackb(data, raw=False)
+    import pyarrow as pa
+
+    return pa.ipc.open_stream(data).read_all()
+
+
+def _compress(data: bytes, compression: str, level: Optional[int]) -> bytes:
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6 if level is None else level)
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+
+
+def _decompress(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return gzip.decompress(data)
+    import zstandard
+
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def encode_value(value: Any, options: Optional[dict] = None) -> Any:
+    """Encodes an output.  JSON outputs are left as is, unless compressed;
+        other formats are always encoded.  Compression is only applied to
+        encoded outputs of at least `threshold` bytes.
+
+    Args:
+        value: The output of a step
+        options (dict): Options of a `Serializer`.  Defaults to no encoding.
+    """
+    if not options:
+        return value
+    format = options.get("format", "json")
+    compression = options.get("compression")
+    if format == "json" and compression is None:
+        return value
+    data = _dumps(value, format)
+    if compression is not None and len(data) >= options.get("threshold", 0):
+        data = _compress(data, compression, options.get("level"))
+    else:
+        if format == "json":
+            return value  # small enough to pass as is
+        compression = None
+    return {
+        ENCODED_KEY: {
+            "format": format,
+            "compression": compression,
+            "data": base64.b64encode(data).decode("ascii"),
+        }
+    }
+
+
+def decode_value(value: Any) -> Any:
+    """Decodes an output encoded by `encode_value`.  Other values are
+        returned as is.
+
+    Args:
+        value: The (possibly encoded) output of a step
+    """
+    if not isinstance(value, dict) or ENCODED_KEY not in value:
+        return value
+    encoded = value[ENCODED_KEY]
+    data = base64.b64decode(encoded["data"])
+    if encoded["compression"] is not None:
+        data = _decompress(data, encoded["compression"])
+    return _loads(data, encoded["format"])
+
+
+class Serializer:
+    """Serialization of the output of a step"""
+
+    def __init__(
+        self,
+        format: str = "json",
+        compression: Optional[str] = None,
+        threshold: int = 0,
+        level: Optional[int] = None,
+    ):
+        """Initialize a Serializer
+
+        Args:
+            format (str): "json", "msgpack", or "arrow" (for pyarrow Tables or pandas DataFrames, decoded as pyarrow Tables).  Defaults to "json".
+            compression (str): Optional "gzip" or "zstd" compression.
+            threshold (int): Minimum size, in bytes, of an encoded output to compress.  Defaults to 0 (always compress).
+            level (int): Optional compression level.
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format {format}: must be one of {FORMATS}")
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unknown compression {compression}: must be one of {COMPRESSIONS}"
+            )
+        self.format = format
+        self.compression = compression
+        self.threshold = threshold
+        self.level = level
+
+    def options(self) -> dict:
+        """Options of the serializer, as passed to the Lambda"""
+        return {
+            "format": self.format,
+            "compression": self.compression,
+            "threshold": self.threshold,
+            "level": self.level,
+        }
+
+    def is_json_native(self) -> bool:
+        """Whether outputs are passed as plain JSON, so that states can
+        select fields of them with JSONPath."""
+        return self.format == "json" and self.compression is None
+
+    def encode(self, value: Any) -> Any:
+        """Encodes an output
+
+        Args:
+            value: The output of a step
+        """
+        return encode_value(value, self.options())
+
+    def decode(self, value: Any) -> Any:
+        """Decodes an output
+
+        Args:
+            value: The (possibly encoded) output of a step
+        """
+        return decode_value(value)
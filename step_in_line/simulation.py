@@ -0,0 +1,283 @@
+"""Monte Carlo simulation of the makespan and cost of a pipeline.
+
+The durations of the steps vary from run to run, so the effect of a change to
+the structure of a pipeline (eg, fusing, packing, or moving a slow step) on
+its wall-clock time is a distribution rather than a number.  `simulate`
+samples many executions at once with NumPy: the duration of each step is
+drawn from its observed durations (from profiled or historical runs) or, for
+steps with only a `duration` hint, from a lognormal distribution around it,
+plus a cold start with some probability.  Each sample is then scheduled two
+ways:
+
+- as generated, in layers: each layer is a Parallel state, which waits for
+  its slowest step before the next layer starts;
+- as a pure DAG: each step starts as soon as its own dependencies finish.
+
+The difference is the cost of the barriers between layers.  numpy is an
+optional dependency (`pip install step-in-line[simulation]`).
+"""
+
+import logging
+from typing import Dict, List, Optional, Sequence, Union
+
+import networkx as nx
+import numpy as np
+
+from .analysis import LAMBDA_GB_SECOND_PRICE, LAMBDA_REQUEST_PRICE
+from .pipeline import Pipeline
+from .profiling import Profiler
+from .step import Step, CompositeStep, FusedStep
+
+logger = logging.getLogger(__name__)
+
+COLD_START_SECONDS = 0.25
+
+
+def samples_from_profilers(profilers: Sequence[Profiler]) -> Dict[str, List[float]]:
+    """Observed durations of the steps, in seconds, over several profiled runs
+
+    Args:
+        profilers (list): The `Profiler` of each run
+    """
+    samples = {}
+    for profiler in profilers:
+        for name, profile in profiler.profiles.items():
+            samples.setdefault(name, []).append(profile.wall)
+    return samples
+
+
+class SimulationReport:
+    """Results of `simulate`.  Makespans and times are in seconds."""
+
+    def __init__(
+        self,
+        layer_makespan: np.ndarray,
+        dag_makespan: np.ndarray,
+        layer_idle: np.ndarray,
+        layer_names: List[List[str]],
+        gb_seconds: np.ndarray,
+        invocations: int,
+        missing: List[str],
+    ):
+        """Initialize a SimulationReport
+
+        Args:
+            layer_makespan (ndarray): Makespan of each sample, with barriers between layers
+            dag_makespan (ndarray): Makespan of each sample, as a pure DAG
+            layer_idle (ndarray): Mean time the steps of each layer wait for the slowest step of the layer, summed over the steps
+            layer_names (list): Names of the steps of each layer
+            gb_seconds (ndarray): Lambda GB-seconds of each sample
+            invocations (int): Number of Lambda invocations per execution
+            missing (list): Names of the steps with no samples nor duration hint (counted as instantaneous)
+        """
+        self.layer_makespan = layer_makespan
+        self.dag_makespan = dag_makespan
+        self.layer_idle = layer_idle
+        self.layer_names = layer_names
+        self.gb_seconds = gb_seconds
+        self.invocations = invocations
+        self.missing = missing
+
+    @property
+    def samples(self) -> int:
+        return len(self.layer_makespan)
+
+    def makespan(self, layout: str = "layers") -> Dict[str, float]:
+        """Mean, median and 95th percentile of the makespan
+
+        Args:
+            layout (str): "layers" (as generated) or "dag"
+        """
+        if layout not in ("layers", "dag"):
+            raise ValueError(f"Unknown layout {layout}: must be layers or dag")
+        makespan = self.layer_makespan if layout == "layers" else self.dag_makespan
+        p50, p95 = np.percentile(makespan, [50, 95])
+        return {"mean": float(makespan.mean()), "p50": float(p50), "p95": float(p95)}
+
+    def barrier_overhead(self) -> float:
+        """Mean extra makespan of the barriers between layers"""
+        return float((self.layer_makespan - self.dag_makespan).mean())
+
+    def cost(self) -> Dict[str, float]:
+        """Mean Lambda GB-seconds and cost, in USD, of an execution.  Lambdas
+        do not wait at the barriers, so both layouts cost the same."""
+        gb_seconds = float(self.gb_seconds.mean())
+        return {
+            "gb_seconds": gb_seconds,
+            "lambda": self.invocations * LAMBDA_REQUEST_PRICE
+            + gb_seconds * LAMBDA_GB_SECOND_PRICE,
+        }
+
+    def summary(self) -> str:
+        lines = [f"{self.samples:,} simulated executions"]
+        for layout in ("layers", "dag"):
+            makespan = self.makespan(layout)
+            lines.append(
+                f"{layout} makespan: p50 {makespan['p50']:.3f}s, p95 {makespan['p95']:.3f}s, mean {makespan['mean']:.3f}s"
+            )
+        lines.append(f"barrier overhead: {self.barrier_overhead():.3f}s")
+        cost = self.cost()
+        lines.append(
+            f"Lambda: {cost['gb_seconds']:.3f} GB-seconds, ${cost['lambda']:.6f} per execution"
+        )
+        for index in np.argsort(-self.layer_idle)[:5]:
+            if self.layer_idle[index] > 0:
+                names = self.layer_names[index]
+                listed = ", ".join(names[:5]) + (", ..." if len(names) > 5 else "")
+                lines.append(
+                    f"layer {index} idles {self.layer_idle[index]:.3f}s at its barrier ({listed})"
+                )
+        if self.missing:
+            lines.append(f"no duration: {', '.join(self.missing)}")
+        return "\n".join(lines)
+
+
+class _Sampler:
+    """Draws the durations of the steps, one column per step"""
+
+    def __init__(
+        self,
+        samples: Dict[str, Sequence[float]],
+        durations: Dict[str, float],
+        sigma: float,
+        cold_start_probability: Union[float, Dict[str, float]],
+        cold_start_seconds: float,
+        rng: np.random.Generator,
+    ):
+        self.samples = {
+            name: np.asarray(values, dtype=float)
+            for name, values in samples.items()
+            if len(values)
+        }
+        self.durations = durations
+        self.sigma = sigma
+        self.cold_start_probability = cold_start_probability
+        self.cold_start_seconds = cold_start_seconds
+        self.rng = rng
+        self.missing = []
+
+    def _cold_start(self, name: str) -> float:
+        if isinstance(self.cold_start_probability, dict):
+            return self.cold_start_probability.get(name, 0.0)
+        return self.cold_start_probability
+
+    def _draw(self, step: Step, count: int) -> np.ndarray:
+        """Durations of a step, without cold starts"""
+        if isinstance(step, CompositeStep):
+            inner = [self._draw(s, count) for s in step.steps]
+            if isinstance(step, FusedStep):
+                return np.sum(inner, axis=0)
+            return np.max(inner, axis=0)
+        if step.name in self.samples:
+            return self.rng.choice(self.samples[step.name], size=count)
+        duration = self.durations.get(step.name, step.duration)
+        if duration is None:
+            if step.name not in self.missing:
+                self.missing.append(step.name)
+            return np.zeros(count)
+        # lognormal with the hint as its median
+        normal = self.rng.standard_normal(count, dtype=np.float32)
+        return duration * np.exp(self.sigma * normal, out=normal)
+
+    def draw(self, steps: List[Step], count: int) -> np.ndarray:
+        """Durations of the invocations of the steps, with cold starts: an
+        array of shape (len(steps), count), so each step's row is contiguous"""
+        durations = np.empty((len(steps), count), dtype=np.float32)
+        for row, step in enumerate(steps):
+            durations[row] = self._draw(step, count)
+        probabilities = np.array([self._cold_start(step.name) for step in steps])
+        if probabilities.any():
+            cold = self.rng.random((len(steps), count), dtype=np.float32)
+            cold = cold < probabilities[:, None]
+            durations += cold * self.cold_start_seconds
+        return durations
+
+
+def simulate(
+    pipeline: Pipeline,
+    samples: Optional[Dict[str, Sequence[float]]] = None,
+    executions: int = 10000,
+    sigma: float = 0.25,
+    cold_start_probability: Union[float, Dict[str, float]] = 0.0,
+    cold_start_seconds: float = COLD_START_SECONDS,
+    seed: Optional[int] = None,
+    chunk_size: int = 10000,
+) -> SimulationReport:
+    """Samples executions of the deployed (compiled) steps of a pipeline, and
+        compares their makespan as generated, in layers, and as a pure DAG.
+        Conditional steps are assumed to run, and a Map step is one
+        invocation, whose samples are the duration of the whole Map.
+
+    Args:
+        pipeline (Pipeline): The pipeline to simulate
+        samples (dict): Observed durations of the steps, in seconds, keyed by step name (see `samples_from_profilers`).  Resampled with replacement.
+        executions (int): Number of executions to sample.  Defaults to 10,000.
+        sigma (float): Spread (of the log) of the durations of steps with only a duration hint or profiled timing in the pipeline.  Defaults to 0.25.
+        cold_start_probability (float or dict): Probability of an invocation starting cold, or probabilities keyed by step name.  Defaults to 0.
+        cold_start_seconds (float): Duration of a cold start, in seconds.  Defaults to 0.25.
+        seed (int): Optional seed of the random number generator
+        chunk_size (int): Number of executions sampled at once, to bound memory.  Defaults to 10,000.
+    """
+    graph = pipeline.compile_graph()
+    layers = [list(layer) for layer in nx.topological_generations(graph)]
+    steps = [step for layer in layers for step in layer]
+    row = {step: index for index, step in enumerate(steps)}
+    # the steps of a layer are consecutive rows
+    bounds = np.cumsum([0] + [len(layer) for layer in layers])
+    predecessors = [
+        np.array([row[p] for p in graph.predecessors(step)], dtype=int)
+        for step in steps
+    ]
+    memory = np.array([step.memory_size / 1024 for step in steps])
+    sampler = _Sampler(
+        samples if samples else {},
+        pipeline.durations,
+        sigma,
+        cold_start_probability,
+        cold_start_seconds,
+        np.random.default_rng(seed),
+    )
+
+    layer_makespan = np.empty(executions)
+    dag_makespan = np.empty(executions)
+    gb_seconds = np.empty(executions)
+    layer_idle = np.zeros(len(layers))
+    for start in range(0, executions, chunk_size):
+        count = min(chunk_size, executions - start)
+        chunk = slice(start, start + count)
+        durations = sampler.draw(steps, count)
+
+        makespan = np.zeros(count)
+        for index in range(len(layers)):
+            layer = durations[bounds[index] : bounds[index + 1]]
+            slowest = layer.max(axis=0)
+            makespan += slowest
+            layer_idle[index] += len(layer) * slowest.sum() - layer.sum()
+        layer_makespan[chunk] = makespan
+
+        # steps are in topological order, so their predecessors finish first
+        finish = np.empty_like(durations)
+        for index, previous in enumerate(predecessors):
+            if len(previous):
+                np.add(
+                    finish[previous].max(axis=0), durations[index], out=finish[index]
+                )
+            else:
+                finish[index] = durations[index]
+        dag_makespan[chunk] = finish.max(axis=0) if steps else 0.0
+
+        gb_seconds[chunk] = memory @ durations
+
+    if sampler.missing:
+        logger.warning(
+            f"No samples or duration for steps {sampler.missing}: counted as instantaneous"
+        )
+    return SimulationReport(
+        layer_makespan,
+        dag_makespan,
+        layer_idle / max(executions, 1),
+        [[step.name for step in layer] for layer in layers],
+        gb_seconds,
+        len(steps),
+        sampler.missing,
+    )
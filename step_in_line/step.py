@@ -1,5 +1,8 @@
-from typing import List, Optional, Callable, Any, Dict
+from typing import List, Optional, Callable, Any, Dict, Tuple, Union
 from functools import wraps
+import inspect
+from .serialization import Serializer
+from .memoization import ResultStore
 
 
 class Step:
@@ -18,6 +21,11 @@ class Step:
         layers: List[str] = [],
         env_variables: Dict[str, str] = {},  # to pass in to lambda
         depends_on: Optional[List["Step"]] = None,
+        fuse: bool = True,
+        duration: Optional[float] = None,
+        serializer: Optional[Serializer] = None,
+        cache: Optional[ResultStore] = None,
+        cpus: Optional[float] = None,
     ):
         """Initialize a Step
 
@@ -33,6 +41,11 @@ class Step:
             layers (list): the ARNs of layers to add to the lambda function
             env_variables (dict): environment variables to pass to lambda function
             depends_on (List[Step]): The list of Steps that the current `Step` depends on.
+            fuse (bool): Whether the `Step` can be fused with its neighbours into a single Lambda invocation.  Defaults to True.
+            duration (float): Optional hint of the typical run time of the `Step`, in seconds.  Used to pack small steps together.
+            serializer (Serializer): Optional serialization of the output of the `Step` (eg, compressed msgpack).  Defaults to plain JSON.
+            cache (ResultStore): Optional store of the results of the `Step`, keyed by a hash of its code and arguments.  The function only runs if the result is not found.  The policies needed to access the store are added to the Lambda.
+            cpus (float): Optional number of CPUs the `Step` keeps busy, weighed against the CPU budget of local runs.  Defaults to 1.
         """
         self.name = name
         self.description = description
@@ -43,9 +56,17 @@ class Step:
         self.memory_size = memory_size
         self.python_runtime = python_runtime
         self.env_variables = env_variables
+        self.fuse = fuse
+        self.duration = duration
+        self.serializer = serializer
+        self.cache = cache
+        self.cpus = cpus
+        self.conditions = []  # predicate steps, see `when`
         self.additional_policies = (
             policies  # by default, Lambda gets minimal permission
         )
+        if cache is not None:
+            self.additional_policies = policies + cache.policies()
         if depends_on is not None:
             self._depends_on = depends_on
         else:
@@ -79,6 +100,195 @@ class Step:
 
         self._depends_on.extend(step_names)
 
+    def compatibility_key(self) -> Tuple:
+        """Key describing the Lambda configuration of the `Step`.  Steps
+        with the same key can share a single Lambda."""
+
+        return (
+            self.python_runtime,
+            tuple(self.layers or []),
+            self.memory_size,
+            tuple(sorted(self.env_variables.items())),
+        )
+
+    def __getitem__(self, key: Union[str, int]) -> "StepSelector":
+        """Selects a field of the output of the `Step`, eg `step_result["rows"]`."""
+
+        return StepSelector(self, [key])
+
+    __iter__ = None  # indexing selects a field, so Steps are not iterable
+
+
+# Key marking a selector in the pickled arguments of a Lambda (see
+# template_lambda.resolve_args)
+SELECTOR_KEY = "__step_in_line_selector__"
+
+
+class StepSelector:
+    """A field (or nested field) of the output of a `Step`.  When passed as
+    an argument to another step, only the selected field is passed to the
+    function."""
+
+    def __init__(self, step: Step, keys: List[Union[str, int]]):
+        """Initialize a StepSelector
+
+        Args:
+            step (Step): The `Step` whose output is selected from.
+            keys (list): Keys (for dicts) and indices (for lists) to select, in order.
+        """
+        self.step = step
+        self.keys = keys
+
+    def __getitem__(self, key: Union[str, int]) -> "StepSelector":
+        return StepSelector(self.step, self.keys + [key])
+
+    __iter__ = None
+
+    def select(self, output: Any) -> Any:
+        """Selects the field from the output of the `Step`.
+
+        Args:
+            output: The output of the `Step`
+        """
+        for key in self.keys:
+            output = output[key]
+        return output
+
+    def to_jsonpath(self) -> str:
+        """JSONPath of the field, relative to the output of the `Step`"""
+
+        return "".join(
+            f"[{key}]" if isinstance(key, int) else f".{key}" for key in self.keys
+        )
+
+    def to_arg(self) -> Dict[str, List[Union[str, int]]]:
+        """Plain representation of the selector, for the pickled arguments
+        of a Lambda."""
+
+        return {SELECTOR_KEY: [self.step.name, *self.keys]}
+
+
+def when(predicate: Step, then: List[Step]) -> List[Step]:
+    """Makes Steps conditional on the output of a predicate `Step`, which must
+    return a bool.  The Steps (and every Step depending on them) only run
+    if the predicate returned True; otherwise they are skipped, compiling
+    to a Choice state in the state machine.
+
+    Args:
+        predicate (Step): The `Step` deciding whether the Steps run
+        then (List[Step]): The conditional Steps
+
+    Returns:
+        List[Step]: The conditional Steps
+    """
+    for conditional_step in then:
+        if conditional_step is predicate:
+            raise ValueError(f"Step {predicate.name} can not be conditional on itself")
+        conditional_step.conditions.append(predicate)
+        if predicate not in (conditional_step.depends_on or []):
+            conditional_step.add_depends_on([predicate])
+    return list(then)
+
+
+class CompositeStep(Step):
+    """Base class for `Step`s which run several `Step`s within a single Lambda invocation"""
+
+    def __init__(self, name: str, steps: List[Step], duration: Optional[float]):
+        """Initialize a CompositeStep.  The steps must share a compatibility key.
+
+        Args:
+            name (str): The name of the `CompositeStep`.
+            steps (List[Step]): The `Step`s run by the `CompositeStep`.
+            duration (float): Estimated run time of the `CompositeStep`, in seconds.
+        """
+        first = steps[0]
+        super().__init__(
+            name=name,
+            func=None,  # each step keeps its own function
+            args=[],
+            python_runtime=first.python_runtime,
+            memory_size=first.memory_size,
+            description=", ".join(step.name for step in steps),
+            retry_count=max(step.retry_count for step in steps),
+            policies=list(
+                dict.fromkeys(
+                    policy for step in steps for policy in step.additional_policies
+                )
+            ),
+            layers=first.layers,
+            env_variables=first.env_variables,
+            duration=duration,
+        )
+        self.steps = steps
+
+
+class FusedStep(CompositeStep):
+    """`Step` which runs a linear chain of `Step`s in sequence, within a single Lambda invocation"""
+
+    def __init__(self, steps: List[Step]):
+        """Initialize a FusedStep.  The fused steps must share a compatibility key.
+
+        Args:
+            steps (List[Step]): The chain of `Step`s, in the order they are executed.
+        """
+        durations = [step.duration for step in steps]
+        super().__init__(
+            f"{steps[0].name}_to_{steps[-1].name}",
+            steps,
+            None if None in durations else sum(durations),
+        )
+
+
+class PackedStep(CompositeStep):
+    """`Step` which runs independent sibling `Step`s concurrently, in a thread pool within a single Lambda invocation"""
+
+    def __init__(self, steps: List[Step]):
+        """Initialize a PackedStep.  The packed steps must share a compatibility key
+        and must not depend on each other.
+
+        Args:
+            steps (List[Step]): The independent `Step`s to run.
+        """
+        durations = [step.duration for step in steps]
+        super().__init__(
+            f"packed_{steps[0].name}",
+            steps,
+            None if None in durations else max(durations),
+        )
+
+
+class MapStep(Step):
+    """`Step` which runs its function once per item of one of its arguments,
+    as an ASL Map state.  The outputs are gathered into a list."""
+
+    def __init__(
+        self,
+        map_index: int,
+        max_concurrency: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        distributed: bool = False,
+        **kwargs,
+    ):
+        """Initialize a MapStep.  Map steps are never fused or packed with
+        other steps.
+
+        Args:
+            map_index (int): Index, in args, of the argument to map over.  Either a list or a `Step` returning a list.
+            max_concurrency (int): Maximum number of concurrent iterations.  Defaults to no limit.
+            batch_size (int): Number of items processed per Lambda invocation.  Defaults to one item per invocation.
+            distributed (bool): If True, compiles to a distributed Map state, which runs each iteration as a child workflow execution and supports far more items.  Defaults to False (inline Map state).
+        """
+        super().__init__(**{**kwargs, "fuse": False})
+        self.map_index = map_index
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.distributed = distributed
+
+    @property
+    def items(self) -> Any:
+        """The argument mapped over"""
+        return self.args[self.map_index]
+
 
 def step(
     _func=None,
@@ -90,7 +300,16 @@ def step(
     memory_size: int = 512,
     policies: List[str] = [],
     retry_count: int = 0,
-    env_variables: Dict[str, str] = {}
+    env_variables: Dict[str, str] = {},
+    fuse: bool = True,
+    duration: Optional[float] = None,
+    serializer: Optional[Serializer] = None,
+    cache: Optional[ResultStore] = None,
+    map_over: Optional[str] = None,
+    max_concurrency: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    distributed: bool = False,
+    cpus: Optional[float] = None,
 ):
     """Decorator for converting a python function to a pipeline step.
 
@@ -107,6 +326,15 @@ def step(
         policies (List[str]): IAM policies, in JSON, to provide to the Lambda
         retry_count (int): number of retries to attempt.  Defaults to 0 (no retries).
         env_variables (dict): environment variables to pass to lambda function
+        fuse (bool): whether the step can be fused with its neighbours into a single Lambda invocation.  Set to False to keep the step separate, eg to keep its own retries.  Defaults to True.
+        duration (float): optional hint of the typical run time of the step, in seconds.  Used to pack small steps together.
+        serializer (Serializer): optional serialization of the step's output (eg, `Serializer("msgpack", compression="zstd")`).  Not supported by map steps.  Defaults to plain JSON.
+        cache (ResultStore): optional store of the step's results (eg, `S3Store("bucket", ttl=86400)`), keyed by a hash of its code and arguments.  The function only runs if the result is not found.  Not supported by map steps.
+        map_over (str): optional name of an argument holding a list (or a step returning a list).  The function is then run once per item, as a Map state, and the step's output is the list of results.
+        max_concurrency (int): maximum number of concurrent iterations of a map step.  Defaults to no limit.
+        batch_size (int): number of items processed per Lambda invocation of a map step.  Defaults to one item per invocation.
+        distributed (bool): whether a map step runs as a distributed Map state, for large numbers of items.  Defaults to False.
+        cpus (float): optional number of CPUs the step keeps busy, weighed with its memory_size against the budget of parallel local runs.  Defaults to 1.
 
     """
 
@@ -118,6 +346,8 @@ def step(
             for arg in list(args) + list(kwargs.values()):
                 if isinstance(arg, Step):
                     depends_on[id(arg)] = arg
+                elif isinstance(arg, StepSelector):
+                    depends_on[id(arg.step)] = arg.step
                 arg_list.append(arg)
 
             # setup default values for name, display_name and description if not provided
@@ -129,7 +359,7 @@ def step(
                 _description = (
                     func.__doc__ if func.__doc__ else func.__code__.co_filename
                 )
-            return Step(
+            step_kwargs = dict(
                 name=_name,
                 depends_on=list(depends_on.values()),
                 retry_count=retry_count,
@@ -140,6 +370,31 @@ def step(
                 func=func,
                 args=arg_list,
                 env_variables=env_variables,
+                fuse=fuse,
+                duration=duration,
+                cpus=cpus,
+            )
+            if map_over is None:
+                return Step(serializer=serializer, cache=cache, **step_kwargs)
+            if serializer is not None or cache is not None:
+                raise ValueError(
+                    f"Map step {_name} does not support a serializer or a cache"
+                )
+            if map_over in kwargs:
+                map_index = len(args) + list(kwargs).index(map_over)
+            else:
+                parameters = list(inspect.signature(func).parameters)
+                if map_over not in parameters:
+                    raise ValueError(f"{_name} has no argument {map_over} to map over")
+                map_index = parameters.index(map_over)
+                if map_index >= len(args):
+                    raise ValueError(f"Argument {map_over} of {_name} is not given")
+            return MapStep(
+                map_index=map_index,
+                max_concurrency=max_concurrency,
+                batch_size=batch_size,
+                distributed=distributed,
+                **step_kwargs,
             )
 
         return wrapper
@@ -37,6 +37,10 @@ class Field(Enum):
     Iterator = "iterator"
     ItemsPath = "items_path"
     MaxConcurrency = "max_concurrency"
+    ItemSelector = "item_selector"
+    ItemBatcher = "item_batcher"
+    ItemProcessor = "item_processor"
+    ResultSelector = "result_selector"
 
     # Task state fields
     Resource = "resource"
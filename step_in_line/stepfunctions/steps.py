@@ -202,14 +202,20 @@ class State(Block):
         return self.step_output
 
     def accept(self, visitor):
-        if visitor.is_visited(self):
-            return
-
-        visitor.visit(self)
-        if self.next_step is not None:
-            self.next_step.accept(visitor)
-        for catch in self.catches:
-            catch.next_step.accept(visitor)
+        # follows next_step iteratively, so that long chains of states do
+        # not hit the recursion limit; visits in the same order as recursing
+        visited = []
+        state = self
+        while state is not None and not visitor.is_visited(state):
+            if state is not self and type(state).accept is not State.accept:
+                state.accept(visitor)  # eg, a Choice, which visits its choices
+                break
+            visitor.visit(state)
+            visited.append(state)
+            state = state.next_step
+        for state in reversed(visited):
+            for catch in state.catches:
+                catch.next_step.accept(visitor)
 
     def add_retry(self, retry):
         """
@@ -323,9 +329,170 @@ class Task(State):
             Field.Resource,
             Field.Retry,
             Field.Catch,
+            Field.ResultSelector,
+        ]
+
+
+class Pass(State):
+    """
+    Pass State simply passes its input to its output, performing no work. Pass States are useful when constructing and debugging state machines.
+    """
+
+    def __init__(self, state_id, **kwargs):
+        """
+        Args:
+            state_id (str): State name whose length **must be** less than or equal to 128 unicode characters. State names **must be** unique within the scope of the whole state machine.
+            comment (str, optional): Human-readable comment or description. (default: None)
+            input_path (str, optional): Path applied to the state's raw input to select some or all of it; that selection is used by the state. (default: '$')
+            parameters (dict, optional): The value of this field becomes the effective input for the state.
+            result_path (str, optional): Path specifying the raw input's combination with or replacement by the state's result. (default: '$')
+            result (str, optional): If present, its value is treated as the output of a virtual task, and placed as prescribed by the `result_path` field, if any, to be passed on to the next state. If `result` is not provided, the output is the input.
+            output_path (str, optional): Path applied to the state's output after the application of 'result_path', producing the effective output which serves as the raw input for the next state. (default: '$')
+        """
+        super(Pass, self).__init__(state_id, "Pass", **kwargs)
+
+    def allowed_fields(self):
+        return [
+            Field.Comment,
+            Field.InputPath,
+            Field.OutputPath,
+            Field.Parameters,
+            Field.ResultPath,
+            Field.Result,
         ]
 
 
+class Choice(State):
+    """
+    Choice state adds branching logic to a state machine.
+    """
+
+    def __init__(self, state_id, **kwargs):
+        """
+        Args:
+            state_id (str): State name whose length **must be** less than or equal to 128 unicode characters. State names **must be** unique within the scope of the whole state machine.
+            comment (str, optional): Human-readable comment or description. (default: None)
+            input_path (str, optional): Path applied to the state's raw input to select some or all of it; that selection is used by the state. (default: '$')
+            output_path (str, optional): Path applied to the state's output after the application of 'result_path', producing the effective output which serves as the raw input for the next state. (default: '$')
+        """
+        super(Choice, self).__init__(state_id, "Choice", **kwargs)
+        self.choices = []
+        self.default = None
+
+    def allowed_fields(self):
+        return [Field.Comment, Field.InputPath, Field.OutputPath]
+
+    def add_choice(self, rule, next_step):
+        """
+        Add a *rule*, *next_step* pair to the choice state.
+
+        Args:
+            rule (dict): Choice rule, in Amazon States Language (eg, `{"Variable": "$.done", "BooleanEquals": True}`), without its `Next` field.
+            next_step (State or Chain): Next state or chain to transition to, if the rule matches.
+        """
+        self.choices.append([rule, next_step])
+
+    def default_choice(self, next_step):
+        """
+        Add a default step to the choice state, which runs if none of the rules match.
+
+        Args:
+            next_step (State or Chain): Next state or chain to transition to, if none of the rules match.
+        """
+        self.default = next_step
+
+    def to_dict(self):
+        result = super(Choice, self).to_dict()
+        result[Field.Choices.name] = [
+            {**rule, Field.Next.name: next_step.state_id}
+            for rule, next_step in self.choices
+        ]
+        if self.default is not None:
+            result[Field.Default.name] = self.default.state_id
+        return result
+
+    def accept(self, visitor):
+        if visitor.is_visited(self):
+            return
+
+        visitor.visit(self)
+        for _, next_step in self.choices:
+            next_step.accept(visitor)
+        if self.default is not None:
+            self.default.accept(visitor)
+
+
+class Map(State):
+    """
+    Map state provides the ability to dynamically iterate over a state/subgraph for each entry in a list.
+
+    A Map state can accept an input with a list of items, execute a state or chain for each item in the list, and return a list, with all corresponding results of each execution, as its output.
+    """
+
+    def __init__(self, state_id, retry=None, catch=None, **kwargs):
+        """
+        Args:
+            state_id (str): State name whose length **must be** less than or equal to 128 unicode characters. State names **must be** unique within the scope of the whole state machine.
+            retry (Retry or list(Retry), optional): A retrier or list of retriers that define the state's retry policy. See `Error handling in Step Functions <https://docs.aws.amazon.com/step-functions/latest/dg/concepts-error-handling.html#error-handling-retrying-after-an-error>`__ for more details.
+            catch (Catch or list(Catch), optional): A catcher or list of catchers that define a fallback state. See `Error handling in Step Functions <https://docs.aws.amazon.com/step-functions/latest/dg/concepts-error-handling.html#error-handling-fallback-states>`__ for more details.
+            items_path (str, optional): Path in the input for items to iterate over. (default: '$')
+            max_concurrency (int, optional): Maximum number of iterations to have running at any given point in time. (default: 0)
+            item_selector (dict, optional): Builds the input of each iteration from the item (`$$.Map.Item.Value`) and the state's input.
+            item_batcher (dict, optional): Groups items into batches (eg, `{"MaxItemsPerBatch": 10}`).  Only supported in distributed mode.
+            result_selector (dict, optional): Builds the state's result from the list of results of the iterations.
+            comment (str, optional): Human-readable comment or description. (default: None)
+            input_path (str, optional): Path applied to the state's raw input to select some or all of it; that selection is used by the state. (default: '$')
+            result_path (str, optional): Path specifying the raw input's combination with or replacement by the state's result. (default: '$')
+            output_path (str, optional): Path applied to the state's output after the application of 'result_path', producing the effective output which serves as the raw input for the next state. (default: '$')
+        """
+        super(Map, self).__init__(state_id, "Map", **kwargs)
+        self.processor = None
+        self.processor_config = {"Mode": "INLINE"}
+
+        if retry:
+            self.add_retry(retry)
+
+        if catch:
+            self.add_catch(catch)
+
+    def attach_processor(self, processor, mode="INLINE", execution_type=None):
+        """
+        Attach `State` or `Chain` as the processor of each item of the Map state.
+
+        Args:
+            processor (State or Chain): State or Chain to run for each item.
+            mode (str, optional): "INLINE", or "DISTRIBUTED" to run each iteration as a child workflow execution. (default: "INLINE")
+            execution_type (str, optional): "STANDARD" or "EXPRESS".  Required in distributed mode.
+        """
+        self.processor = processor
+        self.processor_config = {"Mode": mode}
+        if execution_type is not None:
+            self.processor_config["ExecutionType"] = execution_type
+
+    def allowed_fields(self):
+        return [
+            Field.Comment,
+            Field.InputPath,
+            Field.OutputPath,
+            Field.ResultPath,
+            Field.Retry,
+            Field.Catch,
+            Field.ItemsPath,
+            Field.MaxConcurrency,
+            Field.ItemSelector,
+            Field.ItemBatcher,
+            Field.ResultSelector,
+        ]
+
+    def to_dict(self):
+        result = super(Map, self).to_dict()
+        result[Field.ItemProcessor.name] = {
+            "ProcessorConfig": self.processor_config,
+            **Graph(self.processor).to_dict(),
+        }
+        return result
+
+
 class DuplicateStatesInChain(Exception):
     pass
 
@@ -345,6 +512,7 @@ class Chain(object):
                 "Chain takes a 'list' of steps. You provided an input that is not a list."
             )
         self.steps = []
+        self._step_ids = set()  # states compare by identity; avoids scanning the chain
 
         steps_expanded = []
         [
@@ -355,9 +523,8 @@ class Chain(object):
             )
             for step in steps
         ]
-        for step in steps_expanded:
-            if steps_expanded.count(step) > 1:
-                raise DuplicateStatesInChain("Duplicate states in the chain.")
+        if len(set(map(id, steps_expanded))) < len(steps_expanded):
+            raise DuplicateStatesInChain("Duplicate states in the chain.")
         list(map(self.append, steps_expanded))
 
     def __iter__(self):
@@ -378,7 +545,7 @@ class Chain(object):
         if len(self.steps) == 0:
             self.steps.append(step)
         else:
-            if step in self.steps:
+            if id(step) in self._step_ids:
                 raise DuplicateStatesInChain(
                     "State '{step_name}' is already inside this chain. A chain cannot have duplicate states.".format(
                         step_name=step.state_id
@@ -387,6 +554,7 @@ class Chain(object):
             last_step = self.steps[-1]
             last_step.next(step)
             self.steps.append(step)
+        self._step_ids.add(id(step))
 
     def accept(self, visitor):
         for step in self.steps:
@@ -532,6 +700,7 @@ class Parallel(State):
             Field.ResultPath,
             Field.Retry,
             Field.Catch,
+            Field.ResultSelector,
         ]
 
     def add_branch(self, branch):
@@ -658,3 +827,49 @@ class LambdaStep(Task):
             )
 
         super(LambdaStep, self).__init__(state_id, **kwargs)
+
+
+STEP_FUNCTIONS_SERVICE_NAME = "states"
+
+
+class StepFunctionsApi(Enum):
+    StartExecution = "startExecution"
+
+
+class StepFunctionsStartExecutionStep(Task):
+    """
+    Creates a Task state to start the execution of another state machine. See `Manage AWS Step Functions Executions as an Integrated Service <https://docs.aws.amazon.com/step-functions/latest/dg/connect-stepfunctions.html>`_ for more details.
+    """
+
+    def __init__(self, state_id, wait_for_completion=True, **kwargs):
+        """
+        Args:
+            state_id (str): State name whose length **must be** less than or equal to 128 unicode characters. State names **must be** unique within the scope of the whole state machine.
+            wait_for_completion(bool, optional): Boolean value set to `True` if the Task state should wait for the child execution to complete before proceeding to the next step in the workflow. The output of the child execution is then available as parsed JSON. (default: True)
+            comment (str, optional): Human-readable comment or description. (default: None)
+            input_path (str, optional): Path applied to the state's raw input to select some or all of it; that selection is used by the state. (default: '$')
+            parameters (dict, optional): The value of this field becomes the effective input for the state.
+            result_path (str, optional): Path specifying the raw input's combination with or replacement by the state's result. (default: '$')
+            output_path (str, optional): Path applied to the state's output after the application of 'result_path', producing the effective output which serves as the raw input for the next state. (default: '$')
+        """
+        if wait_for_completion:
+            """
+            Example resource arn: arn:aws:states:::states:startExecution.sync:2
+            """
+
+            kwargs[Field.Resource.value] = get_service_integration_arn(
+                STEP_FUNCTIONS_SERVICE_NAME,
+                StepFunctionsApi.StartExecution,
+                IntegrationPattern.WaitForCompletion,
+                2,
+            )
+        else:
+            """
+            Example resource arn: arn:aws:states:::states:startExecution
+            """
+
+            kwargs[Field.Resource.value] = get_service_integration_arn(
+                STEP_FUNCTIONS_SERVICE_NAME, StepFunctionsApi.StartExecution
+            )
+
+        super(StepFunctionsStartExecutionStep, self).__init__(state_id, **kwargs)
@@ -0,0 +1,84 @@
+import importlib.util
+import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+# Each step routed by this dispatcher is packaged into its own sub-directory
+# (containing an "index.py" generated from the step template, and the step's
+# pickled arguments).  "routes.pickle" maps the step name to a route: either
+# the step's directory, ("chain", [routes]) for fused steps which run in
+# sequence, or ("pack", [routes]) for packed steps which run concurrently.
+DISPATCHER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# step modules are kept at module level so that warm containers only
+# import each step once.
+_step_modules = {}
+
+
+def load_step_module(module_dir: str):
+    """Imports (once per container) the step packaged in module_dir
+
+    Args:
+        module_dir (str): Sub-directory containing the step's code
+    """
+    if module_dir not in _step_modules:
+        spec = importlib.util.spec_from_file_location(
+            f"step_in_line_{module_dir}",
+            os.path.join(DISPATCHER_DIR, module_dir, "index.py"),
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _step_modules[module_dir] = module
+    return _step_modules[module_dir]
+
+
+def load_routes():
+    """Loads the routes of the steps packaged in this dispatcher"""
+    with open(os.path.join(DISPATCHER_DIR, "routes.pickle"), "rb") as f:
+        return pickle.load(f)
+
+
+# routes are loaded once per container, rather than on every invocation.
+_routes = load_routes()
+
+
+def run_route(route, event, context):
+    """Runs the step(s) of a route.  Chained (fused) steps run in sequence,
+            each step receiving the output of the previous step, exactly
+            as if the steps were separate states in the state machine.
+            Packed steps run concurrently, and their outputs are combined
+            as if they were branches of a Parallel state.
+
+    Args:
+        route (str or tuple): Sub-directory of the step, or ("chain" | "pack", list of routes)
+        event: input to the step(s)
+        context: Lambda context
+    """
+    if isinstance(route, str):
+        return load_step_module(route).lambda_handler(event, context)
+    kind, routes = route
+    if kind == "chain":
+        output = event
+        for sub_route in routes:
+            output = {"Payload": run_route(sub_route, output, context)}
+        return output["Payload"]
+    with ThreadPoolExecutor(max_workers=len(routes)) as executor:
+        outputs = list(
+            executor.map(lambda sub_route: run_route(sub_route, event, context), routes)
+        )
+    payload = {}
+    for output in outputs:
+        payload = {**payload, **output}
+    return payload
+
+
+def lambda_handler(event, context):
+    """Routes the invocation to the step named in the state's Parameters.
+            The event is expected to be of the form
+            {"StepName": "name_of_step", "Input": <state input>}
+
+    Args:
+        event (dict): object passed to the Lambda
+        context: Lambda context
+    """
+    return run_route(_routes[event["StepName"]], event["Input"], context)
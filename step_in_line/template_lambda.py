@@ -1,13 +1,40 @@
+import os
 import pickle
 
+# the runtime modules of step_in_line are packaged at the root of the Lambda
+from step_in_line.serialization import decode_value, encode_value
+from step_in_line.memoization import CACHE_STATS_PREFIX, memoize, store_from_options
+from step_in_line.instrumentation import Invocation
+
+# caches which persist across warm invocations, for connections, models,
+# lookup tables (object_cache) and downloaded files (file_cache).  Step code
+# can use them with `from step_in_line.warm_cache import object_cache`.
+from step_in_line.warm_cache import object_cache, file_cache
+
 "{{PUT_FUNCTION_HERE}}"
 
+# pickled files are packaged next to this module.  Resolving them relative
+# to this file (rather than the working directory) allows several steps to
+# be packaged as sub-directories of a single dispatcher Lambda.
+LAMBDA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_pickle(file_name: str):
+    """Loads a pickled file packaged alongside this module
+
+    Args:
+        file_name (str): Name of the pickled file
+    """
+    with open(os.path.join(LAMBDA_DIR, file_name), "rb") as f:
+        return pickle.load(f)
+
 
 def combine_payload(event):
     """Takes payload from event.  If previous "step" was a Parallel state,
             this will be an array of payloads from however many steps
             were in the Parallel state.  In this case, it combines these
-            outputs into one large payload.
+            outputs into one large payload.  Branches which were
+            themselves Parallel states (eg, Map steps) give nested arrays.
     Args:
         event (dict): object passed to the Lambda
     """
@@ -17,34 +44,122 @@ def combine_payload(event):
             payload = event["Payload"]
     else:  # then event is a list, and contains "multiple" payloads
         for ev in event:
-            if "Payload" in ev:
+            if isinstance(ev, list):
+                payload = {**payload, **combine_payload(ev)}
+            elif "Payload" in ev:
                 payload = {**payload, **ev["Payload"]}
     return payload
 
 
-# Retrieve transform job name from event and return transform job status.
-def lambda_handler(event, context):
+# Key marking a selector of a field of the output of a previous Lambda,
+# eg {SELECTOR_KEY: ["name_of_step", "field"]}.  Must match step.SELECTOR_KEY.
+SELECTOR_KEY = "__step_in_line_selector__"
 
-    with open("args.pickle", "rb") as f:
-        args = pickle.load(f)
-
-    with open("name.pickle", "rb") as f:
-        name = pickle.load(f)
 
+def resolve_args(args, payload):
     arg_values = []
-    payload = combine_payload(event)
     for arg in args:
-        if arg in payload:
+        if isinstance(arg, str) and arg in payload:
             # extract the output from a previous Lambda
-            arg_values.append(payload[arg])
+            arg_values.append(decode_value(payload[arg]))
+        elif isinstance(arg, dict) and SELECTOR_KEY in arg:
+            # extract a field of the output from a previous Lambda
+            name, *keys = arg[SELECTOR_KEY]
+            value = decode_value(payload[name])
+            for key in keys:
+                value = value[key]
+            arg_values.append(value)
         else:
             # just use the hardcoded argument
             arg_values.append(arg)
+    return arg_values
+
+
+def run_map(event, args, map_index, invocation):
+    """Runs one iteration of a Map state: calls the function once per item
+            of the batch, and returns the list of results.
+
+    Args:
+        event (dict): {"MapItems": [...], "Payload": {...}}, or, if batched by a distributed Map, {"Items": [{"MapItem": ..., "Payload": {...}}, ...]}
+        args (list): arguments of the function
+        map_index (int): index of the argument mapped over
+        invocation (Invocation): times the phases of the invocation
+    """
+    if "Items" in event:
+        items = [item["MapItem"] for item in event["Items"]]
+        payload = event["Items"][0]["Payload"] if event["Items"] else {}
+    else:
+        items = event["MapItems"]
+        payload = event["Payload"]
+    with invocation.phase("resolve_args"):
+        ## the mapped argument (a step name, or a selector) is replaced by
+        ## each item: the iteration's payload only has the other arguments
+        arg_values = resolve_args(
+            args[:map_index] + [None] + args[map_index + 1 :], payload
+        )
+    with invocation.phase("function"):
+        return [
+            "{{PUT_FUNCTION_NAME_HERE}}"(
+                *arg_values[:map_index], item, *arg_values[map_index + 1 :]
+            )
+            for item in items
+        ]
+
+
+def lambda_handler(event, context):
+    ## times each phase of the invocation.  If the STEP_IN_LINE_METRICS
+    ## environment variable is set, the timings, the payload sizes, and
+    ## whether this is a cold start are printed as CloudWatch Embedded
+    ## Metric Format.  If STEP_IN_LINE_PROFILE_MS is set, invocations
+    ## slower than this many milliseconds print a cProfile summary.
+    return Invocation().run(handle, event)
+
+
+def handle(event, invocation):
+    with invocation.phase("load"):
+        args = load_pickle("args.pickle")
+        name = load_pickle("name.pickle")
+        options = {}
+        if os.path.exists(os.path.join(LAMBDA_DIR, "options.pickle")):
+            options = load_pickle("options.pickle")
+        map_index = None
+        if os.path.exists(os.path.join(LAMBDA_DIR, "map.pickle")):
+            map_index = load_pickle("map.pickle")
+    invocation.step = name
+    if map_index is not None:
+        return run_map(event, args, map_index, invocation)
+
+    with invocation.phase("combine_payload"):
+        payload = combine_payload(event)
+    with invocation.phase("resolve_args"):
+        arg_values = resolve_args(args, payload)
+
+    def run():
+        with invocation.phase("function"):
+            result = "{{PUT_FUNCTION_NAME_HERE}}"(*arg_values)
+        with invocation.phase("serialize"):
+            return encode_value(result, options.get("serializer"))
 
-    result = "{{PUT_FUNCTION_NAME_HERE}}"(*arg_values)
+    if "cache" not in options:
+        output = run()
+    else:
+        ## results are looked up by a hash of the code and of the
+        ## arguments, so re-driven executions do not run the function
+        ## again.  Hits and misses are reported in the output.
+        cache = options["cache"]
+        output, hit = memoize(
+            store_from_options(cache["store"]), cache["code"], run, arg_values
+        )
+        invocation.properties["CacheHit"] = hit
+        payload = {
+            **payload,
+            CACHE_STATS_PREFIX + name: {"hits": int(hit), "misses": int(not hit)},
+        }
     ## all outputs from all lambdas are stored in the payload and
     ## passed on to the next lambda(s) in the step.  This mirrors
     ## the local_run from the `Pipeline` class.  On each subsequent
     ## "step" this payload will grow larger.  At the final step, this
-    ## will include the output of all intermediary steps.
-    return {name: result, **payload}
+    ## will include the output of all intermediary steps.  Outputs are
+    ## encoded with the step's serializer (if any), and decoded by the
+    ## Lambdas of the steps which use them.
+    return {name: output, **payload}
@@ -3,6 +3,7 @@ from cdktf import App, TerraformStack, IResolvable, TerraformOutput
 from cdktf_cdktf_provider_aws.provider import AwsProvider
 from cdktf_cdktf_provider_aws import (
     data_aws_subnets,
+    data_aws_lambda_function,
     security_group,
     iam_role_policy_attachment,
     lambda_function,
@@ -14,97 +15,96 @@ from cdktf_cdktf_provider_aws import (
     cloudwatch_log_group,
 )
 from importlib import resources as impresources
-from .step import Step, step
 from .pipeline import Pipeline
-from typing import List, Union, Optional, Tuple
-import json
-import zipfile
-import pickle
+from .registry import LambdaRegistry
+from .packaging import (
+    remove_decorators,
+    get_python_code,
+    package_lambda,
+    package_dispatcher_lambda,
+    group_steps_for_dispatcher,
+)
+from . import tf_resources
+from .tf_resources import ResourceFactory, generate_pipeline, generate_registry
+from .step import Step, step
+from .serialization import Serializer
+from typing import List, Union, Optional, Dict, Any
 from pathlib import Path
-import inspect
-import textwrap
-from hashlib import sha256
 import logging
-import os
 
 logger = logging.getLogger(__name__)
 
 
-def remove_decorators(src: str) -> str:
-    """Removes any decorators from source code and
-            truncates code so that there is no space
-            in front of function definition
+# cdktf constructs of the Terraform resource types created by `step_in_line.tf_resources`
+RESOURCE_CLASSES = {
+    "aws_iam_role": iam_role.IamRole,
+    "aws_iam_policy": iam_policy.IamPolicy,
+    "aws_iam_role_policy_attachment": iam_role_policy_attachment.IamRolePolicyAttachment,
+    "aws_lambda_function": lambda_function.LambdaFunction,
+    "aws_sfn_state_machine": sfn_state_machine.SfnStateMachine,
+    "aws_cloudwatch_event_rule": cloudwatch_event_rule.CloudwatchEventRule,
+    "aws_cloudwatch_event_target": cloudwatch_event_target.CloudwatchEventTarget,
+    "aws_cloudwatch_log_group": cloudwatch_log_group.CloudwatchLogGroup,
+}
 
-    Args:
-        src (str): Source code for lambda
-    """
-    lines = []
-    has_function_def = False
-    for line in src.splitlines():
-        if line.lstrip().startswith("def"):
-            has_function_def = True
-        if has_function_def:
-            lines.append(line)
-    return textwrap.dedent("\n".join(lines))
+DATA_CLASSES = {
+    "aws_lambda_function": data_aws_lambda_function.DataAwsLambdaFunction,
+}
 
 
-def get_python_code(python_template_path: str, step: Step) -> str:
-    """Generates full python code for lambda
+class CdktfResources(ResourceFactory):
+    """Creates the resources of `step_in_line.tf_resources` as cdktf
+    constructs of a scope."""
+
+    def __init__(self, scope: Construct):
+        """Initialize CdktfResources
+
+        Args:
+            scope (Construct): Scope of the constructs, eg a `TerraformStack`
+        """
+        self.scope = scope
+
+    def resource(self, resource_type: str, resource_name: str, /, **attributes):
+        return RESOURCE_CLASSES[resource_type](self.scope, resource_name, **attributes)
+
+    def data(self, data_type: str, data_name: str, /, **attributes):
+        return DATA_CLASSES[data_type](self.scope, data_name, **attributes)
+
+    def output(self, name: str, value: Any):
+        TerraformOutput(self.scope, name, value=value)
+
+
+# The functions below take a cdktf scope, and delegate to `step_in_line.tf_resources`.
 
-    Args:
-        python_template_path (str): Location of template python code
-        step (Step): Step to place inside template
-    """
-    code = remove_decorators(inspect.getsource(step.func))
-    logger.debug(f"Code for {step.name}: {code}")
-    with open(python_template_path, "r") as f:
-        template = f.read()
-    template = template.replace('"{{PUT_FUNCTION_HERE}}"', code)
-    template = template.replace('"{{PUT_FUNCTION_NAME_HERE}}"', step.func.__name__)
-    new_file_name = f"{step.func.__name__}.py"
-    with open(new_file_name, "w") as f:
-        f.write(template)
-    return new_file_name
-
-
-def package_lambda(
-    python_template_path: str, step: Step, lambda_entry: str
-) -> Tuple[str, str]:
-    """Creates zip of `Step` code for use in Lambda
+
+def generate_lambda_role(
+    scope: Construct, resource_prefix: str, additional_policies: List[str]
+) -> iam_role.IamRole:
+    """Creates Terraform resources for the IAM role of a Lambda, with
+        CloudWatch logging permissions and any additional policies attached.
 
     Args:
-        python_template_path (str): Location of template python code
-        step (Step): `Step` to place inside template
-        lambda_entry (str): Name of python entry file
+        scope
+        resource_prefix (str): Prefix for the Terraform resource ids.
+        additional_policies (List[str]): IAM policies, in JSON, to attach to the role.
     """
-    lambda_python_file = get_python_code(python_template_path, step)
-    args_file = "args.pickle"
-    name_file = "name.pickle"
-
-    with open(args_file, "wb") as f:
-        pickle.dump(
-            [step.name if isinstance(step, Step) else step for step in step.args], f
-        )
+    return tf_resources.generate_lambda_role(
+        CdktfResources(scope), resource_prefix, additional_policies
+    )
 
-    with open(name_file, "wb") as f:
-        pickle.dump(step.name, f)
 
-    zip_name = f"{step.name}.zip"
+class LambdaRoles(tf_resources.LambdaRoles):
+    """`step_in_line.tf_resources.LambdaRoles` of the Lambdas of a cdktf scope"""
 
-    zf = zipfile.ZipFile(zip_name, mode="w")
-    zf.write(lambda_python_file, arcname=f"{lambda_entry}.py")
-    zf.write(args_file)
-    zf.write(name_file)
-    zf.close()
-    with open(zip_name, "rb") as f:
-        data = f.read()
-        hash_sha256 = sha256(data).hexdigest()
-    os.remove(args_file)
-    os.remove(name_file)
-    os.remove(lambda_python_file)
-    logger.info(f"Successfully packaged files for Lambda {step.name}")
+    def __init__(self, scope: Construct, name_prefix: str, dedupe: bool = False):
+        """Initialize LambdaRoles
 
-    return zip_name, hash_sha256
+        Args:
+            scope (Construct)
+            name_prefix (str): Prefix for the names of deduplicated roles.
+            dedupe (bool): Whether to deduplicate roles and policies.  Defaults to False.
+        """
+        super().__init__(CdktfResources(scope), name_prefix, dedupe)
 
 
 def generate_lambda_function(
@@ -114,7 +114,12 @@ def generate_lambda_function(
     template_file: str,
     subnet_ids: Optional[List[str]] = None,
     security_group_ids: Optional[List[str]] = None,
-):
+    dispatcher_template_file: Optional[str] = None,
+    roles: Optional[tf_resources.LambdaRoles] = None,
+    lambda_name: Optional[str] = None,
+    overrides: Optional[Dict[str, Any]] = None,
+    serializer: Optional[Serializer] = None,
+) -> lambda_function.LambdaFunction:
     """Creates Terraform resource for Lambda.  Automatically
         adds an environment variable "VAULT_LAMBDA_ROLE" for
         easier Vault integration.
@@ -126,91 +131,69 @@ def generate_lambda_function(
         template_file (str): Location of template file to populate.  Defaults to internal template, but a custom file can be provided.
         subnet_ids (list): Optional subnet IDs.  Required if VPC is specified.
         security_group_ids (list): Option security group IDs.  Required if VPC is specified.
+        dispatcher_template_file (str): Location of the dispatcher template file.  Required if step is a `CompositeStep`.
+        roles (LambdaRoles): Optional, shared creator of IAM roles (eg, to deduplicate roles across Lambdas).
+        lambda_name (str): Optional name of the Lambda's resources, unique within the stack.  Defaults to the name of the step.
+        overrides (dict): Optional arguments of the Lambda resource which take precedence over the step's (see `step_in_line.tuning.lambda_overrides`).
+        serializer (Serializer): Optional serialization of the step's output, if the step does not set its own (eg, the pipeline's).
     """
-    role = {
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Effect": "Allow",
-                "Action": "sts:AssumeRole",
-                "Principal": {"Service": ["lambda.amazonaws.com"]},
-            }
-        ],
-    }
-    policy = {
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Effect": "Allow",
-                "Action": [
-                    "logs:CreateLogGroup",
-                    "logs:CreateLogStream",
-                    "logs:PutLogEvents",
-                ],
-                "Resource": ["arn:aws:logs:*:*:*"],
-            },
-        ],
-    }
+    return tf_resources.generate_lambda_function(
+        CdktfResources(scope),
+        name_prefix,
+        step,
+        template_file,
+        subnet_ids,
+        security_group_ids,
+        dispatcher_template_file,
+        roles,
+        lambda_name=lambda_name,
+        overrides=overrides,
+        serializer=serializer,
+    )
 
-    lambda_entry = "index"
 
-    lambda_filename, sha256_hash = package_lambda(template_file, step, lambda_entry)
-    lambda_handler = f"{lambda_entry}.lambda_handler"
+def generate_dispatcher_function(
+    scope: Construct,
+    name_prefix: str,
+    dispatcher_name: str,
+    steps: List[Step],
+    template_file: str,
+    dispatcher_template_file: str,
+    subnet_ids: Optional[List[str]] = None,
+    security_group_ids: Optional[List[str]] = None,
+    roles: Optional[tf_resources.LambdaRoles] = None,
+    overrides: Optional[Dict[str, Any]] = None,
+    serializer: Optional[Serializer] = None,
+) -> lambda_function.LambdaFunction:
+    """Creates Terraform resource for a single Lambda which dispatches to
+        several steps (see `group_steps_for_dispatcher`).
 
-    lambda_role = iam_role.IamRole(
-        scope,
-        f"{step.name}role",
-        assume_role_policy=json.dumps(role),
-        name_prefix=step.name,
-    )
-    cloudwatch_policy = iam_policy.IamPolicy(
-        scope,
-        f"{step.name}policy",
-        policy=json.dumps(policy),
-    )
-    lambda_policy_attachment = iam_role_policy_attachment.IamRolePolicyAttachment(
-        scope,
-        f"{step.name}policyattachment",
-        policy_arn=cloudwatch_policy.arn,
-        role=lambda_role.name,
-    )
-    for index, additional_policy in enumerate(step.additional_policies):
-        local_policy = iam_policy.IamPolicy(
-            scope,
-            f"{step.name}_{index}_policy",
-            policy=additional_policy,
-        )
-        local_policy_attachment = iam_role_policy_attachment.IamRolePolicyAttachment(
-            scope,
-            f"{step.name}_{index}policyattachment",
-            policy_arn=local_policy.arn,
-            role=lambda_role.name,
-        )
-    vpc_config = (
-        None
-        if subnet_ids is None
-        else {"subnet_ids": subnet_ids, "security_group_ids": security_group_ids}
-    )
-    TerraformOutput(scope, f"{step.name}_lambda_role_arn", value=lambda_role.arn)
-    lambda_f = lambda_function.LambdaFunction(
-        scope,
-        step.name,
-        function_name=f"{name_prefix}_{step.name}",
-        role=lambda_role.arn,
-        filename=lambda_filename,
-        timeout=900,
-        memory_size=step.memory_size,
-        runtime=step.python_runtime,
-        handler=lambda_handler,
-        vpc_config=vpc_config,
-        layers=step.layers,
-        source_code_hash=sha256_hash,
-        environment={
-            "variables": {**step.env_variables, "VAULT_AUTH_ROLE": lambda_role.name}
-        },
+    Args:
+        scope
+        name_prefix (str): Prefix for lambda name to ensure uniqueness.
+        dispatcher_name (str): Name of the dispatcher, unique within the pipeline.
+        steps (List[Step]): Steps to package in the Lambda
+        template_file (str): Location of template file to populate for each step.
+        dispatcher_template_file (str): Location of the dispatcher template file.
+        subnet_ids (list): Optional subnet IDs.  Required if VPC is specified.
+        security_group_ids (list): Option security group IDs.  Required if VPC is specified.
+        roles (LambdaRoles): Optional, shared creator of IAM roles (eg, to deduplicate roles across Lambdas).
+        overrides (dict): Optional arguments of the Lambda resource which take precedence over the steps' (see `step_in_line.tuning.combine_overrides`).
+        serializer (Serializer): Optional serialization of the outputs of the steps which do not set their own (eg, the pipeline's).
+    """
+    return tf_resources.generate_dispatcher_function(
+        CdktfResources(scope),
+        name_prefix,
+        dispatcher_name,
+        steps,
+        template_file,
+        dispatcher_template_file,
+        subnet_ids,
+        security_group_ids,
+        roles,
+        overrides=overrides,
+        serializer=serializer,
     )
-    TerraformOutput(scope, f"{step.name}_lambda_arn", value=lambda_f.arn)
-    return lambda_f
 
 
 def generate_event_bridge(scope: Construct, pipeline: Pipeline, step_function_arn: str):
@@ -221,61 +204,16 @@ def generate_event_bridge(scope: Construct, pipeline: Pipeline, step_function_ar
         pipeline (Pipeline): pipeline to convert into step function
         step_function_arn (str): ARN of the step function pipeline
     """
-    role = {
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Effect": "Allow",
-                "Principal": {"Service": "events.amazonaws.com"},
-                "Action": "sts:AssumeRole",
-            }
-        ],
-    }
-    policy = {
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Effect": "Allow",
-                "Action": ["states:StartExecution"],
-                "Resource": step_function_arn,
-            }
-        ],
-    }
-    eventbridge_policy = iam_policy.IamPolicy(
-        scope,
-        f"{pipeline.name}eventbridgepolicy",
-        policy=json.dumps(policy),
-    )
-    eventbridge_role = iam_role.IamRole(
-        scope,
-        f"{pipeline.name}eventbridgerole",
-        assume_role_policy=json.dumps(role),
-        name_prefix=pipeline.name,
-    )
-    eventbridge_policy_attachment = iam_role_policy_attachment.IamRolePolicyAttachment(
-        scope,
-        f"{pipeline.name}eventbridgepolicyattachment",
-        policy_arn=eventbridge_policy.arn,
-        role=eventbridge_role.name,
-    )
-    event_rule = cloudwatch_event_rule.CloudwatchEventRule(
-        scope,
-        f"{pipeline.name}eventrule",
-        schedule_expression=pipeline.schedule,
-    )
-    cloudwatch_event_target.CloudwatchEventTarget(
-        scope,
-        f"{pipeline.name}eventtarget",
-        rule=event_rule.name,
-        arn=step_function_arn,
-        role_arn=eventbridge_role.arn,
+    tf_resources.generate_event_bridge(
+        CdktfResources(scope), pipeline, step_function_arn
     )
 
 
 def generate_step_function(
     scope: Construct, pipeline: Pipeline, aws_region: str, lambda_arns: List[str]
-):
-    """Creates Terraform resource for step functions
+) -> sfn_state_machine.SfnStateMachine:
+    """Creates Terraform resource for step functions.  If the pipeline is
+        partitioned, also creates the child state machines.
 
     Args:
         scope
@@ -283,93 +221,46 @@ def generate_step_function(
         aws_region (str): AWS Region
         lambda_arns (list): ARNs of Lambdas, required to give step functions access to invoke Lambdas
     """
-    role = {
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Effect": "Allow",
-                "Action": "sts:AssumeRole",
-                "Principal": {
-                    "Service": [
-                        f"states.{aws_region}.amazonaws.com",
-                        "events.amazonaws.com",
-                    ]
-                },
-            }
-        ],
-    }
-    policy = {
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Effect": "Allow",
-                "Action": ["lambda:InvokeFunction"],
-                "Resource": lambda_arns,
-            },
-            {
-                "Effect": "Allow",
-                "Action": [
-                    "logs:CreateLogDelivery",
-                    "logs:CreateLogStream",
-                    "logs:GetLogDelivery",
-                    "logs:UpdateLogDelivery",
-                    "logs:DeleteLogDelivery",
-                    "logs:ListLogDeliveries",
-                    "logs:PutLogEvents",
-                    "logs:PutResourcePolicy",
-                    "logs:DescribeResourcePolicies",
-                    "logs:DescribeLogGroups",
-                ],
-                "Resource": ["*"],
-            },
-            {
-                "Effect": "Allow",
-                "Action": [
-                    "xray:PutTraceSegments",
-                    "xray:PutTelemetryRecords",
-                    "xray:GetSamplingRules",
-                    "xray:GetSamplingTargets",
-                ],
-                "Resource": ["*"],
-            },
-        ],
-    }
-    log_group = cloudwatch_log_group.CloudwatchLogGroup(
-        scope, f"{pipeline.name}log", name_prefix="/aws/vendedlogs/states/stepfunction"
-    )
-    stepfunction_policy = iam_policy.IamPolicy(
-        scope,
-        f"{pipeline.name}policy",
-        policy=json.dumps(policy),
-    )
-    stepfunction_role = iam_role.IamRole(
-        scope,
-        f"{pipeline.name}role",
-        assume_role_policy=json.dumps(role),
-        name_prefix=pipeline.name,
+    return tf_resources.generate_step_function(
+        CdktfResources(scope), pipeline, aws_region, lambda_arns
     )
-    stepfunction_policy_attachment = iam_role_policy_attachment.IamRolePolicyAttachment(
-        scope,
-        f"{pipeline.name}policyattachment",
-        policy_arn=stepfunction_policy.arn,
-        role=stepfunction_role.name,
+
+
+def generate_vpc(
+    scope: Construct,
+    vpc_id: str,
+    subnet_filter: Optional[
+        Union[IResolvable, List[data_aws_subnets.DataAwsSubnetsFilter]]
+    ],
+    outbound_cidr: Optional[List[str]],
+):
+    """Creates Terraform resources to place Lambdas in a VPC.  Returns
+        the subnet ids and the security group ids.
+
+    Args:
+        scope (Construct)
+        vpc_id (str): VPC ID
+        subnet_filter: Filter to access the subnets
+        outbound_cidr (list): The CIDRs to allow Lambda to access.
+    """
+    subnets = data_aws_subnets.DataAwsSubnets(
+        scope, "private_subnets", filter=subnet_filter
     )
-    step_function = sfn_state_machine.SfnStateMachine(
+    security_group_for_lambda = security_group.SecurityGroup(
         scope,
-        pipeline.name,
-        role_arn=stepfunction_role.arn,
-        name=pipeline.name,
-        type="STANDARD",
-        definition=json.dumps(pipeline.generate_step_functions()),
-        logging_configuration={
-            "include_execution_data": True,
-            "level": "ALL",
-            "log_destination": f"{log_group.arn}:*",
-        },
-        tracing_configuration={"enabled": True},
+        "security_group_lambda",
+        egress=[
+            {
+                "fromPort": 0,
+                "toPort": 0,
+                "protocol": "-1",
+                "cidrBlocks": outbound_cidr,
+            }
+        ],
+        vpc_id=vpc_id,
     )
-    TerraformOutput(scope, f"{pipeline.name}_stepfunction_arn", value=step_function.arn)
-    return step_function
+    logger.info(f"Successfully generated VPC Terraform resources")
+    return subnets.ids, [security_group_for_lambda.id]
 
 
 class StepInLine(TerraformStack):
@@ -380,6 +271,8 @@ class StepInLine(TerraformStack):
         pipeline: Pipeline,
         region: str,
         template_file: str = impresources.files(__package__) / "template_lambda.py",
+        dispatcher_template_file: str = impresources.files(__package__)
+        / "template_dispatcher.py",
         vpc_id: Optional[str] = None,
         subnet_filter: Optional[
             Union[IResolvable, List[data_aws_subnets.DataAwsSubnetsFilter]]
@@ -387,6 +280,9 @@ class StepInLine(TerraformStack):
         outbound_cidr: Optional[List[str]] = [
             "0.0.0.0/0",
         ],
+        dedupe_iam: bool = False,
+        registry: Optional[LambdaRegistry] = None,
+        lambda_overrides: Optional[Dict[str, Dict[str, Any]]] = None,
     ):
         """Initialize a StepInLine terraform stack
 
@@ -396,9 +292,13 @@ class StepInLine(TerraformStack):
             pipeline (Pipeline): The pipeline to instantiate in AWS
             region (str): AWS Region
             template_file (str): Location of template file to populate.  Defaults to internal template, but a custom file can be provided.
+            dispatcher_template_file (str): Location of the dispatcher template file, used when the pipeline is in dispatcher mode.
             vpc_id (Optional[str]): If Lambda needs to be in a VPC, supply the VPC ID
             subnet_filter: If vpc_id is needed, provide a filter to access the subnets
             outbound_cidr: Optional[List[str]]: The CIDRs to allow Lambda to access.  Only required if VPC is needed.
+            dedupe_iam (bool): If True, Lambdas share IAM roles and policies with identical content, instead of each getting their own.  Defaults to False.
+            registry (LambdaRegistry): Optional registry of shared Lambdas.  If provided, the pipeline references the Lambdas deployed by a `StepInLineRegistry` stack instead of creating its own, and the VPC options are ignored.
+            lambda_overrides (dict): Optional arguments of the Lambda resources (eg, memory_size, timeout and architectures) which take precedence over the steps', keyed by step name.  See `step_in_line.tuning.lambda_overrides`.  Lambdas shared with a dispatcher get the combined overrides of their steps.  Not supported with a registry.
         """
         super().__init__(scope, name)
 
@@ -406,51 +306,70 @@ class StepInLine(TerraformStack):
 
         subnet_ids = None
         security_group_ids = None
-        if vpc_id is not None:
-            subnets = data_aws_subnets.DataAwsSubnets(
-                self, "private_subnets", filter=subnet_filter
-            )
-            security_group_for_lambda = security_group.SecurityGroup(
-                self,
-                "security_group_lambda",
-                egress=[
-                    {
-                        "fromPort": 0,
-                        "toPort": 0,
-                        "protocol": "-1",
-                        "cidrBlocks": outbound_cidr,
-                    }
-                ],
-                vpc_id=vpc_id,
+        if vpc_id is not None and registry is None:
+            subnet_ids, security_group_ids = generate_vpc(
+                self, vpc_id, subnet_filter, outbound_cidr
             )
 
-            subnet_ids = subnets.ids
-            security_group_ids = [security_group_for_lambda.id]
-            logger.info(f"Successfully generated VPC Terraform resources")
-
-        step_to_lambda_tf = {}
-        for step in pipeline.get_steps():
-            step_lambda = generate_lambda_function(
-                self,
-                pipeline.name,
-                step,
-                template_file,
-                subnet_ids,
-                security_group_ids,
-            )
-            step_to_lambda_tf[step.name] = step_lambda.arn
-            logger.info(
-                f"Successfully generated Lambda Terraform resource for step {step.name}"
+        self.partition_report, self.resource_counts = generate_pipeline(
+            CdktfResources(self),
+            pipeline,
+            region,
+            template_file,
+            dispatcher_template_file,
+            subnet_ids,
+            security_group_ids,
+            dedupe_iam,
+            registry,
+            lambda_overrides,
+        )
+
+
+class StepInLineRegistry(TerraformStack):
+    def __init__(
+        self,
+        scope: Construct,
+        name: str,
+        registry: LambdaRegistry,
+        region: str,
+        vpc_id: Optional[str] = None,
+        subnet_filter: Optional[
+            Union[IResolvable, List[data_aws_subnets.DataAwsSubnetsFilter]]
+        ] = None,
+        outbound_cidr: Optional[List[str]] = [
+            "0.0.0.0/0",
+        ],
+        dedupe_iam: bool = True,
+    ):
+        """Initialize a terraform stack for the shared Lambdas of a registry.
+        Register the pipelines (eg, by creating their `StepInLine` stacks)
+        first: each distinct Lambda is created once, however many pipelines
+        use it.
+
+        Args:
+            scope (Construct)
+            name (str): Unique name for Stack resource
+            registry (LambdaRegistry): The registry
+            region (str): AWS Region
+            vpc_id (Optional[str]): If Lambda needs to be in a VPC, supply the VPC ID
+            subnet_filter: If vpc_id is needed, provide a filter to access the subnets
+            outbound_cidr: Optional[List[str]]: The CIDRs to allow Lambda to access.  Only required if VPC is needed.
+            dedupe_iam (bool): If True, Lambdas share IAM roles and policies with identical content.  Defaults to True.
+        """
+        super().__init__(scope, name)
+
+        AwsProvider(self, "AWS", region=region)
+
+        subnet_ids = None
+        security_group_ids = None
+        if vpc_id is not None:
+            subnet_ids, security_group_ids = generate_vpc(
+                self, vpc_id, subnet_filter, outbound_cidr
             )
 
-        pipeline.set_generate_step_name(lambda s: step_to_lambda_tf[s.name])
-        step_function = generate_step_function(
-            self, pipeline, region, list(step_to_lambda_tf.values())
+        self.resource_counts = generate_registry(
+            CdktfResources(self), registry, subnet_ids, security_group_ids, dedupe_iam
         )
-        logger.info(f"Successfully generated Step Function Terraform resource")
-        if pipeline.schedule is not None:
-            generate_event_bridge(self, pipeline, step_function.arn)
-            logger.info(f"Successfully generated Event Bridge Terraform resource")
 
 
 def rename_tf_output(path: Path):
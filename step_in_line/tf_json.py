@@ -0,0 +1,275 @@
+from importlib import resources as impresources
+from .pipeline import Pipeline
+from .registry import LambdaRegistry
+from .tf_resources import ResourceFactory, generate_pipeline, generate_registry
+from typing import List, Optional, Dict, Any, Tuple
+from pathlib import Path
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class TerraformReference:
+    """Reference to a Terraform resource or data source.  Attributes
+    resolve to Terraform interpolations, eg `role.arn` is
+    "${aws_iam_role.name.arn}"."""
+
+    def __init__(self, address: str):
+        """Initialize a TerraformReference
+
+        Args:
+            address (str): Terraform address, eg "aws_iam_role.name" or "data.aws_subnets.name"
+        """
+        self.address = address
+
+    def __getattr__(self, name: str) -> str:
+        return "${" + f"{self.address}.{name}" + "}"
+
+
+class TerraformJson(ResourceFactory):
+    """Terraform JSON configuration, built as plain Python dicts.  Unlike the
+    cdktf `TerraformStack`, this does not start a Node/jsii runtime."""
+
+    def __init__(self):
+        self.config = {}
+
+    def _block(self, *keys: str) -> dict:
+        block = self.config
+        for key in keys:
+            block = block.setdefault(key, {})
+        return block
+
+    def resource(
+        self, resource_type: str, resource_name: str, /, **attributes
+    ) -> TerraformReference:
+        """Adds a resource.  Attributes which are None are omitted.
+
+        Args:
+            resource_type (str): Terraform resource type, eg "aws_iam_role"
+            resource_name (str): Name of the resource, unique for the resource type
+        """
+        resources = self._block("resource", resource_type)
+        if resource_name in resources:
+            raise ValueError(
+                f"Duplicate Terraform resource {resource_type}.{resource_name}"
+            )
+        resources[resource_name] = {
+            k: v for k, v in attributes.items() if v is not None
+        }
+        return TerraformReference(f"{resource_type}.{resource_name}")
+
+    def data(
+        self, data_type: str, data_name: str, /, **attributes
+    ) -> TerraformReference:
+        """Adds a data source.  Attributes which are None are omitted.
+
+        Args:
+            data_type (str): Terraform data source type, eg "aws_subnets"
+            data_name (str): Name of the data source, unique for the data source type
+        """
+        self._block("data", data_type)[data_name] = {
+            k: v for k, v in attributes.items() if v is not None
+        }
+        return TerraformReference(f"data.{data_type}.{data_name}")
+
+    def output(self, name: str, value: Any):
+        """Adds an output
+
+        Args:
+            name (str): Name of the output
+            value: Value of the output
+        """
+        self._block("output")[name] = {"value": value}
+
+    def variable(self, name: str, **attributes) -> str:
+        """Adds an input variable, and returns a reference to it
+
+        Args:
+            name (str): Name of the variable
+        """
+        self._block("variable")[name] = attributes
+        return "${" + f"var.{name}" + "}"
+
+    def module(self, name: str, source: str, **inputs) -> TerraformReference:
+        """Adds a module call
+
+        Args:
+            name (str): Name of the module call
+            source (str): Source of the module, eg "./modules/name"
+        """
+        self._block("module")[name] = {"source": source, **inputs}
+        return TerraformReference(f"module.{name}")
+
+    def provider(self, name: str, **attributes):
+        """Adds a provider configuration
+
+        Args:
+            name (str): Name of the provider, eg "aws"
+        """
+        self.config.setdefault("provider", {}).setdefault(name, []).append(attributes)
+
+    def required_provider(self, name: str, source: str, version: Optional[str] = None):
+        """Adds a required provider to the terraform block
+
+        Args:
+            name (str): Name of the provider, eg "aws"
+            source (str): Source of the provider, eg "hashicorp/aws"
+            version (str): Optional version constraint
+        """
+        required_provider = {"source": source}
+        if version is not None:
+            required_provider["version"] = version
+        self._block("terraform", "required_providers")[name] = required_provider
+
+    def to_dict(self) -> dict:
+        return self.config
+
+    def write(self, path: Path):
+        """Writes the configuration as a .tf.json file
+
+        Args:
+            path (Path): Location of the file, conventionally ending in .tf.json
+        """
+        with open(path, "w") as f:
+            json.dump(self.config, f, indent=2)
+
+
+def generate_vpc(
+    scope: TerraformJson,
+    vpc_id: str,
+    subnet_filter: Optional[List[Dict[str, Any]]],
+    outbound_cidr: Optional[List[str]],
+) -> Tuple[str, List[str]]:
+    """Creates Terraform resources to place Lambdas in a VPC.  Returns
+        references to the subnet ids and the security group ids.
+
+    Args:
+        scope (TerraformJson)
+        vpc_id (str): VPC ID
+        subnet_filter (list): Filters (eg, [{"name": "tag:Name", "values": ["private*"]}]) to access the subnets
+        outbound_cidr (list): The CIDRs to allow Lambda to access.
+    """
+    subnets = scope.data("aws_subnets", "private_subnets", filter=subnet_filter)
+    security_group_for_lambda = scope.resource(
+        "aws_security_group",
+        "security_group_lambda",
+        egress=[
+            {
+                "cidr_blocks": outbound_cidr,
+                "description": None,
+                "from_port": 0,
+                "ipv6_cidr_blocks": None,
+                "prefix_list_ids": None,
+                "protocol": "-1",
+                "security_groups": None,
+                "self": None,
+                "to_port": 0,
+            }
+        ],
+        vpc_id=vpc_id,
+    )
+    logger.info(f"Successfully generated VPC Terraform resources")
+    return subnets.ids, [security_group_for_lambda.id]
+
+
+class StepInLineJson(TerraformJson):
+    def __init__(
+        self,
+        pipeline: Pipeline,
+        region: str,
+        template_file: str = impresources.files(__package__) / "template_lambda.py",
+        dispatcher_template_file: str = impresources.files(__package__)
+        / "template_dispatcher.py",
+        vpc_id: Optional[str] = None,
+        subnet_filter: Optional[List[Dict[str, Any]]] = None,
+        outbound_cidr: Optional[List[str]] = [
+            "0.0.0.0/0",
+        ],
+        dedupe_iam: bool = False,
+        aws_provider_version: Optional[str] = None,
+        registry: Optional[LambdaRegistry] = None,
+        lambda_overrides: Optional[Dict[str, Dict[str, Any]]] = None,
+    ):
+        """Initialize the Terraform JSON for a pipeline.  Generates the same
+        resources as the `StepInLine` cdktf stack, without cdktf.
+
+        Args:
+            pipeline (Pipeline): The pipeline to instantiate in AWS
+            region (str): AWS Region
+            template_file (str): Location of template file to populate.  Defaults to internal template, but a custom file can be provided.
+            dispatcher_template_file (str): Location of the dispatcher template file, used when the pipeline is in dispatcher mode.
+            vpc_id (Optional[str]): If Lambda needs to be in a VPC, supply the VPC ID
+            subnet_filter (list): If vpc_id is needed, provide filters (eg, [{"name": "tag:Name", "values": ["private*"]}]) to access the subnets
+            outbound_cidr: Optional[List[str]]: The CIDRs to allow Lambda to access.  Only required if VPC is needed.
+            dedupe_iam (bool): If True, Lambdas share IAM roles and policies with identical content, instead of each getting their own.  Defaults to False.
+            aws_provider_version (str): Optional version constraint for the AWS provider.
+            registry (LambdaRegistry): Optional registry of shared Lambdas.  If provided, the pipeline references the Lambdas deployed by `StepInLineRegistryJson` instead of creating its own, and the VPC options are ignored.
+            lambda_overrides (dict): Optional arguments of the Lambda resources (eg, memory_size, timeout and architectures) which take precedence over the steps', keyed by step name.  See `step_in_line.tuning.lambda_overrides`.  Lambdas shared with a dispatcher get the combined overrides of their steps.  Not supported with a registry.
+        """
+        super().__init__()
+        self.required_provider("aws", "hashicorp/aws", aws_provider_version)
+        self.provider("aws", region=region)
+
+        subnet_ids = None
+        security_group_ids = None
+        if vpc_id is not None and registry is None:
+            subnet_ids, security_group_ids = generate_vpc(
+                self, vpc_id, subnet_filter, outbound_cidr
+            )
+
+        self.partition_report, self.resource_counts = generate_pipeline(
+            self,
+            pipeline,
+            region,
+            template_file,
+            dispatcher_template_file,
+            subnet_ids,
+            security_group_ids,
+            dedupe_iam,
+            registry,
+            lambda_overrides,
+        )
+
+
+class StepInLineRegistryJson(TerraformJson):
+    def __init__(
+        self,
+        registry: LambdaRegistry,
+        region: str,
+        vpc_id: Optional[str] = None,
+        subnet_filter: Optional[List[Dict[str, Any]]] = None,
+        outbound_cidr: Optional[List[str]] = [
+            "0.0.0.0/0",
+        ],
+        dedupe_iam: bool = True,
+        aws_provider_version: Optional[str] = None,
+    ):
+        """Initialize the Terraform JSON for the shared Lambdas of a registry.
+        Register the pipelines (eg, by generating their `StepInLineJson`)
+        first: each distinct Lambda is created once, however many pipelines
+        use it.
+
+        Args:
+            registry (LambdaRegistry): The registry
+            region (str): AWS Region
+            vpc_id (Optional[str]): If Lambda needs to be in a VPC, supply the VPC ID
+            subnet_filter (list): If vpc_id is needed, provide filters (eg, [{"name": "tag:Name", "values": ["private*"]}]) to access the subnets
+            outbound_cidr: Optional[List[str]]: The CIDRs to allow Lambda to access.  Only required if VPC is needed.
+            dedupe_iam (bool): If True, Lambdas share IAM roles and policies with identical content.  Defaults to True.
+            aws_provider_version (str): Optional version constraint for the AWS provider.
+        """
+        super().__init__()
+        self.required_provider("aws", "hashicorp/aws", aws_provider_version)
+        self.provider("aws", region=region)
+
+        subnet_ids = None
+        security_group_ids = None
+        if vpc_id is not None:
+            subnet_ids, security_group_ids = generate_vpc(
+                self, vpc_id, subnet_filter, outbound_cidr
+            )
+
+        self.resource_counts = generate_registry(
+            self, registry, subnet_ids, security_group_ids, dedupe_iam
+        )
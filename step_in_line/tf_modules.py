@@ -0,0 +1,209 @@
+from importlib import resources as impresources
+from .step import Step
+from .pipeline import Pipeline
+from .packaging import group_steps_for_dispatcher
+from .tf_json import TerraformJson, generate_vpc
+from .tf_resources import (
+    generate_lambda_function,
+    generate_dispatcher_function,
+    generate_step_function,
+    generate_event_bridge,
+)
+from typing import List, Optional, Dict, Any
+from pathlib import Path
+from hashlib import sha256
+import tempfile
+import shutil
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_FILE = ".step_in_line_fingerprints.json"
+
+
+def fingerprint_module(module_dir: Path) -> str:
+    """Hashes the content of every file of a generated module.  Lambda zips
+        are packaged deterministically, so an unchanged step always gives
+        the same fingerprint.
+
+    Args:
+        module_dir (Path): Directory of the module
+    """
+    hash_sha256 = sha256()
+    for path in sorted(Path(module_dir).rglob("*")):
+        if path.is_file():
+            hash_sha256.update(path.relative_to(module_dir).as_posix().encode())
+            hash_sha256.update(path.read_bytes())
+    return hash_sha256.hexdigest()
+
+
+def _generate_module(
+    module_dir: Path,
+    module_name: str,
+    pipeline: Pipeline,
+    steps: List[Step],
+    template_file: str,
+    dispatcher_template_file: str,
+    use_vpc: bool,
+):
+    """Writes the module of a single Lambda: the Lambda, its IAM role and
+    policies, and outputs for the Lambda and role ARNs."""
+    module = TerraformJson()
+    subnet_ids = None
+    security_group_ids = None
+    if use_vpc:
+        subnet_ids = module.variable("subnet_ids", type="list(string)")
+        security_group_ids = module.variable("security_group_ids", type="list(string)")
+    if pipeline.dispatcher:
+        generate_dispatcher_function(
+            module,
+            pipeline.name,
+            module_name,
+            steps,
+            template_file,
+            dispatcher_template_file,
+            subnet_ids,
+            security_group_ids,
+            module_dir=module_dir,
+            serializer=pipeline.serializer,
+        )
+    else:
+        generate_lambda_function(
+            module,
+            pipeline.name,
+            steps[0],
+            template_file,
+            subnet_ids,
+            security_group_ids,
+            dispatcher_template_file,
+            module_dir=module_dir,
+            serializer=pipeline.serializer,
+        )
+    module.write(Path(module_dir, "main.tf.json"))
+
+
+def write_modules(
+    pipeline: Pipeline,
+    region: str,
+    output_dir: Path,
+    template_file: str = impresources.files(__package__) / "template_lambda.py",
+    dispatcher_template_file: str = impresources.files(__package__)
+    / "template_dispatcher.py",
+    vpc_id: Optional[str] = None,
+    subnet_filter: Optional[List[Dict[str, Any]]] = None,
+    outbound_cidr: Optional[List[str]] = [
+        "0.0.0.0/0",
+    ],
+    aws_provider_version: Optional[str] = None,
+) -> Dict[str, List[str]]:
+    """Writes the Terraform for a pipeline as one self-contained module per
+        Lambda (in "modules/<name>", containing the Lambda zip, its IAM role
+        and policies, and outputs), and a root "main.tf.json" containing the
+        provider, the VPC resources, the module calls, and the state machine.
+        Modules whose fingerprint has not changed since the previous call
+        are left untouched, and modules of removed steps are deleted.
+        Returns (and prints) the names of the "changed", "unchanged", and
+        "removed" modules.
+
+    Args:
+        pipeline (Pipeline): The pipeline to instantiate in AWS
+        region (str): AWS Region
+        output_dir (Path): Directory of the root module
+        template_file (str): Location of template file to populate.  Defaults to internal template, but a custom file can be provided.
+        dispatcher_template_file (str): Location of the dispatcher template file, used when the pipeline is in dispatcher mode.
+        vpc_id (Optional[str]): If Lambda needs to be in a VPC, supply the VPC ID
+        subnet_filter (list): If vpc_id is needed, provide filters (eg, [{"name": "tag:Name", "values": ["private*"]}]) to access the subnets
+        outbound_cidr: Optional[List[str]]: The CIDRs to allow Lambda to access.  Only required if VPC is needed.
+        aws_provider_version (str): Optional version constraint for the AWS provider.
+    """
+    output_dir = Path(output_dir)
+    modules_dir = Path(output_dir, "modules")
+    modules_dir.mkdir(parents=True, exist_ok=True)
+    fingerprint_path = Path(output_dir, FINGERPRINT_FILE)
+    previous_fingerprints = {}
+    if fingerprint_path.exists():
+        with open(fingerprint_path) as f:
+            previous_fingerprints = json.load(f)
+
+    root = TerraformJson()
+    root.required_provider("aws", "hashicorp/aws", aws_provider_version)
+    root.provider("aws", region=region)
+    module_inputs = {}
+    if vpc_id is not None:
+        subnet_ids, security_group_ids = generate_vpc(
+            root, vpc_id, subnet_filter, outbound_cidr
+        )
+        module_inputs = {
+            "subnet_ids": subnet_ids,
+            "security_group_ids": security_group_ids,
+        }
+
+    if pipeline.dispatcher:
+        units = {
+            f"dispatcher_{index}": steps
+            for index, steps in enumerate(
+                group_steps_for_dispatcher(pipeline.get_compiled_steps())
+            )
+        }
+    else:
+        units = {step.name: [step] for step in pipeline.get_compiled_steps()}
+
+    report = {"changed": [], "unchanged": [], "removed": []}
+    fingerprints = {}
+    step_to_lambda_tf = {}
+    with tempfile.TemporaryDirectory() as staging_dir:
+        for module_name, steps in units.items():
+            staging_module_dir = Path(staging_dir, module_name)
+            staging_module_dir.mkdir()
+            _generate_module(
+                staging_module_dir,
+                module_name,
+                pipeline,
+                steps,
+                template_file,
+                dispatcher_template_file,
+                vpc_id is not None,
+            )
+            fingerprints[module_name] = fingerprint_module(staging_module_dir)
+            module_dir = Path(modules_dir, module_name)
+            if (
+                previous_fingerprints.get(module_name) == fingerprints[module_name]
+                and module_dir.exists()
+            ):
+                report["unchanged"].append(module_name)
+            else:
+                shutil.rmtree(module_dir, ignore_errors=True)
+                shutil.copytree(staging_module_dir, module_dir)
+                report["changed"].append(module_name)
+
+            lambda_module = root.module(
+                module_name, f"./modules/{module_name}", **module_inputs
+            )
+            for step in steps:
+                step_to_lambda_tf[step.name] = getattr(
+                    lambda_module, f"{module_name}_lambda_arn"
+                )
+
+    for module_name in sorted(previous_fingerprints):
+        if module_name not in units:
+            shutil.rmtree(Path(modules_dir, module_name), ignore_errors=True)
+            report["removed"].append(module_name)
+
+    pipeline.set_generate_step_name(lambda s: step_to_lambda_tf[s.name])
+    step_function = generate_step_function(
+        root, pipeline, region, list(dict.fromkeys(step_to_lambda_tf.values()))
+    )
+    if pipeline.schedule is not None:
+        generate_event_bridge(root, pipeline, step_function.arn)
+    root.write(Path(output_dir, "main.tf.json"))
+    with open(fingerprint_path, "w") as f:
+        json.dump(fingerprints, f, indent=2, sort_keys=True)
+
+    for status in ["changed", "unchanged", "removed"]:
+        for module_name in report[status]:
+            print(f"{status}: modules/{module_name}")
+    logger.info(
+        f"Wrote {len(units)} modules ({len(report['changed'])} changed, {len(report['removed'])} removed)"
+    )
+    return report
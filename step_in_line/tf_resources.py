@@ -0,0 +1,646 @@
+"""Generation of the Terraform resources of a pipeline, independently of how
+they are emitted.  The functions of this module create resources through a
+`ResourceFactory`: the cdktf stacks (`step_in_line.tf`) create cdktf
+constructs, and the native generator (`step_in_line.tf_json`) builds
+Terraform JSON directly.  Both therefore generate the same resources.
+"""
+
+from .step import Step, CompositeStep
+from .pipeline import Pipeline
+from .registry import LambdaRegistry
+from .serialization import Serializer
+from .tuning import combine_overrides
+from .packaging import (
+    package_lambda,
+    package_dispatcher_lambda,
+    group_steps_for_dispatcher,
+)
+from .policies import (
+    LAMBDA_ASSUME_ROLE_POLICY,
+    LAMBDA_LOGGING_POLICY,
+    policy_hash,
+    event_bridge_assume_role_policy,
+    event_bridge_policy,
+    step_function_assume_role_policy,
+    step_function_policy,
+)
+from typing import List, Optional, Dict, Any, Tuple
+from abc import ABC, abstractmethod
+from pathlib import Path
+from hashlib import sha256
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceFactory(ABC):
+    """Creates Terraform resources, data sources and outputs.  References
+    returned for resources and data sources expose their attributes (eg,
+    `role.arn`) for use in the attributes of other resources."""
+
+    @abstractmethod
+    def resource(self, resource_type: str, resource_name: str, /, **attributes):
+        """Adds a resource, and returns a reference to it.
+
+        Args:
+            resource_type (str): Terraform resource type, eg "aws_iam_role"
+            resource_name (str): Name of the resource, unique for the resource type
+        """
+
+    @abstractmethod
+    def data(self, data_type: str, data_name: str, /, **attributes):
+        """Adds a data source, and returns a reference to it.
+
+        Args:
+            data_type (str): Terraform data source type, eg "aws_lambda_function"
+            data_name (str): Name of the data source, unique for the data source type
+        """
+
+    @abstractmethod
+    def output(self, name: str, value: Any):
+        """Adds an output
+
+        Args:
+            name (str): Name of the output
+            value: Value of the output
+        """
+
+
+def generate_lambda_role(
+    resources: ResourceFactory, resource_prefix: str, additional_policies: List[str]
+):
+    """Creates Terraform resources for the IAM role of a Lambda, with
+        CloudWatch logging permissions and any additional policies attached.
+
+    Args:
+        resources (ResourceFactory)
+        resource_prefix (str): Prefix for the Terraform resource ids.
+        additional_policies (List[str]): IAM policies, in JSON, to attach to the role.
+    """
+    lambda_role = resources.resource(
+        "aws_iam_role",
+        f"{resource_prefix}role",
+        assume_role_policy=json.dumps(LAMBDA_ASSUME_ROLE_POLICY),
+        name_prefix=resource_prefix,
+    )
+    cloudwatch_policy = resources.resource(
+        "aws_iam_policy",
+        f"{resource_prefix}policy",
+        policy=json.dumps(LAMBDA_LOGGING_POLICY),
+    )
+    resources.resource(
+        "aws_iam_role_policy_attachment",
+        f"{resource_prefix}policyattachment",
+        policy_arn=cloudwatch_policy.arn,
+        role=lambda_role.name,
+    )
+    for index, additional_policy in enumerate(additional_policies):
+        local_policy = resources.resource(
+            "aws_iam_policy",
+            f"{resource_prefix}_{index}_policy",
+            policy=additional_policy,
+        )
+        resources.resource(
+            "aws_iam_role_policy_attachment",
+            f"{resource_prefix}_{index}policyattachment",
+            policy_arn=local_policy.arn,
+            role=lambda_role.name,
+        )
+    return lambda_role
+
+
+class LambdaRoles:
+    """Creates the IAM roles of the Lambdas, and counts the IAM resources
+    created.  When deduplicating, each distinct policy (by content hash)
+    is created once, including a single shared CloudWatch logging policy,
+    and each distinct set of policies gets a single role.  Otherwise every
+    Lambda gets its own role and policies."""
+
+    def __init__(
+        self, resources: ResourceFactory, name_prefix: str, dedupe: bool = False
+    ):
+        """Initialize LambdaRoles
+
+        Args:
+            resources (ResourceFactory)
+            name_prefix (str): Prefix for the names of deduplicated roles.
+            dedupe (bool): Whether to deduplicate roles and policies.  Defaults to False.
+        """
+        self.resources = resources
+        self.name_prefix = name_prefix
+        self.dedupe = dedupe
+        self.policies = {}
+        self.roles = {}
+        self.resource_counts = {
+            "aws_iam_role": 0,
+            "aws_iam_policy": 0,
+            "aws_iam_role_policy_attachment": 0,
+        }
+
+    def _get_policy(self, policy: str) -> str:
+        key = policy_hash(policy)
+        if key not in self.policies:
+            self.policies[key] = self.resources.resource(
+                "aws_iam_policy", f"lambdapolicy_{key}", policy=policy
+            )
+            self.resource_counts["aws_iam_policy"] += 1
+        return key
+
+    def get_role(self, resource_prefix: str, additional_policies: List[str]):
+        """Gets (creating if needed) the role for a Lambda.
+
+        Args:
+            resource_prefix (str): Prefix for the Terraform resource ids, if not deduplicating.
+            additional_policies (List[str]): IAM policies, in JSON, to attach to the role.
+        """
+        if not self.dedupe:
+            self.resource_counts["aws_iam_role"] += 1
+            self.resource_counts["aws_iam_policy"] += 1 + len(additional_policies)
+            self.resource_counts["aws_iam_role_policy_attachment"] += 1 + len(
+                additional_policies
+            )
+            return generate_lambda_role(
+                self.resources, resource_prefix, additional_policies
+            )
+
+        policy_keys = [self._get_policy(json.dumps(LAMBDA_LOGGING_POLICY))] + sorted(
+            set(self._get_policy(policy) for policy in additional_policies)
+        )
+        role_key = sha256("".join(policy_keys).encode()).hexdigest()[:16]
+        if role_key not in self.roles:
+            lambda_role = self.resources.resource(
+                "aws_iam_role",
+                f"lambdarole_{role_key}",
+                assume_role_policy=json.dumps(LAMBDA_ASSUME_ROLE_POLICY),
+                name_prefix=self.name_prefix,
+            )
+            for policy_key in policy_keys:
+                self.resources.resource(
+                    "aws_iam_role_policy_attachment",
+                    f"lambdapolicyattachment_{role_key}_{policy_key}",
+                    policy_arn=self.policies[policy_key].arn,
+                    role=lambda_role.name,
+                )
+            self.roles[role_key] = lambda_role
+            self.resource_counts["aws_iam_role"] += 1
+            self.resource_counts["aws_iam_role_policy_attachment"] += len(policy_keys)
+        return self.roles[role_key]
+
+
+def _vpc_config(
+    subnet_ids: Optional[List[str]], security_group_ids: Optional[List[str]]
+) -> Optional[dict]:
+    if subnet_ids is None:
+        return None
+    return {"security_group_ids": security_group_ids, "subnet_ids": subnet_ids}
+
+
+def _zip_location(name: str, module_dir: Optional[Path]) -> Tuple[str, str]:
+    """Returns where to write the zip of a Lambda, and how Terraform
+    refers to it."""
+    if module_dir is None:
+        return f"{name}.zip", f"{name}.zip"
+    return str(Path(module_dir, f"{name}.zip")), "${path.module}/" + f"{name}.zip"
+
+
+def _lambda_function(
+    resources: ResourceFactory,
+    name_prefix: str,
+    lambda_name: str,
+    step: Step,
+    lambda_role,
+    lambda_filename: str,
+    sha256_hash: str,
+    subnet_ids: Optional[List[str]],
+    security_group_ids: Optional[List[str]],
+    overrides: Optional[Dict[str, Any]],
+):
+    """Creates the Lambda resource and its outputs.  The runtime, layers,
+    memory and environment variables are those of step, unless
+    overridden."""
+    overrides = overrides or {}
+    resources.output(f"{lambda_name}_lambda_role_arn", lambda_role.arn)
+    lambda_f = resources.resource(
+        "aws_lambda_function",
+        lambda_name,
+        architectures=overrides.get("architectures"),
+        environment={
+            "variables": {**step.env_variables, "VAULT_AUTH_ROLE": lambda_role.name}
+        },
+        filename=lambda_filename,
+        function_name=f"{name_prefix}_{lambda_name}",
+        handler="index.lambda_handler",
+        layers=step.layers,
+        memory_size=overrides.get("memory_size", step.memory_size),
+        role=lambda_role.arn,
+        runtime=step.python_runtime,
+        source_code_hash=sha256_hash,
+        timeout=overrides.get("timeout", 900),
+        vpc_config=_vpc_config(subnet_ids, security_group_ids),
+    )
+    resources.output(f"{lambda_name}_lambda_arn", lambda_f.arn)
+    return lambda_f
+
+
+def generate_lambda_function(
+    resources: ResourceFactory,
+    name_prefix: str,
+    step: Step,
+    template_file: str,
+    subnet_ids: Optional[List[str]] = None,
+    security_group_ids: Optional[List[str]] = None,
+    dispatcher_template_file: Optional[str] = None,
+    roles: Optional[LambdaRoles] = None,
+    module_dir: Optional[Path] = None,
+    lambda_name: Optional[str] = None,
+    overrides: Optional[Dict[str, Any]] = None,
+    serializer: Optional[Serializer] = None,
+):
+    """Creates Terraform resource for Lambda.  Automatically
+        adds an environment variable "VAULT_LAMBDA_ROLE" for
+        easier Vault integration.
+
+    Args:
+        resources (ResourceFactory)
+        name_prefix (str): Prefix for lambda name to ensure uniqueness.
+        step (Step): Step to create Lambda from
+        template_file (str): Location of template file to populate.  Defaults to internal template, but a custom file can be provided.
+        subnet_ids (list): Optional subnet IDs.  Required if VPC is specified.
+        security_group_ids (list): Option security group IDs.  Required if VPC is specified.
+        dispatcher_template_file (str): Location of the dispatcher template file.  Required if step is a `CompositeStep`.
+        roles (LambdaRoles): Optional, shared creator of IAM roles (eg, to deduplicate roles across Lambdas).
+        module_dir (Path): Optional directory of the Terraform module the Lambda is generated in.  The zip is written there, and referenced relative to the module.
+        lambda_name (str): Optional name of the Lambda's resources, unique within the stack.  Defaults to the name of the step.
+        overrides (dict): Optional arguments of the Lambda resource which take precedence over the step's, eg {"memory_size": 1024, "timeout": 60, "architectures": ["arm64"]} (see `step_in_line.tuning.lambda_overrides`).
+        serializer (Serializer): Optional serialization of the step's output, if the step does not set its own (eg, the pipeline's).
+    """
+    lambda_name = lambda_name or step.name
+    zip_name, lambda_filename = _zip_location(lambda_name, module_dir)
+    if isinstance(step, CompositeStep):
+        _, sha256_hash = package_dispatcher_lambda(
+            template_file,
+            dispatcher_template_file,
+            [step],
+            "index",
+            zip_name,
+            serializer,
+        )
+    else:
+        _, sha256_hash = package_lambda(
+            template_file, step, "index", zip_name, serializer
+        )
+    if roles is None:
+        roles = LambdaRoles(resources, name_prefix)
+    lambda_role = roles.get_role(lambda_name, step.additional_policies)
+    return _lambda_function(
+        resources,
+        name_prefix,
+        lambda_name,
+        step,
+        lambda_role,
+        lambda_filename,
+        sha256_hash,
+        subnet_ids,
+        security_group_ids,
+        overrides,
+    )
+
+
+def generate_dispatcher_function(
+    resources: ResourceFactory,
+    name_prefix: str,
+    dispatcher_name: str,
+    steps: List[Step],
+    template_file: str,
+    dispatcher_template_file: str,
+    subnet_ids: Optional[List[str]] = None,
+    security_group_ids: Optional[List[str]] = None,
+    roles: Optional[LambdaRoles] = None,
+    module_dir: Optional[Path] = None,
+    overrides: Optional[Dict[str, Any]] = None,
+    serializer: Optional[Serializer] = None,
+):
+    """Creates Terraform resource for a single Lambda which dispatches to
+        several steps.  The steps must share runtime, layers, memory and
+        environment variables (see `group_steps_for_dispatcher`).  The
+        Lambda role gets the union of the steps' policies.
+
+    Args:
+        resources (ResourceFactory)
+        name_prefix (str): Prefix for lambda name to ensure uniqueness.
+        dispatcher_name (str): Name of the dispatcher, unique within the pipeline.
+        steps (List[Step]): Steps to package in the Lambda
+        template_file (str): Location of template file to populate for each step.
+        dispatcher_template_file (str): Location of the dispatcher template file.
+        subnet_ids (list): Optional subnet IDs.  Required if VPC is specified.
+        security_group_ids (list): Option security group IDs.  Required if VPC is specified.
+        roles (LambdaRoles): Optional, shared creator of IAM roles (eg, to deduplicate roles across Lambdas).
+        module_dir (Path): Optional directory of the Terraform module the Lambda is generated in.  The zip is written there, and referenced relative to the module.
+        overrides (dict): Optional arguments of the Lambda resource which take precedence over the steps', eg {"memory_size": 1024} (see `step_in_line.tuning.combine_overrides`).
+        serializer (Serializer): Optional serialization of the outputs of the steps which do not set their own (eg, the pipeline's).
+    """
+    zip_name, lambda_filename = _zip_location(dispatcher_name, module_dir)
+    _, sha256_hash = package_dispatcher_lambda(
+        template_file,
+        dispatcher_template_file,
+        steps,
+        "index",
+        zip_name,
+        serializer,
+    )
+    policies = list(
+        dict.fromkeys(policy for step in steps for policy in step.additional_policies)
+    )
+    if roles is None:
+        roles = LambdaRoles(resources, name_prefix)
+    lambda_role = roles.get_role(dispatcher_name, policies)
+    return _lambda_function(
+        resources,
+        name_prefix,
+        dispatcher_name,
+        steps[0],
+        lambda_role,
+        lambda_filename,
+        sha256_hash,
+        subnet_ids,
+        security_group_ids,
+        overrides,
+    )
+
+
+def generate_event_bridge(
+    resources: ResourceFactory, pipeline: Pipeline, step_function_arn: str
+):
+    """Creates Terraform resource for event bridge to schedule step function run
+
+    Args:
+        resources (ResourceFactory)
+        pipeline (Pipeline): pipeline to convert into step function
+        step_function_arn (str): ARN of the step function pipeline
+    """
+    eventbridge_policy = resources.resource(
+        "aws_iam_policy",
+        f"{pipeline.name}eventbridgepolicy",
+        policy=json.dumps(event_bridge_policy(step_function_arn)),
+    )
+    eventbridge_role = resources.resource(
+        "aws_iam_role",
+        f"{pipeline.name}eventbridgerole",
+        assume_role_policy=json.dumps(event_bridge_assume_role_policy()),
+        name_prefix=pipeline.name,
+    )
+    resources.resource(
+        "aws_iam_role_policy_attachment",
+        f"{pipeline.name}eventbridgepolicyattachment",
+        policy_arn=eventbridge_policy.arn,
+        role=eventbridge_role.name,
+    )
+    event_rule = resources.resource(
+        "aws_cloudwatch_event_rule",
+        f"{pipeline.name}eventrule",
+        schedule_expression=pipeline.schedule,
+    )
+    resources.resource(
+        "aws_cloudwatch_event_target",
+        f"{pipeline.name}eventtarget",
+        arn=step_function_arn,
+        role_arn=eventbridge_role.arn,
+        rule=event_rule.name,
+    )
+
+
+def generate_step_function(
+    resources: ResourceFactory,
+    pipeline: Pipeline,
+    aws_region: str,
+    lambda_arns: List[str],
+):
+    """Creates Terraform resource for step functions.  If the pipeline is
+        partitioned, also creates the child state machines, which share
+        the role and log group of the parent.
+
+    Args:
+        resources (ResourceFactory)
+        pipeline (Pipeline): pipeline to convert into step function
+        aws_region (str): AWS Region
+        lambda_arns (list): ARNs of Lambdas, required to give step functions access to invoke Lambdas
+    """
+    log_group = resources.resource(
+        "aws_cloudwatch_log_group",
+        f"{pipeline.name}log",
+        name_prefix="/aws/vendedlogs/states/stepfunction",
+    )
+    logging_configuration = {
+        "include_execution_data": True,
+        "level": "ALL",
+        "log_destination": f"{log_group.arn}:*",
+    }
+    stepfunction_role = resources.resource(
+        "aws_iam_role",
+        f"{pipeline.name}role",
+        assume_role_policy=json.dumps(step_function_assume_role_policy(aws_region)),
+        name_prefix=pipeline.name,
+    )
+    child_state_machines = {}
+    pipeline.set_generate_state_machine_name(lambda n: child_state_machines[n])
+    state_machines = pipeline.generate_state_machines()
+    # children are created before the state machines which start them
+    for child_name in reversed(list(state_machines)[1:]):
+        child_spec = state_machines[child_name]
+        child_state_machine = resources.resource(
+            "aws_sfn_state_machine",
+            child_name,
+            definition=json.dumps(pipeline.generate_definition(child_spec)),
+            logging_configuration=logging_configuration,
+            name=child_name,
+            role_arn=stepfunction_role.arn,
+            tracing_configuration={"enabled": True},
+            type=child_spec.workflow_type,
+        )
+        child_state_machines[child_name] = child_state_machine.arn
+    stepfunction_policy = resources.resource(
+        "aws_iam_policy",
+        f"{pipeline.name}policy",
+        policy=json.dumps(
+            step_function_policy(
+                lambda_arns,
+                child_state_machines,
+                list(state_machines) if pipeline.uses_distributed_map() else None,
+            )
+        ),
+    )
+    resources.resource(
+        "aws_iam_role_policy_attachment",
+        f"{pipeline.name}policyattachment",
+        policy_arn=stepfunction_policy.arn,
+        role=stepfunction_role.name,
+    )
+    step_function = resources.resource(
+        "aws_sfn_state_machine",
+        pipeline.name,
+        definition=json.dumps(
+            pipeline.generate_definition(state_machines[pipeline.name])
+        ),
+        logging_configuration=logging_configuration,
+        name=pipeline.name,
+        role_arn=stepfunction_role.arn,
+        tracing_configuration={"enabled": True},
+        type=pipeline.workflow_type,
+    )
+    resources.output(f"{pipeline.name}_stepfunction_arn", step_function.arn)
+    return step_function
+
+
+def generate_pipeline(
+    resources: ResourceFactory,
+    pipeline: Pipeline,
+    region: str,
+    template_file: str,
+    dispatcher_template_file: str,
+    subnet_ids: Optional[List[str]] = None,
+    security_group_ids: Optional[List[str]] = None,
+    dedupe_iam: bool = False,
+    registry: Optional[LambdaRegistry] = None,
+    lambda_overrides: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Creates the Terraform resources of a pipeline: its Lambdas (or
+        references to the shared Lambdas of a registry), state machines
+        and schedule.  Returns the partition report of the pipeline and
+        the counts of the Lambda and IAM resources created.
+
+    Args:
+        resources (ResourceFactory)
+        pipeline (Pipeline): The pipeline to instantiate in AWS
+        region (str): AWS Region
+        template_file (str): Location of template file to populate.
+        dispatcher_template_file (str): Location of the dispatcher template file, used when the pipeline is in dispatcher mode.
+        subnet_ids (list): Optional subnet IDs.  Required if VPC is specified.
+        security_group_ids (list): Option security group IDs.  Required if VPC is specified.
+        dedupe_iam (bool): If True, Lambdas share IAM roles and policies with identical content, instead of each getting their own.  Defaults to False.
+        registry (LambdaRegistry): Optional registry of shared Lambdas, referenced instead of creating the pipeline's own.
+        lambda_overrides (dict): Optional arguments of the Lambda resources which take precedence over the steps', keyed by step name.  Lambdas shared with a dispatcher get the combined overrides of their steps.  Not supported with a registry.
+    """
+    if registry is not None and lambda_overrides:
+        raise ValueError(
+            f"Pipeline {pipeline.name} references the shared Lambdas of registry {registry.name}, so lambda_overrides can not be applied: set the configuration on the steps instead"
+        )
+    roles = LambdaRoles(resources, pipeline.name, dedupe_iam)
+    lambda_overrides = lambda_overrides or {}
+    step_to_lambda_tf = {}
+    if registry is not None:
+        for step_name, function_name in registry.register(pipeline).items():
+            shared_lambda = resources.data(
+                "aws_lambda_function", step_name, function_name=function_name
+            )
+            step_to_lambda_tf[step_name] = shared_lambda.arn
+        logger.info(
+            f"Referenced {len(step_to_lambda_tf)} shared Lambdas from registry {registry.name}"
+        )
+    elif pipeline.dispatcher:
+        for index, steps in enumerate(
+            group_steps_for_dispatcher(pipeline.get_compiled_steps())
+        ):
+            dispatcher_lambda = generate_dispatcher_function(
+                resources,
+                pipeline.name,
+                f"dispatcher_{index}",
+                steps,
+                template_file,
+                dispatcher_template_file,
+                subnet_ids,
+                security_group_ids,
+                roles,
+                overrides=combine_overrides(
+                    [lambda_overrides.get(step.name) for step in steps]
+                ),
+                serializer=pipeline.serializer,
+            )
+            for step in steps:
+                step_to_lambda_tf[step.name] = dispatcher_lambda.arn
+            logger.info(
+                f"Successfully generated dispatcher Lambda Terraform resource for {len(steps)} steps"
+            )
+    else:
+        for step in pipeline.get_compiled_steps():
+            step_lambda = generate_lambda_function(
+                resources,
+                pipeline.name,
+                step,
+                template_file,
+                subnet_ids,
+                security_group_ids,
+                dispatcher_template_file,
+                roles,
+                overrides=lambda_overrides.get(step.name),
+                serializer=pipeline.serializer,
+            )
+            step_to_lambda_tf[step.name] = step_lambda.arn
+            logger.info(
+                f"Successfully generated Lambda Terraform resource for step {step.name}"
+            )
+
+    pipeline.set_generate_step_name(lambda s: step_to_lambda_tf[s.name])
+    step_function = generate_step_function(
+        resources, pipeline, region, list(dict.fromkeys(step_to_lambda_tf.values()))
+    )
+    logger.info(f"Successfully generated Step Function Terraform resource")
+    partition_report = pipeline.partition_report()
+    for partition in partition_report:
+        logger.info(
+            f"{partition['type']} state machine {partition['name']}: {partition['steps']} steps, {partition['states']} states, up to {partition['events']} history events"
+        )
+    resource_counts = {
+        "aws_lambda_function": (
+            0 if registry is not None else len(set(step_to_lambda_tf.values()))
+        ),
+        **roles.resource_counts,
+    }
+    logger.info(
+        "Lambda resource counts: "
+        + ", ".join(f"{k}={v}" for k, v in resource_counts.items())
+    )
+    if pipeline.schedule is not None:
+        generate_event_bridge(resources, pipeline, step_function.arn)
+        logger.info(f"Successfully generated Event Bridge Terraform resource")
+    return partition_report, resource_counts
+
+
+def generate_registry(
+    resources: ResourceFactory,
+    registry: LambdaRegistry,
+    subnet_ids: Optional[List[str]] = None,
+    security_group_ids: Optional[List[str]] = None,
+    dedupe_iam: bool = True,
+) -> Dict[str, int]:
+    """Creates the Terraform resources of the shared Lambdas of a registry.
+        Returns the counts of the Lambda and IAM resources created.
+
+    Args:
+        resources (ResourceFactory)
+        registry (LambdaRegistry): The registry
+        subnet_ids (list): Optional subnet IDs.  Required if VPC is specified.
+        security_group_ids (list): Option security group IDs.  Required if VPC is specified.
+        dedupe_iam (bool): If True, Lambdas share IAM roles and policies with identical content.  Defaults to True.
+    """
+    roles = LambdaRoles(resources, registry.name, dedupe_iam)
+    for fingerprint, step in registry.steps.items():
+        generate_lambda_function(
+            resources,
+            registry.name,
+            step,
+            registry.template_file,
+            subnet_ids,
+            security_group_ids,
+            registry.dispatcher_template_file,
+            roles,
+            lambda_name=registry.lambda_name(fingerprint),
+            serializer=registry.serializers[fingerprint],
+        )
+    logger.info(
+        f"Successfully generated {len(registry.steps)} shared Lambda Terraform resources"
+    )
+    return {
+        "aws_lambda_function": len(registry.steps),
+        **roles.resource_counts,
+    }
@@ -0,0 +1,364 @@
+"""Recommendation of the memory size, architecture and timeout of the Lambda
+of each step, in the spirit of AWS Lambda Power Tuning, but from local runs
+rather than deployed functions.
+
+Each step is run several times by `Pipeline.local_run` under a `Profiler`,
+which records its wall time, CPU time, and peak memory allocated.  Lambda
+allocates CPU in proportion to memory (one vCPU at 1,769 MB, up to six at
+10,240 MB), so the CPU time of a step shrinks as its memory grows (up to the
+parallelism of the step), while the time it waits (eg, for I/O) does not.
+The estimated duration and cost of each step are modelled at each memory
+size and architecture, and the cheapest (or fastest) size which fits the
+peak memory is recommended.
+"""
+
+import logging
+import math
+import statistics
+from typing import Any, Dict, List, Optional, Sequence
+
+from .analysis import LAMBDA_GB_SECOND_PRICE, LAMBDA_REQUEST_PRICE
+from .pipeline import Pipeline
+from .profiling import Profiler
+from .step import Step, CompositeStep, FusedStep, MapStep
+
+logger = logging.getLogger(__name__)
+
+ARM64_GB_SECOND_PRICE = 0.0000133334  # USD (us-east-1)
+GB_SECOND_PRICES = {"x86_64": LAMBDA_GB_SECOND_PRICE, "arm64": ARM64_GB_SECOND_PRICE}
+
+# memory size, in MB, at which a Lambda gets a full vCPU
+FULL_VCPU_MEMORY_SIZE = 1769
+MAX_VCPUS = 6
+MAX_TIMEOUT = 900
+
+MEMORY_SIZES = [
+    128,
+    256,
+    512,
+    768,
+    1024,
+    1536,
+    1769,
+    2048,
+    3008,
+    4096,
+    5120,
+    6144,
+    8192,
+    10240,
+]
+
+STRATEGIES = ["cost", "speed", "balanced"]
+
+
+def vcpus(memory_size: int) -> float:
+    """vCPUs allocated to a Lambda with this many MB of memory"""
+    return min(memory_size / FULL_VCPU_MEMORY_SIZE, MAX_VCPUS)
+
+
+def lambda_cost(duration: float, memory_size: int, architecture: str) -> float:
+    """Cost, in USD, of an invocation, billed by the millisecond
+
+    Args:
+        duration (float): Duration of the invocation, in seconds
+        memory_size (int): Memory of the Lambda, in MB
+        architecture (str): "x86_64" or "arm64"
+    """
+    billed = math.ceil(1000 * duration) / 1000
+    return (
+        LAMBDA_REQUEST_PRICE
+        + GB_SECOND_PRICES[architecture] * memory_size / 1024 * billed
+    )
+
+
+class StepMeasurement:
+    """Local measurements of an invocation of a step, over several runs"""
+
+    def __init__(
+        self,
+        name: str,
+        wall: float,
+        cpu: float,
+        peak_memory: Optional[int],
+        runs: int,
+    ):
+        """Initialize a StepMeasurement
+
+        Args:
+            name (str): Name of the step
+            wall (float): Median wall time of an invocation, in seconds
+            cpu (float): Median CPU time of an invocation, in seconds
+            peak_memory (int): Largest peak memory allocated by an invocation, in bytes, if traced
+            runs (int): Number of runs measured
+        """
+        self.name = name
+        self.wall = wall
+        self.cpu = cpu
+        self.peak_memory = peak_memory
+        self.runs = runs
+
+    @property
+    def parallelism(self) -> float:
+        """Average number of threads busy while the step runs (at least 1)"""
+        return max(self.cpu / self.wall, 1.0) if self.wall > 0 else 1.0
+
+    def duration(self, memory_size: int, speed: float = 1.0) -> float:
+        """Estimated duration of an invocation on Lambda, in seconds
+
+        Args:
+            memory_size (int): Memory of the Lambda, in MB
+            speed (float): Speed of a Lambda vCPU relative to the local CPU
+        """
+        waiting = max(self.wall - self.cpu / self.parallelism, 0.0)
+        return waiting + self.cpu / (min(self.parallelism, vcpus(memory_size)) * speed)
+
+
+class Recommendation:
+    """Recommended configuration of the Lambda of a step"""
+
+    def __init__(
+        self,
+        name: str,
+        memory_size: int,
+        architecture: str,
+        duration: float,
+        cost: float,
+        timeout: int,
+        current_memory_size: int,
+        current_duration: float,
+        current_cost: float,
+    ):
+        self.name = name
+        self.memory_size = memory_size
+        self.architecture = architecture
+        self.duration = duration  # seconds
+        self.cost = cost  # USD per invocation
+        self.timeout = timeout  # seconds
+        self.current_memory_size = current_memory_size
+        self.current_duration = current_duration
+        self.current_cost = current_cost
+
+    def to_overrides(self) -> Dict[str, Any]:
+        """Arguments of the Lambda resource, for `lambda_overrides`"""
+        return {
+            "memory_size": self.memory_size,
+            "timeout": self.timeout,
+            "architectures": [self.architecture],
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "memory_size": self.memory_size,
+            "architecture": self.architecture,
+            "duration": self.duration,
+            "cost": self.cost,
+            "timeout": self.timeout,
+            "current_memory_size": self.current_memory_size,
+            "current_duration": self.current_duration,
+            "current_cost": self.current_cost,
+        }
+
+
+def measure_steps(
+    pipeline: Pipeline, runs: int = 3, memory: bool = True
+) -> Dict[str, StepMeasurement]:
+    """Runs the pipeline locally several times, one step at a time, and
+        measures each invocation of its steps.  The measurements of a Map
+        step are divided by its number of batches (ie, of invocations), and,
+        as a Lambda runs the items of a batch one after the other, its
+        local concurrency is not counted as parallelism.
+
+    Args:
+        pipeline (Pipeline): The pipeline to measure
+        runs (int): Number of local runs.  Defaults to 3.
+        memory (bool): Whether to trace the peak memory of each step.  Defaults to True.
+    """
+    profiles = {}  # step name -> profiles
+    batches = {}  # Map step name -> number of invocations
+    steps = {step.name: step for step in pipeline.get_steps()}
+    for _ in range(runs):
+        profiler = Profiler(memory=memory, process_cpu=True)
+        outputs = pipeline.local_run(profiler=profiler)
+        for layer in outputs:
+            for name, output in layer:
+                step = steps[name]
+                if isinstance(step, MapStep):
+                    batches[name] = max(-(-len(output) // (step.batch_size or 1)), 1)
+        for name, profile in profiler.profiles.items():
+            profiles.setdefault(name, []).append(profile)
+    measurements = {}
+    for name, step_profiles in profiles.items():
+        invocations = batches.get(name, 1)
+        wall = statistics.median(p.wall for p in step_profiles)
+        cpu = statistics.median(p.cpu for p in step_profiles)
+        if name in batches:
+            wall = max(wall, cpu)
+        peaks = [p.peak_memory for p in step_profiles if p.peak_memory is not None]
+        measurements[name] = StepMeasurement(
+            name,
+            wall / invocations,
+            cpu / invocations,
+            max(peaks) // invocations if peaks else None,
+            len(step_profiles),
+        )
+    return measurements
+
+
+def recommend(
+    pipeline: Pipeline,
+    measurements: Optional[Dict[str, StepMeasurement]] = None,
+    runs: int = 3,
+    strategy: str = "cost",
+    architectures: Sequence[str] = ("x86_64", "arm64"),
+    memory_sizes: Sequence[int] = MEMORY_SIZES,
+    runtime_memory_mb: int = 64,
+    memory_headroom: float = 1.5,
+    local_speed: float = 1.0,
+    arm64_speed: float = 1.0,
+    timeout_factor: float = 3.0,
+    min_timeout: int = 60,
+) -> Dict[str, Recommendation]:
+    """Recommends the memory size, architecture and timeout of the Lambda of
+        each step.  Only sizes with enough memory for the step are considered.
+        arm64 is only recommended for steps without layers, which are built
+        for a single architecture.
+
+    Args:
+        pipeline (Pipeline): The pipeline to tune
+        measurements (dict): Measurements of the steps, keyed by name.  Defaults to measuring `runs` local runs with `measure_steps`.
+        runs (int): Number of local runs, if measurements are not given.  Defaults to 3.
+        strategy (str): "cost" (the cheapest size, and the fastest of those within 1% of it), "speed" (the fastest size, and the cheapest of those within 1% of it), or "balanced" (the smallest product of cost and duration).  Defaults to "cost".
+        architectures (Sequence[str]): Architectures to consider.  Defaults to x86_64 and arm64.
+        memory_sizes (Sequence[int]): Memory sizes to consider, in MB.
+        runtime_memory_mb (int): Memory used by the Python runtime and the handler, in MB, on top of the peak memory of the step.  Defaults to 64.
+        memory_headroom (float): Factor applied to the peak memory of the step.  Defaults to 1.5.
+        local_speed (float): Speed of a Lambda x86_64 vCPU relative to the local CPU.  Defaults to 1.
+        arm64_speed (float): Speed of an arm64 vCPU relative to an x86_64 vCPU.  Defaults to 1.
+        timeout_factor (float): Timeout, as a multiple of the estimated duration.  Defaults to 3.
+        min_timeout (int): Minimum timeout, in seconds, eg to allow for cold starts.  Defaults to 60.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"strategy must be one of {STRATEGIES}, not {strategy}")
+    if measurements is None:
+        measurements = measure_steps(pipeline, runs)
+    recommendations = {}
+    for step in pipeline.get_steps():
+        measurement = measurements.get(step.name)
+        if measurement is None:
+            logger.warning(f"Step {step.name} was not measured (eg, it was skipped)")
+            continue
+        peak_mb = (measurement.peak_memory or 0) / 2**20
+        required = runtime_memory_mb + memory_headroom * peak_mb
+        candidates = []
+        for architecture in architectures:
+            if architecture == "arm64" and step.layers:
+                continue
+            speed = local_speed * (arm64_speed if architecture == "arm64" else 1.0)
+            for memory_size in memory_sizes:
+                if memory_size < required:
+                    continue
+                duration = measurement.duration(memory_size, speed)
+                cost = lambda_cost(duration, memory_size, architecture)
+                candidates.append((cost, duration, memory_size, architecture))
+        if not candidates:
+            logger.warning(
+                f"Step {step.name} needs about {required:.0f} MB, more than any memory size"
+            )
+            continue
+        if strategy == "cost":
+            cheapest = min(c[0] for c in candidates)
+            best = min(
+                (c for c in candidates if c[0] <= 1.01 * cheapest), key=lambda c: c[1]
+            )
+        elif strategy == "speed":
+            fastest = min(c[1] for c in candidates)
+            best = min(
+                (c for c in candidates if c[1] <= 1.01 * fastest), key=lambda c: c[0]
+            )
+        else:
+            best = min(candidates, key=lambda c: c[0] * c[1])
+        cost, duration, memory_size, architecture = best
+        current_duration = measurement.duration(step.memory_size, local_speed)
+        recommendations[step.name] = Recommendation(
+            step.name,
+            memory_size,
+            architecture,
+            duration,
+            cost,
+            min(max(math.ceil(timeout_factor * duration), min_timeout), MAX_TIMEOUT),
+            step.memory_size,
+            current_duration,
+            lambda_cost(current_duration, step.memory_size, "x86_64"),
+        )
+    return recommendations
+
+
+def combine_overrides(
+    overrides: List[Optional[Dict[str, Any]]], sequential: bool = False
+) -> Optional[Dict[str, Any]]:
+    """Overrides of a Lambda running several steps: the largest memory size,
+        the largest (or, if the steps run one after the other, the total)
+        timeout, and an architecture only if all the steps agree on it.
+        None if any step has no overrides.
+
+    Args:
+        overrides (list): Overrides of each step
+        sequential (bool): Whether the steps run one after the other (eg, fused steps)
+    """
+    if not overrides or any(o is None for o in overrides):
+        return None
+    timeouts = [o["timeout"] for o in overrides if "timeout" in o]
+    combined = {}
+    if all("memory_size" in o for o in overrides):
+        combined["memory_size"] = max(o["memory_size"] for o in overrides)
+    if timeouts:
+        combined["timeout"] = min(
+            sum(timeouts) if sequential else max(timeouts), MAX_TIMEOUT
+        )
+    architectures = {tuple(o.get("architectures", ["x86_64"])) for o in overrides}
+    if len(architectures) == 1:
+        combined["architectures"] = list(architectures.pop())
+    return combined
+
+
+def lambda_overrides(
+    pipeline: Pipeline, recommendations: Dict[str, Recommendation]
+) -> Dict[str, Dict[str, Any]]:
+    """Arguments of the Lambda resources, keyed by the names of the steps
+        after the compiler passes (eg, fused steps), for the
+        `lambda_overrides` of `StepInLine` and `StepInLineJson`.
+
+    Args:
+        pipeline (Pipeline): The tuned pipeline
+        recommendations (dict): Result of `recommend`
+    """
+
+    def step_overrides(step: Step) -> Optional[Dict[str, Any]]:
+        if isinstance(step, CompositeStep):
+            return combine_overrides(
+                [step_overrides(s) for s in step.steps],
+                sequential=isinstance(step, FusedStep),
+            )
+        recommendation = recommendations.get(step.name)
+        return None if recommendation is None else recommendation.to_overrides()
+
+    overrides = {}
+    for step in pipeline.get_compiled_steps():
+        step_override = step_overrides(step)
+        if step_override is not None:
+            overrides[step.name] = step_override
+    return overrides
+
+
+def recommendation_summary(recommendations: Dict[str, Recommendation]) -> str:
+    """Table of the recommendations, with the estimated savings"""
+    lines = [
+        f"{'step':<32} {'memory (MB)':>14} {'arch':>7} {'duration (ms)':>16} {'cost (USD)':>22} {'timeout (s)':>12}"
+    ]
+    for r in recommendations.values():
+        lines.append(
+            f"{r.name:<32} {r.current_memory_size:>5} -> {r.memory_size:>5} {r.architecture:>7} {1000 * r.current_duration:>7.0f} -> {1000 * r.duration:>5.0f} {r.current_cost:>10.8f} -> {r.cost:.8f} {r.timeout:>12}"
+        )
+    return "\n".join(lines)
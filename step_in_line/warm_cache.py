@@ -0,0 +1,205 @@
+"""Caches which persist across the invocations of a warm Lambda container.
+Lambda reuses containers, and module level state, between invocations, so
+step code can keep connections, models, and lookup tables in `object_cache`,
+and downloaded reference files in `file_cache`:
+
+    @step
+    def query(sql: str) -> list:
+        from step_in_line.warm_cache import object_cache
+
+        connection = object_cache.get_or_create("warehouse", connect)
+        return connection.execute(sql)
+
+This module is packaged with each Lambda, so it only depends on the standard
+library.  The sizes of the caches can be set with the environment variables
+STEP_IN_LINE_OBJECT_CACHE_SIZE (number of objects) and
+STEP_IN_LINE_FILE_CACHE_BYTES.
+"""
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Any, Callable, Dict, Optional
+
+
+class LRUCache:
+    """Size-bounded cache of objects, evicting the least recently used.
+    Thread safe, since packed steps run concurrently."""
+
+    def __init__(self, max_size: int = 128):
+        """Initialize a LRUCache
+
+        Args:
+            max_size (int): Maximum number of objects.  Defaults to 128.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Gets an object, or default if it is not cached.
+
+        Args:
+            key (str): Key of the object
+            default: Returned if the object is not cached
+        """
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key: str, value: Any):
+        """Caches an object, evicting the least recently used objects if the
+        cache is full.
+
+        Args:
+            key (str): Key of the object
+            value: The object
+        """
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_create(self, key: str, create: Callable[[], Any]) -> Any:
+        """Gets an object, creating and caching it if it is not cached.
+
+        Args:
+            key (str): Key of the object
+            create (callable): Creates the object (eg, opens a connection)
+        """
+        with self._lock:
+            if key in self._items:
+                return self.get(key)
+            self.misses += 1
+            value = create()
+            self.put(key, value)
+            return value
+
+    def clear(self):
+        """Removes all objects"""
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def stats(self) -> Dict[str, int]:
+        """Hits, misses, and evictions since the container started"""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class FileCache:
+    """Cache of files in a local directory (in Lambda, /tmp, whose size is
+    limited by the function's ephemeral storage), evicting the least
+    recently used files above a capacity in bytes."""
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 256 << 20):
+        """Initialize a FileCache
+
+        Args:
+            directory (str): Directory of the cached files.  Defaults to "step_in_line_cache" in the temporary directory (/tmp in Lambda).
+            max_bytes (int): Capacity of the cache, in bytes.  Defaults to 256MB, half the default ephemeral storage of a Lambda.
+        """
+        self.directory = directory or os.path.join(
+            tempfile.gettempdir(), "step_in_line_cache"
+        )
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._sizes = OrderedDict()  # file name -> size, least recently used first
+        self._lock = threading.RLock()
+        if os.path.isdir(self.directory):
+            file_names = sorted(
+                os.listdir(self.directory),
+                key=lambda name: os.path.getmtime(os.path.join(self.directory, name)),
+            )
+            for file_name in file_names:
+                self._sizes[file_name] = os.path.getsize(
+                    os.path.join(self.directory, file_name)
+                )
+
+    def _file_name(self, key: str) -> str:
+        return sha256(key.encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Gets the path of a cached file, or None if it is not cached.
+
+        Args:
+            key (str): Key of the file (eg, its S3 URI)
+        """
+        file_name = self._file_name(key)
+        with self._lock:
+            if file_name not in self._sizes:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._sizes.move_to_end(file_name)
+            return os.path.join(self.directory, file_name)
+
+    def get_or_download(self, key: str, download: Callable[[str], None]) -> str:
+        """Gets the path of a cached file, downloading it if it is not cached.
+
+        Args:
+            key (str): Key of the file (eg, its S3 URI)
+            download (callable): Writes the file to the path it is given (eg, `lambda path: s3.download_file(bucket, key, path)`)
+        """
+        with self._lock:
+            path = self.get(key)
+            if path is not None:
+                return path
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, self._file_name(key))
+            download(path)
+            self._add(path)
+            return path
+
+    def put(self, key: str, data: bytes) -> str:
+        """Caches the content of a file.  Returns its path.
+
+        Args:
+            key (str): Key of the file
+            data (bytes): Content of the file
+        """
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, self._file_name(key))
+            with open(path, "wb") as f:
+                f.write(data)
+            self._add(path)
+            return path
+
+    def _add(self, path: str):
+        file_name = os.path.basename(path)
+        self._sizes[file_name] = os.path.getsize(path)
+        self._sizes.move_to_end(file_name)
+        while sum(self._sizes.values()) > self.max_bytes and len(self._sizes) > 1:
+            evicted, _ = self._sizes.popitem(last=False)
+            os.remove(os.path.join(self.directory, evicted))
+            self.evictions += 1
+
+    def size(self) -> int:
+        """Total size of the cached files, in bytes"""
+        return sum(self._sizes.values())
+
+    def stats(self) -> Dict[str, int]:
+        """Hits, misses, and evictions since the container started"""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+# module level, so that the caches persist across warm invocations
+object_cache = LRUCache(int(os.environ.get("STEP_IN_LINE_OBJECT_CACHE_SIZE", 128)))
+file_cache = FileCache(
+    max_bytes=int(os.environ.get("STEP_IN_LINE_FILE_CACHE_BYTES", 256 << 20))
+)
@@ -0,0 +1,21 @@
+from step_in_line.step import step
+from typing import Callable, Optional
+
+
+def make_step(name: str, action: Optional[Callable] = None, **kwargs):
+    """Creates a step function named name, for tests which need many similar
+        steps.  When run, the step returns action(*args) if given, and its
+        name otherwise.
+
+    Args:
+        name (str): Name of the step
+        action (callable): Optional function of the arguments of the step
+        kwargs: Other options of the step (see `step_in_line.step.step`)
+    """
+
+    def run(*args):
+        if action is None:
+            return name
+        return action(*args)
+
+    return step(name=name, **kwargs)(run)
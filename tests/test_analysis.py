@@ -0,0 +1,87 @@
+from step_in_line.step import step
+from step_in_line.pipeline import Pipeline
+from step_in_line.analysis import (
+    analyze_payloads,
+    samples_from_local_run,
+    sizes_from_profiler,
+)
+from step_in_line.profiling import Profiler
+from tests.helpers import make_step
+import json
+
+
+def fan_pipeline() -> Pipeline:
+    @step
+    def load(arg1: str) -> str:
+        return arg1 * 1000
+
+    data = load("x")
+    copies = [make_step(f"copy_{index}", lambda data: data)(data) for index in range(4)]
+
+    @step(retry_count=2)
+    def combine(*copies) -> int:
+        return len(copies)
+
+    return Pipeline("analyzed", steps=[combine(*copies)])
+
+
+def test_analysis_accumulates_payloads_and_flags_steps():
+    pipe = fan_pipeline()
+    sizes, map_items = samples_from_local_run(pipe, pipe.local_run())
+    assert sizes["load"] == len(json.dumps("x" * 1000))
+    assert map_items == {}
+
+    report = analyze_payloads(pipe, sizes, budget=8000, metadata_bytes=0)
+    states = {state.state: state for state in report.states}
+    assert states["load"].output_bytes > 1000
+    # each branch carries load's output, and adds its own copy
+    assert states["copy_0"].output_bytes > 2000
+    assert states["parallel at 1"].output_bytes > 4 * 2000
+    assert states["combine"].input_bytes == states["parallel at 1"].output_bytes
+    assert report.flagged_steps() == ["copy_0", "copy_1", "copy_2", "copy_3", "combine"]
+    assert report.largest_outputs(1)[0][1] == sizes["load"]
+    assert "over budget: parallel at 1" in report.summary()
+    assert report.missing == []
+
+    # the metadata of each Lambda result adds up too
+    with_metadata = analyze_payloads(pipe, sizes)
+    assert with_metadata.max_payload_bytes == report.max_payload_bytes + 4 * 800
+
+    # transitions and history events
+    execution = report.executions[0]
+    assert execution.transitions == 7
+    assert execution.history_events == pipe.partition_report()[0]["events"]
+    assert report.invocations == 6
+    assert report.cost()["step_functions"] == 7 * 0.000025
+
+
+def test_analysis_counts_map_iterations():
+    @step
+    def list_items(arg1: str) -> list:
+        return [arg1] * 10
+
+    @step(map_over="item", batch_size=3)
+    def process(item: str) -> str:
+        return item.upper()
+
+    @step(map_over="item", batch_size=5, distributed=True, duration=2.0)
+    def upload(item: str) -> str:
+        return item
+
+    pipe = Pipeline("mapped", steps=[upload(process(list_items("a")))])
+    profiler = Profiler(memory=False)
+    outputs = pipe.local_run(profiler=profiler)
+    sizes, map_items = samples_from_local_run(pipe, outputs)
+    assert sizes == sizes_from_profiler(profiler)
+    assert map_items == {"process": 10, "upload": 10}
+
+    report = analyze_payloads(pipe, sizes, map_items)
+    parent, iterations = report.executions
+    # Task, then Parallel, passthrough, items and Map states, and 4 batches
+    assert parent.transitions == 1 + 4 + 4 + 4
+    assert iterations.name == "mapped/upload"
+    assert iterations.executions == 2
+    assert report.transitions == parent.transitions + 2
+    assert report.invocations == 1 + 4 + 2
+    assert report.gb_seconds == 2 * 2.0 * 512 / 1024
+    assert report.over_budget() == []
@@ -0,0 +1,180 @@
+from step_in_line.step import step, when
+from step_in_line.pipeline import Pipeline
+from step_in_line.memoization import DirectoryStore
+from step_in_line.serialization import Serializer
+from step_in_line.distributed import BlobRef, Coordinator, _WorkQueue, parse_address
+import os
+import subprocess
+import sys
+import time
+import pytest
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_workers(coordinator: Coordinator, count: int) -> list:
+    host, port = coordinator.address
+    workers = [
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "step_in_line.distributed",
+                f"127.0.0.1:{port}",
+                "--authkey",
+                "secret",
+                "--reconnect-seconds",
+                "0.1",
+                "--max-disconnected",
+                "30",
+            ],
+            env={**os.environ, "PYTHONPATH": PACKAGE_ROOT},
+        )
+        for _ in range(count)
+    ]
+    deadline = time.monotonic() + 30
+    while len(coordinator.workers) < count:
+        assert time.monotonic() < deadline, "workers did not connect"
+        time.sleep(0.05)
+    return workers
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    coordinator = Coordinator(
+        ("127.0.0.1", 0),
+        authkey=b"secret",
+        heartbeat_interval=0.1,
+        worker_timeout=1.0,
+        blob_store=DirectoryStore(str(tmp_path / "blobs")),
+        inline_limit=1000,
+    )
+    with coordinator:
+        workers = start_workers(coordinator, 2)
+        try:
+            yield coordinator, workers
+        finally:
+            for worker in workers:
+                worker.kill()
+                worker.wait()
+
+
+def test_workers_run_the_steps(cluster):
+    coordinator, _ = cluster
+
+    @step
+    def load(count: int) -> dict:
+        return {"rows": list(range(count)), "name": "data"}
+
+    @step(serializer=Serializer(compression="gzip", threshold=0))
+    def total(rows: list) -> int:
+        return sum(rows)
+
+    @step
+    def check(value: int) -> bool:
+        return value > 0
+
+    @step
+    def small() -> list:
+        return [1, 2, 3]
+
+    @step(map_over="item")
+    def square(item: int, offset: int) -> int:
+        return item * item + offset
+
+    @step
+    def where(label: str) -> int:
+        import os
+        import time
+
+        time.sleep(0.3)
+        return os.getpid()
+
+    @step
+    def other(label: str) -> int:
+        import os
+        import time
+
+        time.sleep(0.3)
+        return os.getpid()
+
+    data = load(1000)
+    has_rows = check(total(data["rows"]))
+    squares = square(small(), 1)
+    when(has_rows, then=[squares])
+    pipe = Pipeline("distributed", steps=[squares, where("a"), other("b")])
+    outputs = dict(
+        output
+        for layer in pipe.local_run(max_workers=4, coordinator=coordinator)
+        for output in layer
+    )
+    # the large output is in the blob store, and resolved by the workers
+    assert isinstance(outputs["load"], BlobRef)
+    assert coordinator.resolve(outputs["load"])["name"] == "data"
+    assert outputs["total"] == sum(range(1000))
+    assert outputs["small"] == [1, 2, 3]
+    assert outputs["square"] == [2, 5, 10]
+    # both workers ran a step at the same time
+    assert outputs["where"] != outputs["other"]
+    assert os.getpid() not in (outputs["where"], outputs["other"])
+
+    @step
+    def fail() -> int:
+        raise ValueError("broken")
+
+    with pytest.raises(RuntimeError, match="broken"):
+        Pipeline("failing", steps=[fail()]).local_run(coordinator=coordinator)
+
+
+def test_steps_of_lost_workers_are_requeued(cluster, tmp_path):
+    coordinator, workers = cluster
+
+    @step
+    def crash_once(marker: str) -> str:
+        import os
+
+        if not os.path.exists(marker):
+            open(marker, "w").close()
+            os._exit(1)  # the worker dies
+        return "done"
+
+    pipe = Pipeline("requeued", steps=[crash_once(str(tmp_path / "marker"))])
+    assert pipe.local_run(coordinator=coordinator) == [[("crash_once", "done")]]
+    assert coordinator.requeued == 1
+    assert sum(worker.poll() is None for worker in workers) == 1
+
+
+def test_steps_fail_without_workers():
+    @step
+    def orphan() -> int:
+        return 1
+
+    pipe = Pipeline("orphaned", steps=[orphan()])
+    coordinator = Coordinator(
+        ("127.0.0.1", 0),
+        authkey=b"secret",
+        heartbeat_interval=0.1,
+        queue_timeout=0.5,
+    )
+    with pytest.raises(RuntimeError, match="not running"):
+        pipe.local_run(coordinator=coordinator)
+    with coordinator:
+        start = time.monotonic()
+        with pytest.raises(RuntimeError, match="No worker connected"):
+            pipe.local_run(coordinator=coordinator)
+        assert time.monotonic() - start < 5
+
+
+def test_parse_address():
+    assert parse_address("coordinator:1234") == ("coordinator", 1234)
+    assert parse_address("coordinator") == ("coordinator", 50050)
+    with pytest.raises(ValueError):
+        Coordinator(authkey=b"")
+
+
+def test_waiting_for_a_result_times_out():
+    queue = _WorkQueue(0.1, 1.0, 3, {})
+    task_id = queue.submit({"name": "slow"})
+    assert queue.wait(task_id, 0.05) is None
+    queue.close()
+    assert queue.wait(task_id, 0.05)[1] is False
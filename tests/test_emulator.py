@@ -0,0 +1,135 @@
+from step_in_line.step import step, when
+from step_in_line.pipeline import Pipeline, EXECUTION_EVENTS, RETRY_EVENTS
+from step_in_line.emulator import Emulator, get_path, resolve_parameters
+
+
+def local_outputs(pipe: Pipeline) -> dict:
+    return {name: output for layer in pipe.local_run() for name, output in layer}
+
+
+def test_get_path_and_parameters():
+    data = [[{"Payload": {"a": 1}}, {"Payload": {"a": 2}}], {"Payload": {"b": [3]}}]
+    assert get_path(data, "$[1].Payload.b[0]") == 3
+    assert get_path(data, "$[0][*].Payload.a") == [1, 2]
+    context = {"Map": {"Item": {"Value": "x"}}}
+    assert resolve_parameters(
+        {
+            "Items.$": "States.ArrayPartition($[1].Payload.b, 2)",
+            "Item.$": "States.Array($$.Map.Item.Value)",
+            "Fixed": {"a": 1},
+        },
+        data,
+        context,
+    ) == {"Items": [[3]], "Item": ["x"], "Fixed": {"a": 1}}
+
+
+def test_emulator_runs_parallel_map_and_conditional_steps():
+    @step
+    def list_partitions(arg1: str) -> list:
+        return ["a", "b", "c"]
+
+    @step
+    def config(arg1: str) -> str:
+        return "!"
+
+    @step(map_over="partition", batch_size=2, max_concurrency=4)
+    def process(partition: str, suffix: str) -> str:
+        return partition + suffix
+
+    @step
+    def check(results: list) -> bool:
+        return len(results) > 5
+
+    @step
+    def alert(results: list) -> str:
+        return "too many"
+
+    @step
+    def report(results: list) -> str:
+        return ",".join(results)
+
+    results = process(list_partitions("hi"), config("hi"))
+    has_many = check(results)
+    alerted = alert(results)
+    when(has_many, then=[alerted])
+    pipe = Pipeline("emulated", steps=[report(results), alerted])
+
+    with Emulator(pipe, max_workers=1, cold_start_seconds=0.5) as emulator:
+        report_ = emulator.run()
+        assert report_.payload == local_outputs(pipe)
+        assert report_.payload["report"] == "a!,b!,c!"
+        assert "alert" not in report_.payload
+        # two batches of the map, and alert is skipped
+        assert report_.invocations == 6
+        # the worker is cold for each of the 5 Lambdas invoked
+        assert report_.cold_starts == 5
+        assert report_.latency >= 0.5 * 3  # a cold start per layer
+        assert report_.history_events == {
+            "emulated": report_.history_events["emulated"]
+        }
+        assert report_.history_events["emulated"] > EXECUTION_EVENTS
+        states = {transition.state for transition in report_.transitions}
+        assert {"map process", "process iteration", "alert condition"} <= states
+        assert report_.max_payload_bytes > 0
+        assert report_.oversized() == []
+
+        warm = emulator.run()
+        assert warm.output == report_.output
+        assert warm.cold_starts == 0
+        assert warm.latency < report_.latency
+
+
+def test_emulator_maps_over_a_selected_list():
+    @step
+    def source(arg1: str) -> dict:
+        return {"items": [1, 2, 3], "offset": 10}
+
+    @step(map_over="item")
+    def shift(item: int, offset: int) -> int:
+        return item + offset
+
+    data = source("hi")
+    pipe = Pipeline("selected", steps=[shift(data["items"], data["offset"])])
+
+    with Emulator(pipe, max_workers=1, cold_start_seconds=0) as emulator:
+        report_ = emulator.run()
+    assert report_.payload == local_outputs(pipe)
+    assert report_.payload["shift"] == [11, 12, 13]
+
+
+def test_emulator_retries_and_runs_child_state_machines(tmp_path):
+    marker = str(tmp_path / "failed_once")
+
+    @step(retry_count=1)
+    def flaky(marker: str) -> str:
+        import os
+
+        if not os.path.exists(marker):
+            open(marker, "w").close()
+            raise RuntimeError("first attempt fails")
+        return "ok"
+
+    @step
+    def first(value: str) -> str:
+        return value + " first"
+
+    @step
+    def last(value: str) -> str:
+        return value + " last"
+
+    pipe = Pipeline(
+        "emulated",
+        steps=[last(first(flaky(marker)))],
+        partition=True,
+        max_partition_states=2,
+    )
+    assert len(pipe.generate_child_step_functions()) == 2
+
+    with Emulator(pipe, max_workers=1, cold_start_seconds=0) as emulator:
+        report_ = emulator.run()
+    assert report_.payload["last"] == "ok first last"
+    assert report_.invocations == 4
+    assert report_.latency >= 15  # simulated retry interval
+    children = [name for name in report_.history_events if name != "emulated"]
+    assert len(children) == 2
+    assert sum(report_.history_events[name] for name in children) >= RETRY_EVENTS
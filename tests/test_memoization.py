@@ -0,0 +1,90 @@
+from step_in_line.memoization import (
+    DirectoryStore,
+    ResultStore,
+    SQLiteStore,
+    memoize,
+    store_from_options,
+)
+from step_in_line.step import step
+from step_in_line.pipeline import Pipeline
+from concurrent.futures import ThreadPoolExecutor
+import json
+import pytest
+
+
+@pytest.mark.parametrize("store_class", [DirectoryStore, SQLiteStore])
+def test_stores_expire_results(tmp_path, store_class):
+    store = store_class(str(tmp_path / "cache"), ttl=60)
+    assert store.get("key") == (False, None)
+    store.put("key", {"rows": 3})
+    assert store.get("key") == (True, {"rows": 3})
+    expired = store_from_options({**store.options(), "ttl": -1})
+    expired.put("old", 1)
+    assert expired.get("old") == (False, None)
+
+
+def test_stores_implement_get_and_put():
+    class Incomplete(ResultStore):
+        def get(self, key):
+            return False, None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_memoize_keys_on_code_and_arguments(tmp_path):
+    store = DirectoryStore(str(tmp_path))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert memoize(store, "code", compute, ["a"]) == (1, False)
+    assert memoize(store, "code", compute, ["a"]) == (1, True)
+    assert memoize(store, "code", compute, ["b"]) == (2, False)
+    assert memoize(store, "new code", compute, ["a"]) == (3, False)
+
+
+def test_pipeline_runs_cached_steps_once(tmp_path):
+    calls = []
+
+    @step(cache=DirectoryStore(str(tmp_path)))
+    def expensive_query(arg1: str) -> dict:
+        calls.append(arg1)
+        return {"rows": 3}
+
+    @step
+    def report(result: dict) -> str:
+        return json.dumps(result)
+
+    pipe = Pipeline("mytest", steps=[report(expensive_query("select 1"))])
+    assert pipe.local_run() == pipe.local_run()
+    assert calls == ["select 1"]
+    assert pipe.cache_stats == {"hits": 1, "misses": 0}
+
+
+def test_concurrent_runs_count_their_own_cache_lookups(tmp_path):
+    store = DirectoryStore(str(tmp_path))
+
+    @step(cache=store)
+    def first_query(arg1: str) -> dict:
+        import time
+
+        time.sleep(0.1)
+        return {"rows": 1}
+
+    @step(cache=store)
+    def second_query(result: dict) -> dict:
+        import time
+
+        time.sleep(0.1)
+        return {"rows": result["rows"] + 1}
+
+    pipe = Pipeline("mytest", steps=[second_query(first_query("select 1"))])
+    with ThreadPoolExecutor(2) as executor:
+        runs = [executor.submit(pipe.local_run) for _ in range(2)]
+        outputs = [run.result() for run in runs]
+    assert outputs[0] == outputs[1]
+    # the counts of the latest run, rather than of both
+    assert sum(pipe.cache_stats.values()) == 2
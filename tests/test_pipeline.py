@@ -1,5 +1,11 @@
-from step_in_line.step import step
+from step_in_line.step import step, when
 from step_in_line.pipeline import Pipeline
+from step_in_line.serialization import Serializer
+from step_in_line.packaging import package_lambda
+from tests.helpers import make_step
+from importlib import resources as impresources
+import pickle
+import zipfile
 import pytest
 
 
@@ -90,3 +96,551 @@ def test_pipeline_runs_locally():
     assert "hello2" == results[1][0][1]
     assert "hello3" == results[1][1][1]
     assert "goodbye" == results[2][0][1]
+
+
+def test_pipeline_dispatcher_passes_step_name():
+    @step
+    def preprocess(arg1: str) -> str:
+        return "hello"
+
+    @step
+    def train(arg1: str) -> str:
+        return "goodbye"
+
+    pipe = Pipeline(
+        "mytest",
+        steps=[train(preprocess("hi"))],
+        generate_step_name=lambda s: "dispatcher_arn",
+        dispatcher=True,
+    )
+    states = pipe.generate_step_functions()["States"]
+    assert states["train"]["Parameters"] == {
+        "FunctionName": "dispatcher_arn",
+        "Payload": {"StepName": "train", "Input.$": "$"},
+    }
+
+
+def test_pipeline_fuses_linear_chains():
+    @step
+    def preprocess(arg1: str) -> str:
+        return "hello"
+
+    @step
+    def preprocess_2(arg1: str) -> str:
+        return "hello"
+
+    @step
+    def preprocess_3(arg1: str) -> str:
+        return "hello"
+
+    @step
+    def train(arg1: str, arg2: str) -> str:
+        return "goodbye"
+
+    @step
+    def evaluate(arg1: str) -> str:
+        return "done"
+
+    step_process_result = preprocess("hi")
+    step_process_result_2 = preprocess_2(step_process_result)
+    step_process_result_3 = preprocess_3(step_process_result)
+    step_evaluate_result = evaluate(train(step_process_result_2, step_process_result_3))
+
+    pipe = Pipeline("mytest", steps=[step_evaluate_result], fuse=True)
+    states = pipe.generate_step_functions()["States"]
+    assert list(states.keys()) == ["preprocess", "parallel at 1", "train_to_evaluate"]
+    assert states["train_to_evaluate"]["Parameters"]["Payload"] == {
+        "StepName": "train_to_evaluate",
+        "Input.$": "$",
+    }
+    # outputs of fused steps are unchanged when running locally
+    assert pipe.local_run()[-1] == [("evaluate", "done")]
+    # the compiled graph is computed once
+    assert pipe.compile_graph() is pipe.compile_graph()
+
+    @step(name="train_to_evaluate")
+    def collides(arg1: str) -> str:
+        return "collides"
+
+    pipe = Pipeline("mytest", steps=[step_evaluate_result, collides("hi")], fuse=True)
+    with pytest.raises(ValueError, match="train_to_evaluate"):
+        pipe.generate_step_functions()
+
+
+def test_pipeline_does_not_fuse_steps_which_opt_out():
+    @step
+    def preprocess(arg1: str) -> str:
+        return "hello"
+
+    @step(fuse=False)
+    def train(arg1: str) -> str:
+        return "goodbye"
+
+    @step
+    def evaluate(arg1: str) -> str:
+        return "done"
+
+    pipe = Pipeline("mytest", steps=[evaluate(train(preprocess("hi")))], fuse=True)
+    states = pipe.generate_step_functions()["States"]
+    assert list(states.keys()) == ["preprocess", "train", "evaluate"]
+
+
+def test_pipeline_packs_small_siblings():
+    @step
+    def preprocess(arg1: str) -> str:
+        return "hello"
+
+    @step(duration=0.05)
+    def preprocess_2(arg1: str) -> str:
+        return "hello"
+
+    @step(duration=0.05)
+    def preprocess_3(arg1: str) -> str:
+        return "hello"
+
+    @step
+    def preprocess_4(arg1: str) -> str:
+        return "hello"
+
+    @step
+    def train(arg1: str, arg2: str, arg3: str) -> str:
+        return "goodbye"
+
+    step_process_result = preprocess("hi")
+    step_train_result = train(
+        preprocess_2(step_process_result),
+        preprocess_3(step_process_result),
+        preprocess_4(step_process_result),
+    )
+
+    pipe = Pipeline("mytest", steps=[step_train_result], pack=True)
+    states = pipe.generate_step_functions()["States"]
+    branches = states["parallel at 1"]["Branches"]
+    assert [branch["StartAt"] for branch in branches] == [
+        "packed_preprocess_2",
+        "preprocess_4",
+    ]
+
+    # profiled timings make preprocess_4 small enough to pack too
+    pipe = Pipeline(
+        "mytest",
+        steps=[step_train_result],
+        pack=True,
+        durations={"preprocess_4": 0.2},
+    )
+    states = pipe.generate_step_functions()["States"]
+    assert list(states.keys()) == ["preprocess", "packed_preprocess_2", "train"]
+
+    @step(name="packed_preprocess_2")
+    def collides(arg1: str) -> str:
+        return "collides"
+
+    pipe = Pipeline("mytest", steps=[step_train_result, collides("hi")], pack=True)
+    with pytest.raises(ValueError, match="packed_preprocess_2"):
+        pipe.compile_graph()
+
+
+def test_pipeline_partitions_into_child_state_machines():
+    start = make_step("start")("hi")
+    fan = [make_step(f"fan_{index}")(start) for index in range(3)]
+    end = make_step("last")(make_step("second")(make_step("first")(*fan)))
+
+    pipe = Pipeline("mytest", steps=[end])
+    assert pipe.generate_child_step_functions() == {}
+
+    pipe = Pipeline("mytest", steps=[end], partition=True, max_partition_states=6)
+    # cut after "first", where one edge crosses, rather than after the fan
+    report = pipe.partition_report()
+    assert [(p["name"], p["steps"], p["states"]) for p in report] == [
+        ("mytest", 0, 2),
+        ("mytest_part_0", 5, 6),
+        ("mytest_part_1", 2, 2),
+    ]
+    assert report[1]["events"] == 2 + 5 * 5 + 4
+
+    children = pipe.generate_child_step_functions()
+    assert list(children["mytest_part_0"]["States"].keys()) == [
+        "start",
+        "parallel at 1",
+        "first",
+    ]
+    assert children["mytest_part_1"]["StartAt"] == "second"
+
+    states = pipe.generate_step_functions()["States"]
+    assert states["mytest_part_0"] == {
+        "Type": "Task",
+        "Resource": "arn:aws:states:::states:startExecution.sync:2",
+        "Parameters": {
+            "StateMachineArn": "${aws_sfn_state_machine.mytest_part_0.arn}",
+            "Input.$": "$",
+        },
+        "OutputPath": "$.Output",
+        "Next": "mytest_part_1",
+    }
+
+
+def test_pipeline_nests_short_segments_in_express_workflows():
+    start = make_step("start", duration=1)("hi")
+    fan = [make_step(f"fan_{index}", duration=2)(start) for index in range(3)]
+    first = make_step("first")(*fan)  # unknown duration
+    second = make_step("second", duration=1)(first)
+    last = make_step("last", duration=1, retry_count=1)(second)
+
+    pipe = Pipeline("mytest", steps=[last], nest_express=True)
+    state_machines = pipe.generate_state_machines()
+    assert {name: spec.workflow_type for name, spec in state_machines.items()} == {
+        "mytest": "STANDARD",
+        "mytest_express_0": "EXPRESS",
+    }
+    states = pipe.generate_step_functions()["States"]
+    # a lone short step is not worth nesting, and steps with retries are never nested
+    assert list(states.keys()) == ["mytest_express_0", "first", "second", "last"]
+    assert (
+        states["mytest_express_0"]["Resource"]
+        == "arn:aws:states:::states:startExecution.sync:2"
+    )
+    children = pipe.generate_child_step_functions()
+    assert list(children["mytest_express_0"]["States"].keys()) == [
+        "start",
+        "parallel at 1",
+    ]
+
+    pipe = Pipeline("mytest", steps=[last], nest_express=True, express_max_duration=1.5)
+    assert pipe.generate_child_step_functions() == {}
+
+
+def test_pipeline_checks_workflow_type():
+    @step
+    def preprocess(arg1: str) -> str:
+        return "hello"
+
+    pipe = Pipeline("mytest", steps=[preprocess("hi")], workflow_type="EXPRESS")
+    assert pipe.partition_report()[0]["type"] == "EXPRESS"
+    with pytest.raises(ValueError):
+        Pipeline("mytest", steps=[preprocess("hi")], workflow_type="FAST")
+    with pytest.raises(ValueError):
+        Pipeline(
+            "mytest",
+            steps=[preprocess("hi")],
+            workflow_type="EXPRESS",
+            nest_express=True,
+        )
+
+
+def test_pipeline_compiles_map_steps():
+    @step
+    def list_partitions(arg1: str) -> list:
+        return ["a", "b", "c"]
+
+    @step
+    def config(arg1: str) -> str:
+        return "!"
+
+    @step(map_over="partition", batch_size=2, max_concurrency=4)
+    def process(partition: str, suffix: str) -> str:
+        return partition + suffix
+
+    @step
+    def report(results: list) -> str:
+        return ",".join(results)
+
+    partitions = list_partitions("hi")
+    report_result = report(process(partitions, config("hi")))
+    pipe = Pipeline("mytest", steps=[report_result])
+
+    assert pipe.local_run()[1:] == [
+        [("process", ["a!", "b!", "c!"])],
+        [("report", "a!,b!,c!")],
+    ]
+
+    states = pipe.generate_step_functions()["States"]
+    assert list(states.keys()) == ["parallel at 0", "map process", "report"]
+    passthrough, map_branch = states["map process"]["Branches"]
+    assert passthrough["States"]["process passthrough"]["Type"] == "Pass"
+    assert map_branch["States"]["process items"]["Parameters"] == {
+        "MapItems.$": "States.ArrayPartition($[0].Payload.list_partitions, 2)",
+        "Input.$": "$",
+    }
+    map_state = map_branch["States"]["process"]
+    assert map_state["ItemsPath"] == "$.MapItems"
+    assert map_state["MaxConcurrency"] == 4
+    assert map_state["ItemSelector"] == {
+        "MapItems.$": "$$.Map.Item.Value",
+        "Payload": {"config.$": "$.Input[1].Payload.config"},
+    }
+    assert map_state["ResultSelector"] == {"Payload": {"process.$": "$[*][*]"}}
+    assert map_state["ItemProcessor"]["ProcessorConfig"] == {"Mode": "INLINE"}
+    iteration = map_state["ItemProcessor"]["States"]["process iteration"]
+    assert iteration["OutputPath"] == "$.Payload"
+
+
+def test_pipeline_compiles_distributed_map_over_static_items():
+    @step(map_over="item", batch_size=100, distributed=True)
+    def process(item: int) -> int:
+        return item * 2
+
+    pipe = Pipeline("mytest", steps=[process(list(range(1000)))])
+    assert pipe.uses_distributed_map()
+    assert pipe.local_run() == [[("process", [item * 2 for item in range(1000)])]]
+    map_branch = pipe.generate_step_functions()["States"]["map process"]["Branches"][1]
+    assert map_branch["States"]["process items"]["Parameters"]["MapItems"] == list(
+        range(1000)
+    )
+    map_state = map_branch["States"]["process"]
+    assert map_state["ItemBatcher"] == {"MaxItemsPerBatch": 100}
+    assert map_state["ItemProcessor"]["ProcessorConfig"] == {
+        "Mode": "DISTRIBUTED",
+        "ExecutionType": "STANDARD",
+    }
+    with pytest.raises(ValueError, match="distributed"):
+        Pipeline("mytest", steps=[process(list(range(1000)))], workflow_type="EXPRESS")
+
+
+def test_pipeline_skips_conditional_steps():
+    @step
+    def check(arg1: str) -> bool:
+        return arg1 == "new files"
+
+    @step
+    def load(arg1: str) -> str:
+        return arg1 + " loaded"
+
+    @step
+    def transform(loaded: str) -> str:
+        return loaded + " and transformed"
+
+    @step
+    def summary(has_files: bool) -> str:
+        return "done"
+
+    def build(arg1: str) -> Pipeline:
+        has_files = check(arg1)
+        loaded = load(arg1)
+        when(has_files, then=[loaded])
+        return Pipeline(
+            "mytest", steps=[transform(loaded), summary(has_files)], fuse=True
+        )
+
+    assert build("nothing").local_run() == [
+        [("check", False)],
+        [("summary", "done")],
+        [],
+    ]
+    pipe = build("new files")
+    assert pipe.local_run()[2] == [("transform", "new files loaded and transformed")]
+    # conditional steps are never fused
+    assert len(pipe.get_compiled_steps()) == 4
+
+    states = pipe.generate_step_functions()["States"]
+    assert list(states.keys()) == ["check", "parallel at 1", "when transform"]
+    when_load = states["parallel at 1"]["Branches"][0]["States"]["when load"]
+    passthrough, conditional_branch = when_load["Branches"]
+    assert passthrough["States"]["load passthrough"]["Type"] == "Pass"
+    assert conditional_branch["StartAt"] == "load condition"
+    choice = conditional_branch["States"]["load condition"]
+    assert choice["Choices"] == [
+        {
+            "And": [
+                {"Variable": "$.Payload.check", "IsPresent": True},
+                {"Variable": "$.Payload.check", "BooleanEquals": True},
+            ],
+            "Next": "load",
+        }
+    ]
+    assert choice["Default"] == "load skipped"
+    assert conditional_branch["States"]["load skipped"]["Result"] == {"Payload": {}}
+    assert conditional_branch["States"]["load"]["End"]
+    # transform inherits the condition of the step it depends on
+    choice = states["when transform"]["Branches"][1]["States"]["transform condition"]
+    assert choice["Choices"][0]["And"][0] == {
+        "Variable": "$[0][0].Payload.check",
+        "IsPresent": True,
+    }
+
+
+def test_pipeline_passes_selected_fields():
+    @step
+    def listing(prefix: str) -> dict:
+        return {"files": [prefix + "a", prefix + "b"], "options": {"suffix": "!"}}
+
+    @step(map_over="file")
+    def process(file: str, suffix: str) -> str:
+        return file + suffix
+
+    @step
+    def count(files: list) -> int:
+        return len(files)
+
+    files = listing("s3://")
+    processed = process(files["files"], files["options"]["suffix"])
+    pipe = Pipeline("mytest", steps=[processed, count(files["files"])])
+    assert pipe.local_run()[1] == [
+        ("process", ["s3://a!", "s3://b!"]),
+        ("count", 2),
+    ]
+
+    states = pipe.generate_step_functions()["States"]
+    map_branch = states["parallel at 1"]["Branches"][0]["States"]["map process"][
+        "Branches"
+    ][1]
+    assert map_branch["States"]["process items"]["Parameters"] == {
+        "MapItems.$": "$.Payload.listing.files",
+        "Input.$": "$",
+    }
+    # each iteration only receives the selected field
+    assert map_branch["States"]["process"]["ItemSelector"]["Payload"] == {
+        "listing": {"options": {"suffix.$": "$.Input.Payload.listing.options.suffix"}}
+    }
+
+
+def test_pipeline_serializes_outputs():
+    @step
+    def check(arg1: str) -> bool:
+        return True
+
+    @step(serializer=Serializer(compression="gzip"))
+    def listing(arg1: str) -> tuple:
+        return ("a", "b")
+
+    @step
+    def count(files: list) -> int:
+        return len(files)
+
+    has_files = check("hi")
+    files = listing("hi")
+    pipe = Pipeline(
+        "mytest", steps=[count(files)], serializer=Serializer(compression="gzip")
+    )
+    # outputs are round-tripped as downstream steps receive them
+    assert pipe.local_run()[0] == [("listing", ["a", "b"])]
+
+    when(has_files, then=[files])
+    with pytest.raises(ValueError):
+        # the predicate is read by a Choice state, so can not be compressed
+        Pipeline(
+            "mytest", steps=[count(files)], serializer=Serializer(compression="gzip")
+        )
+
+
+def test_pipelines_sharing_a_step_keep_their_own_serializer(tmp_path):
+    @step
+    def check(arg1: str) -> bool:
+        return True
+
+    @step
+    def listing(arg1: str) -> tuple:
+        return ("a", "b")
+
+    @step
+    def count(files: list) -> int:
+        return len(files)
+
+    has_files = check("hi")
+    files = listing("hi")
+    compressed = Serializer(compression="gzip")
+    pipe_compressed = Pipeline(
+        "compressed", steps=[count(files)], serializer=compressed
+    )
+    pipe_plain = Pipeline("plain", steps=[count(files)])
+    # the shared steps are left unchanged
+    assert files.serializer is None
+    assert pipe_compressed._serializer_for(files) is compressed
+    assert pipe_plain._serializer_for(files) is None
+    # only the outputs of the compressed pipeline are round-tripped
+    assert pipe_compressed.local_run()[0] == [("listing", ["a", "b"])]
+    assert pipe_plain.local_run()[0] == [("listing", ("a", "b"))]
+
+    for pipe in [pipe_compressed, pipe_plain]:
+        zip_name = str(tmp_path / f"{pipe.name}.zip")
+        package_lambda(
+            impresources.files("step_in_line") / "template_lambda.py",
+            files,
+            "index",
+            zip_name,
+            pipe.serializer,
+        )
+        with zipfile.ZipFile(zip_name) as zf:
+            options = (
+                pickle.loads(zf.read("options.pickle"))
+                if "options.pickle" in zf.namelist()
+                else {}
+            )
+        assert options.get("serializer") == (
+            compressed.options() if pipe is pipe_compressed else None
+        )
+
+    when(has_files, then=[files])
+    with pytest.raises(ValueError):
+        # the predicate is read by a Choice state, so can not be compressed
+        Pipeline("compressed", steps=[count(files)], serializer=compressed)
+    Pipeline("plain", steps=[count(files)])
+
+
+def test_pipeline_crawls_deep_and_shared_graphs():
+    @step
+    def link(*args: str) -> str:
+        return "hello"
+
+    # deeper than the recursion limit
+    current = step(name="link_0")(link)("hi")
+    for index in range(1, 3000):
+        current = step(name=f"link_{index}")(link)(current)
+    pipe = Pipeline("chain", steps=[current])
+    assert len(pipe.get_steps()) == 3000
+    assert len(pipe.generate_step_functions()["States"]) == 3000
+
+    # many outputs sharing their ancestors
+    root = step(name="root")(link)("hi")
+    outputs = [step(name=f"output_{index}")(link)(root) for index in range(100)]
+    pipe = Pipeline("fan", steps=outputs)
+    assert len(pipe.get_steps()) == 101
+    assert pipe.graph.number_of_edges() == 100
+
+
+def test_pipeline_admits_steps_within_memory_and_cpu_budgets():
+    import threading
+    import time
+
+    lock = threading.Lock()
+    usage = {"memory": 0, "cpus": 0, "peak_memory": 0, "peak_cpus": 0}
+    started = []
+
+    def budgeted_step(name: str, memory_size: int, cpus: int = None):
+        def occupy() -> str:
+            with lock:
+                started.append(name)
+                usage["memory"] += memory_size
+                usage["cpus"] += cpus or 1
+                usage["peak_memory"] = max(usage["peak_memory"], usage["memory"])
+                usage["peak_cpus"] = max(usage["peak_cpus"], usage["cpus"])
+            time.sleep(0.05)
+            with lock:
+                usage["memory"] -= memory_size
+                usage["cpus"] -= cpus or 1
+            return name
+
+        return make_step(name, occupy, memory_size=memory_size, cpus=cpus)
+
+    big = [budgeted_step(f"big_{index}", 3072)() for index in range(2)]
+    small = [budgeted_step(f"small_{index}", 256)() for index in range(4)]
+    pipe = Pipeline("budget", steps=big + small)
+    outputs = pipe.local_run(max_workers=4, memory_budget=4096)
+    assert len(outputs[0]) == 6
+    # the second big step waits, and the small steps fill the capacity left
+    assert usage["peak_memory"] <= 4096
+    assert started[:2] == ["big_0", "small_0"]
+
+    # a step larger than the budget runs on its own
+    usage["peak_memory"] = 0
+    pipe = Pipeline("too_big", steps=[budgeted_step("huge", 8192)(), *small])
+    pipe.local_run(max_workers=4, memory_budget=4096)
+    assert usage["peak_memory"] == 8192
+
+    usage["peak_cpus"] = 0
+
+    pipe = Pipeline(
+        "cpus",
+        steps=[budgeted_step(f"threaded_{index}", 128, cpus=2)() for index in range(3)],
+    )
+    pipe.local_run(max_workers=3, cpu_budget=3)
+    assert usage["peak_cpus"] == 2
@@ -0,0 +1,79 @@
+from step_in_line.step import step
+from step_in_line.pipeline import Pipeline
+from step_in_line.profiling import Profiler
+import json
+import time
+
+
+def pipeline() -> Pipeline:
+    @step
+    def load(source: str) -> list:
+        return list(range(1000))
+
+    @step
+    def slow(data: list) -> int:
+        time.sleep(0.2)
+        return len(data)
+
+    @step
+    def fast(data: list) -> int:
+        time.sleep(0.05)
+        return sum(data)
+
+    @step
+    def combine(count: int, total: int) -> float:
+        return total / count
+
+    data = load("s3://bucket/data")
+    return Pipeline("profiled", steps=[combine(slow(data), fast(data))])
+
+
+def test_parallel_local_run_matches_serial():
+    serial = pipeline().local_run()
+    profiler = Profiler(memory=False)
+    parallel = pipeline().local_run(max_workers=4, profiler=profiler)
+    assert parallel == serial
+    assert serial[-1] == [("combine", 499.5)]
+    # the independent steps ran at the same time
+    slow, fast = profiler.profiles["slow"], profiler.profiles["fast"]
+    assert fast.start < slow.end and slow.start < fast.end
+
+
+def test_profiler_records_steps_and_exports_trace(tmp_path):
+    pipe = pipeline()
+    profiler = Profiler()
+    pipe.local_run(profiler=profiler)
+
+    assert set(profiler.profiles) == {"load", "slow", "fast", "combine"}
+    assert profiler.profiles["slow"].wall >= 0.2
+    assert profiler.profiles["slow"].cpu < 0.1  # sleeping
+    assert profiler.profiles["load"].peak_memory > 0
+    assert profiler.profiles["load"].output_bytes == len(json.dumps(list(range(1000))))
+    assert profiler.critical_path(pipe.graph) == ["load", "slow", "combine"]
+    assert "critical path" in profiler.summary(pipe.graph)
+
+    profiler.write_chrome_trace(tmp_path / "trace.json")
+    with open(tmp_path / "trace.json") as f:
+        trace = json.load(f)
+    steps = [event for event in trace["traceEvents"] if event["cat"] == "step"]
+    assert sorted(event["name"] for event in steps) == [
+        "combine",
+        "fast",
+        "load",
+        "slow",
+    ]
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in steps)
+
+
+def test_profiler_records_queueing_in_parallel_runs():
+    profiler = Profiler(memory=False)
+    pipeline().local_run(max_workers=1, profiler=profiler)
+    assert all(profile.queued == 0 for profile in profiler.profiles.values())
+
+    profiler = Profiler()
+    outputs = pipeline().local_run(max_workers=2, profiler=profiler)
+    assert outputs[-1] == [("combine", 499.5)]
+    assert all(profile.queued >= 0 for profile in profiler.profiles.values())
+    # overlapping steps get no peak memory, steps which ran alone do
+    assert profiler.profiles["slow"].peak_memory is None
+    assert profiler.profiles["load"].peak_memory > 0
@@ -0,0 +1,100 @@
+from step_in_line.step import step
+from step_in_line.pipeline import Pipeline
+from step_in_line.registry import LambdaRegistry
+from step_in_line.tf_json import StepInLineJson, StepInLineRegistryJson
+import json
+import pytest
+
+
+@step
+def extract(source: str) -> str:
+    return source
+
+
+def pipelines():
+    @step
+    def report(data: str) -> str:
+        return data
+
+    @step(memory_size=1024)
+    def train(data: str) -> str:
+        return data
+
+    reporting = Pipeline("reporting", steps=[report(extract("s3://bucket/data"))])
+    training = Pipeline("training", steps=[train(extract("s3://bucket/data"))])
+    return reporting, training
+
+
+def test_registry_deploys_identical_lambdas_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    registry = LambdaRegistry()
+    reporting, training = pipelines()
+    reporting_config = StepInLineJson(reporting, "us-east-1", registry=registry)
+    training_config = StepInLineJson(training, "us-east-1", registry=registry)
+    registry_config = StepInLineRegistryJson(registry, "us-east-1")
+
+    shared = registry_config.to_dict()["resource"]["aws_lambda_function"]
+    assert len(shared) == 3  # extract, report, and train
+    assert registry_config.resource_counts["aws_lambda_function"] == 3
+
+    reporting_lambdas = reporting_config.to_dict()["data"]["aws_lambda_function"]
+    training_lambdas = training_config.to_dict()["data"]["aws_lambda_function"]
+    assert (
+        reporting_lambdas["extract"]["function_name"]
+        == training_lambdas["extract"]["function_name"]
+    )
+    assert {lambda_f["function_name"] for lambda_f in shared.values()} == {
+        lambda_f["function_name"]
+        for lambda_f in [*reporting_lambdas.values(), *training_lambdas.values()]
+    }
+    assert "aws_lambda_function" not in reporting_config.to_dict()["resource"]
+    definition = json.loads(
+        reporting_config.to_dict()["resource"]["aws_sfn_state_machine"]["reporting"][
+            "definition"
+        ]
+    )
+    assert (
+        definition["States"]["extract"]["Parameters"]["FunctionName"]
+        == "${data.aws_lambda_function.extract.arn}"
+    )
+
+
+def test_registry_distinguishes_configuration(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    registry = LambdaRegistry()
+    reporting = Pipeline("reporting", steps=[extract("s3://bucket/data")])
+    larger = extract("s3://bucket/data")
+    larger.memory_size = 2048
+    training = Pipeline("training", steps=[larger])
+    assert registry.register(reporting) != registry.register(training)
+    assert len(registry.shared_steps()) == 2
+
+
+def test_registry_rejects_dispatcher_mode(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pipe = Pipeline("reporting", steps=[extract("s3://bucket/data")], dispatcher=True)
+    with pytest.raises(ValueError):
+        LambdaRegistry().register(pipe)
+
+
+def test_registry_updates_changed_pipelines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    registry = LambdaRegistry()
+    first = registry.register(Pipeline("reporting", steps=[extract("s3://bucket/a")]))
+    second = registry.register(Pipeline("reporting", steps=[extract("s3://bucket/b")]))
+    assert first != second
+    # the Lambda of the previous version is no longer deployed
+    assert len(registry.shared_steps()) == 1
+    assert registry.shared_steps()[0].args == ["s3://bucket/b"]
+
+
+def test_registry_rejects_lambda_overrides(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pipe = Pipeline("reporting", steps=[extract("s3://bucket/data")])
+    with pytest.raises(ValueError):
+        StepInLineJson(
+            pipe,
+            "us-east-1",
+            registry=LambdaRegistry(),
+            lambda_overrides={"extract": {"memory_size": 1024}},
+        )
@@ -0,0 +1,99 @@
+from step_in_line.step import step
+from step_in_line.pipeline import Pipeline
+from step_in_line.runtimes import (
+    JSONRuntimeStore,
+    RuntimeStore,
+    SQLiteRuntimeStore,
+    step_fingerprint,
+    upward_ranks,
+)
+from tests.helpers import make_step
+import time
+import pytest
+
+
+@pytest.mark.parametrize("store_class", [JSONRuntimeStore, SQLiteRuntimeStore])
+def test_store_keeps_recent_durations_per_code(tmp_path, store_class):
+    store = store_class(str(tmp_path / "runtimes"), window=3)
+    assert store.estimate("load", "abc") is None
+    for duration in [10.0, 1.0, 2.0, 3.0]:
+        store.record({("load", "abc"): duration, ("save", "abc"): 5.0})
+    assert store.durations("load", "abc") == [1.0, 2.0, 3.0]
+    assert store.estimate("load", "abc") == 2.0
+    assert store.estimate("save", "abc") == 5.0
+    # changing the code of a step starts its history afresh
+    assert store.estimate("load", "def") is None
+
+
+def test_stores_implement_durations_and_record():
+    class Incomplete(RuntimeStore):
+        def durations(self, name, fingerprint):
+            return []
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def pipeline(started: list) -> Pipeline:
+    @step
+    def slow() -> int:
+        started.append("slow")
+        time.sleep(0.2)
+        return 1
+
+    def recorded_step(name: str):
+        return make_step(name, lambda *args: started.append(name))
+
+    chains = [
+        recorded_step(f"{chain}_2")(recorded_step(f"{chain}_1")())
+        for chain in ["a", "b"]
+    ]
+    return Pipeline("ranked", steps=[slow(), *chains])
+
+
+def test_history_puts_the_critical_path_first(tmp_path):
+    started = []
+    pipe = pipeline(started)
+    ranks = pipe.step_ranks()
+    # no durations: ranks count the remaining steps
+    assert ranks == {"slow": 1.0, "a_1": 2.0, "a_2": 1.0, "b_1": 2.0, "b_2": 1.0}
+    store = SQLiteRuntimeStore(str(tmp_path / "runtimes.db"))
+    pipe.local_run(max_workers=2, runtimes=store)
+    assert set(started[:2]) == {"a_1", "b_1"}
+    slow = [step for step in pipe.get_steps() if step.name == "slow"][0]
+    assert store.estimate("slow", step_fingerprint(slow)) >= 0.2
+
+    # the history shows slow is the longest path
+    started.clear()
+    assert pipe.step_ranks(store)["slow"] > pipe.step_ranks(store)["a_1"]
+    pipe.local_run(max_workers=2, runtimes=store)
+    assert "slow" in started[:2]
+    assert len(store.durations("slow", step_fingerprint(slow))) == 2
+
+
+def test_upward_ranks_follow_the_longest_path():
+    @step
+    def load() -> int:
+        return 1
+
+    @step
+    def fast(value: int) -> int:
+        return value
+
+    @step
+    def slow(value: int) -> int:
+        return value
+
+    @step
+    def combine(*values) -> int:
+        return sum(values)
+
+    data = load()
+    pipe = Pipeline("paths", steps=[combine(fast(data), slow(data))])
+    ranks = upward_ranks(pipe.graph, {"load": 1.0, "fast": 1.0, "slow": 5.0})
+    assert ranks == {
+        "combine": 7 / 3,
+        "slow": 5 + 7 / 3,
+        "fast": 1 + 7 / 3,
+        "load": 1 + 5 + 7 / 3,
+    }
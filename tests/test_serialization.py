@@ -0,0 +1,38 @@
+from step_in_line.serialization import Serializer, ENCODED_KEY, decode_value
+import json
+import pytest
+
+
+def test_json_is_passed_as_is_unless_compressed():
+    value = {"files": ["a", "b"]}
+    assert Serializer().encode(value) == value
+    # below the threshold, compressed JSON is passed as is too
+    assert Serializer(compression="gzip", threshold=1000).encode(value) == value
+    encoded = Serializer(compression="gzip").encode(value)
+    assert encoded[ENCODED_KEY]["compression"] == "gzip"
+    assert decode_value(json.loads(json.dumps(encoded))) == value
+
+
+def test_msgpack_round_trips_with_zstd():
+    pytest.importorskip("msgpack")
+    pytest.importorskip("zstandard")
+    value = {"scores": [0.5] * 1000, "name": "x"}
+    serializer = Serializer("msgpack", compression="zstd")
+    encoded = serializer.encode(value)
+    assert len(json.dumps(encoded)) < len(json.dumps(value))
+    assert serializer.decode(encoded) == value
+
+
+def test_arrow_round_trips_tables():
+    pa = pytest.importorskip("pyarrow")
+    table = pa.table({"id": [1, 2], "key": ["a", "b"]})
+    encoded = Serializer("arrow").encode(table)
+    assert encoded[ENCODED_KEY]["compression"] is None
+    assert decode_value(encoded).equals(table)
+
+
+def test_serializer_checks_options():
+    with pytest.raises(ValueError):
+        Serializer("yaml")
+    with pytest.raises(ValueError):
+        Serializer(compression="lz4")
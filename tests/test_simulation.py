@@ -0,0 +1,76 @@
+from step_in_line.step import step
+from step_in_line.pipeline import Pipeline
+from step_in_line.profiling import Profiler
+from tests.helpers import make_step
+import pytest
+
+np = pytest.importorskip("numpy")
+from step_in_line.simulation import simulate, samples_from_profilers
+
+
+def test_barriers_delay_independent_branches():
+    # a slow chain next to a fast chain: with barriers, each layer waits
+    # for the slowest step of both chains
+    slow = make_step("slow_2", duration=1.0)(make_step("slow_1", duration=10.0)())
+    fast = make_step("fast_2", duration=10.0)(make_step("fast_1", duration=1.0)())
+    pipe = Pipeline("barriers", steps=[slow, fast])
+    samples = {"slow_1": [10.0], "slow_2": [1.0], "fast_1": [1.0], "fast_2": [10.0]}
+
+    report = simulate(pipe, samples, executions=1000, seed=0)
+    assert report.makespan("layers") == {"mean": 20.0, "p50": 20.0, "p95": 20.0}
+    assert report.makespan("dag")["p95"] == 11.0
+    assert report.barrier_overhead() == 9.0
+    assert list(report.layer_idle) == [9.0, 9.0]
+    assert report.cost()["gb_seconds"] == 22.0 * 512 / 1024
+    assert report.invocations == 4
+    assert "barrier overhead: 9.000s" in report.summary()
+    with pytest.raises(ValueError):
+        report.makespan("gantt")
+
+
+def test_sampled_durations_and_cold_starts():
+    @step(duration=1.0)
+    def first(arg1: str) -> str:
+        return arg1
+
+    @step
+    def second(arg1: str) -> str:
+        return arg1
+
+    @step(duration=2.0)
+    def third(arg1: str) -> str:
+        return arg1
+
+    pipe = Pipeline("sampled", steps=[third(second(first("a")))], fuse=True)
+    warm = simulate(pipe, executions=10000, seed=1)
+    # lognormal around the hints, and second has no duration
+    assert warm.missing == ["second"]
+    assert warm.invocations == 1
+    assert 2.9 < warm.makespan()["p50"] < 3.1
+    assert warm.makespan()["p95"] > warm.makespan()["p50"]
+    assert np.allclose(warm.layer_makespan, warm.dag_makespan)
+
+    cold = simulate(
+        pipe,
+        executions=10000,
+        cold_start_probability=1.0,
+        cold_start_seconds=0.5,
+        seed=1,
+    )
+    assert np.allclose(cold.layer_makespan, warm.layer_makespan + 0.5)
+    chunked = simulate(pipe, executions=20000, seed=1, chunk_size=3000)
+    assert chunked.samples == 20000
+    assert abs(chunked.makespan()["p50"] - warm.makespan()["p50"]) < 0.1
+
+    profilers = []
+    for _ in range(3):
+        profiler = Profiler(memory=False)
+        Pipeline("profiled", steps=[third(second(first("a")))]).local_run(
+            profiler=profiler
+        )
+        profilers.append(profiler)
+    samples = samples_from_profilers(profilers)
+    assert len(samples["second"]) == 3
+    report = simulate(pipe, samples, executions=100)
+    assert report.missing == []
+    assert report.makespan()["p95"] < 1.0
@@ -1,4 +1,5 @@
-from step_in_line.template_lambda import combine_payload
+from step_in_line.template_lambda import combine_payload, resolve_args
+from step_in_line.step import step
 
 
 def test_returns_payload_if_empty_dict():
@@ -19,3 +20,18 @@ def test_returns_payload_if_contains_payload_arr():
 def test_returns_payload_if_contains_payload_arr_multiple():
     event = [{"Payload": {"hi": 4}}, {"Payload": {"bye": 4}}]
     assert combine_payload(event) == {"hi": 4, "bye": 4}
+
+
+def test_returns_payload_if_contains_nested_payload_arr():
+    event = [[{"Payload": {"hi": 4}}, {"Payload": {"map": [1, 2]}}], {"Payload": {}}]
+    assert combine_payload(event) == {"hi": 4, "map": [1, 2]}
+
+
+def test_resolves_selected_fields_of_previous_outputs():
+    @step
+    def listing() -> dict:
+        return {}
+
+    payload = {"listing": {"files": ["a", "b"], "count": 2}}
+    args = [listing()["files"][1].to_arg(), "listing", "static"]
+    assert resolve_args(args, payload) == ["b", payload["listing"], "static"]
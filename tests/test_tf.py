@@ -1,4 +1,23 @@
-from step_in_line.tf import remove_decorators
+from step_in_line.tf import (
+    remove_decorators,
+    group_steps_for_dispatcher,
+    package_dispatcher_lambda,
+    package_lambda,
+    StepInLine,
+    generate_lambda_function,
+    generate_step_function,
+)
+from step_in_line.step import step, FusedStep, PackedStep
+from step_in_line.pipeline import Pipeline
+from step_in_line.serialization import Serializer, ENCODED_KEY, decode_value
+from step_in_line.memoization import SQLiteStore
+import cdktf
+from importlib import resources as impresources
+import importlib.util
+import zipfile
+import json
+import subprocess
+import sys
 
 
 def test_remove_decorators_with_decorator():
@@ -17,3 +36,403 @@ def test_remove_decorators_without_decorator():
     code = 'def preprocess(arg1: str) -> str:\n    return "hello"'
     expected = 'def preprocess(arg1: str) -> str:\n    return "hello"'
     assert remove_decorators(code) == expected
+
+
+def test_group_steps_for_dispatcher():
+    @step
+    def preprocess(arg1: str) -> str:
+        return "hello"
+
+    @step(memory_size=1024)
+    def train(arg1: str) -> str:
+        return "goodbye"
+
+    @step
+    def evaluate(arg1: str) -> str:
+        return "done"
+
+    preprocess_result = preprocess("hi")
+    groups = group_steps_for_dispatcher(
+        [preprocess_result, train(preprocess_result), evaluate(preprocess_result)]
+    )
+    assert [[s.name for s in group] for group in groups] == [
+        ["preprocess", "evaluate"],
+        ["train"],
+    ]
+
+
+def test_package_dispatcher_lambda_routes_to_steps(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    @step
+    def preprocess(arg1: str) -> str:
+        return arg1 + "_preprocessed"
+
+    @step
+    def train(arg1: str) -> str:
+        return arg1 + "_trained"
+
+    preprocess_result = preprocess("hi")
+    train_result = train(preprocess_result)
+    zip_name, _ = package_dispatcher_lambda(
+        impresources.files("step_in_line") / "template_lambda.py",
+        impresources.files("step_in_line") / "template_dispatcher.py",
+        [preprocess_result, train_result],
+        "index",
+        "dispatcher.zip",
+    )
+    with zipfile.ZipFile(zip_name) as zf:
+        zf.extractall(tmp_path / "dispatcher")
+    spec = importlib.util.spec_from_file_location(
+        "dispatcher_index", tmp_path / "dispatcher" / "index.py"
+    )
+    dispatcher = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(dispatcher)
+
+    output = dispatcher.lambda_handler({"StepName": "preprocess", "Input": {}}, None)
+    assert output == {"preprocess": "hi_preprocessed"}
+    output = dispatcher.lambda_handler(
+        {"StepName": "train", "Input": {"Payload": output}}, None
+    )
+    assert output == {
+        "train": "hi_preprocessed_trained",
+        "preprocess": "hi_preprocessed",
+    }
+
+
+def test_stack_in_dispatcher_mode_shares_lambda(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    @step
+    def preprocess(arg1: str) -> str:
+        return "hello"
+
+    @step
+    def train(arg1: str) -> str:
+        return "goodbye"
+
+    pipe = Pipeline("mytest", steps=[train(preprocess("hi"))], dispatcher=True)
+    stack = StepInLine(cdktf.Testing.app(), "dispatcher_stack", pipe, "us-east-1")
+    synthesized = json.loads(cdktf.Testing.synth(stack))
+    assert list(synthesized["resource"]["aws_lambda_function"].keys()) == [
+        "dispatcher_0"
+    ]
+    definition = json.loads(
+        synthesized["resource"]["aws_sfn_state_machine"]["mytest"]["definition"]
+    )
+    assert (
+        definition["States"]["preprocess"]["Parameters"]["FunctionName"]
+        == definition["States"]["train"]["Parameters"]["FunctionName"]
+    )
+
+
+def test_generate_functions_take_a_cdktf_scope(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    @step
+    def preprocess(arg1: str) -> str:
+        return "hello"
+
+    stack = cdktf.TerraformStack(cdktf.Testing.app(), "scoped")
+    step_lambda = generate_lambda_function(
+        stack,
+        "mytest",
+        preprocess("hi"),
+        impresources.files("step_in_line") / "template_lambda.py",
+    )
+    pipe = Pipeline("mytest", steps=[preprocess("hi")])
+    pipe.set_generate_step_name(lambda s: step_lambda.arn)
+    generate_step_function(stack, pipe, "us-east-1", [step_lambda.arn])
+    synthesized = json.loads(cdktf.Testing.synth(stack))
+    assert list(synthesized["resource"]["aws_lambda_function"]) == ["preprocess"]
+    assert list(synthesized["resource"]["aws_sfn_state_machine"]) == ["mytest"]
+
+
+def test_package_dispatcher_lambda_runs_fused_steps_in_sequence(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    @step
+    def preprocess(arg1: str) -> str:
+        return arg1 + "_preprocessed"
+
+    @step
+    def train(arg1: str) -> str:
+        return arg1 + "_trained"
+
+    preprocess_result = preprocess("hi")
+    fused = FusedStep([preprocess_result, train(preprocess_result)])
+    zip_name, _ = package_dispatcher_lambda(
+        impresources.files("step_in_line") / "template_lambda.py",
+        impresources.files("step_in_line") / "template_dispatcher.py",
+        [fused],
+        "index",
+        "fused.zip",
+    )
+    with zipfile.ZipFile(zip_name) as zf:
+        zf.extractall(tmp_path / "fused")
+    spec = importlib.util.spec_from_file_location(
+        "fused_index", tmp_path / "fused" / "index.py"
+    )
+    dispatcher = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(dispatcher)
+
+    output = dispatcher.lambda_handler(
+        {"StepName": "preprocess_to_train", "Input": {}}, None
+    )
+    assert output == {
+        "train": "hi_preprocessed_trained",
+        "preprocess": "hi_preprocessed",
+    }
+
+
+def test_package_dispatcher_lambda_runs_packed_steps(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    @step
+    def preprocess(arg1: str) -> str:
+        return arg1 + "_preprocessed"
+
+    @step
+    def preprocess_2(arg1: str) -> str:
+        return arg1 + "_preprocessed_2"
+
+    packed = PackedStep([preprocess("hi"), preprocess_2("hi")])
+    zip_name, _ = package_dispatcher_lambda(
+        impresources.files("step_in_line") / "template_lambda.py",
+        impresources.files("step_in_line") / "template_dispatcher.py",
+        [packed],
+        "index",
+        "packed.zip",
+    )
+    with zipfile.ZipFile(zip_name) as zf:
+        zf.extractall(tmp_path / "packed")
+    spec = importlib.util.spec_from_file_location(
+        "packed_index", tmp_path / "packed" / "index.py"
+    )
+    dispatcher = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(dispatcher)
+
+    output = dispatcher.lambda_handler(
+        {"StepName": "packed_preprocess", "Input": {"Payload": {"previous": 1}}},
+        None,
+    )
+    assert output == {
+        "previous": 1,
+        "preprocess": "hi_preprocessed",
+        "preprocess_2": "hi_preprocessed_2",
+    }
+
+
+def test_stack_dedupes_iam_roles_and_policies(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    policy = json.dumps(
+        {
+            "Version": "2012-10-17",
+            "Statement": [
+                {"Effect": "Allow", "Action": ["s3:GetObject"], "Resource": ["*"]}
+            ],
+        }
+    )
+
+    @step(policies=[policy])
+    def preprocess(arg1: str) -> str:
+        return "hello"
+
+    @step(policies=[policy])
+    def preprocess_2(arg1: str) -> str:
+        return "hello"
+
+    @step
+    def train(arg1: str, arg2: str) -> str:
+        return "goodbye"
+
+    pipe = Pipeline(
+        "mytest", steps=[train(preprocess("hi"), preprocess_2("hi"))], schedule=None
+    )
+    stack = StepInLine(
+        cdktf.Testing.app(), "dedupe_stack", pipe, "us-east-1", dedupe_iam=True
+    )
+    assert stack.resource_counts == {
+        "aws_lambda_function": 3,
+        "aws_iam_role": 2,
+        "aws_iam_policy": 2,
+        "aws_iam_role_policy_attachment": 3,
+    }
+    synthesized = json.loads(cdktf.Testing.synth(stack))
+    lambdas = synthesized["resource"]["aws_lambda_function"]
+    assert (
+        lambdas["preprocess"]["environment"]["variables"]["VAULT_AUTH_ROLE"]
+        == lambdas["preprocess_2"]["environment"]["variables"]["VAULT_AUTH_ROLE"]
+    )
+    assert (
+        lambdas["preprocess"]["environment"]["variables"]["VAULT_AUTH_ROLE"]
+        != lambdas["train"]["environment"]["variables"]["VAULT_AUTH_ROLE"]
+    )
+
+
+def test_package_lambda_runs_map_batches(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    @step(map_over="partition", batch_size=2)
+    def process(prefix: str, partition: str) -> str:
+        return prefix + partition
+
+    @step
+    def prefix(arg1: str) -> str:
+        return arg1
+
+    zip_name, _ = package_lambda(
+        impresources.files("step_in_line") / "template_lambda.py",
+        process(prefix("hi"), ["a", "b", "c"]),
+        "index",
+    )
+    with zipfile.ZipFile(zip_name) as zf:
+        zf.extractall(tmp_path / "process")
+    spec = importlib.util.spec_from_file_location(
+        "process_index", tmp_path / "process" / "index.py"
+    )
+    handler = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(handler)
+
+    event = {"MapItems": ["a", "b"], "Payload": {"prefix": "hi_"}}
+    assert handler.lambda_handler(event, None) == ["hi_a", "hi_b"]
+    # batched by the ItemBatcher of a distributed Map
+    event = {"Items": [{"MapItem": "c", "Payload": {"prefix": "hi_"}}]}
+    assert handler.lambda_handler(event, None) == ["hi_c"]
+
+
+def test_package_lambda_encodes_outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    @step(serializer=Serializer(compression="gzip"))
+    def listing(arg1: str) -> list:
+        return [arg1] * 100
+
+    zip_name, _ = package_lambda(
+        impresources.files("step_in_line") / "template_lambda.py",
+        listing("hi"),
+        "index",
+    )
+    with zipfile.ZipFile(zip_name) as zf:
+        assert "step_in_line/serialization.py" in zf.namelist()
+        zf.extractall(tmp_path / "listing")
+    spec = importlib.util.spec_from_file_location(
+        "listing_index", tmp_path / "listing" / "index.py"
+    )
+    handler = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(handler)
+
+    output = handler.lambda_handler({"Payload": {}}, None)
+    assert output["listing"][ENCODED_KEY]["compression"] == "gzip"
+    assert decode_value(output["listing"]) == ["hi"] * 100
+
+
+def test_package_lambda_reports_cache_hits(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    @step(cache=SQLiteStore(str(tmp_path / "cache.db")))
+    def query(arg1: str) -> int:
+        return 42
+
+    zip_name, _ = package_lambda(
+        impresources.files("step_in_line") / "template_lambda.py",
+        query("select 42"),
+        "index",
+    )
+    with zipfile.ZipFile(zip_name) as zf:
+        zf.extractall(tmp_path / "query")
+    spec = importlib.util.spec_from_file_location(
+        "query_index", tmp_path / "query" / "index.py"
+    )
+    handler = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(handler)
+
+    stats_key = "__step_in_line_cache__query"
+    output = handler.lambda_handler({"Payload": {}}, None)
+    assert output == {"query": 42, stats_key: {"hits": 0, "misses": 1}}
+    output = handler.lambda_handler({"Payload": {}}, None)
+    assert output[stats_key] == {"hits": 1, "misses": 0}
+
+
+def test_packaged_lambda_runs_with_its_runtime_modules(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    @step
+    def connect(arg1: str) -> int:
+        from step_in_line.warm_cache import object_cache
+
+        return object_cache.get_or_create("connection", lambda: arg1)
+
+    zip_name, _ = package_lambda(
+        impresources.files("step_in_line") / "template_lambda.py",
+        connect("hi"),
+        "index",
+    )
+    with zipfile.ZipFile(zip_name) as zf:
+        zf.extractall(tmp_path / "connect")
+    # only the Lambda directory, as in the Lambda runtime
+    code = (
+        "import sys; sys.path.insert(0, sys.argv[1]); import index, json; "
+        "print(json.dumps(index.lambda_handler({}, None))); "
+        "import step_in_line.warm_cache as w; print(w.__file__)"
+    )
+    output = subprocess.run(
+        [sys.executable, "-I", "-c", code, str(tmp_path / "connect")],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.splitlines()
+    assert json.loads(output[0]) == {"connect": "hi"}
+    assert output[1].startswith(str(tmp_path / "connect"))
+
+
+def test_packaged_lambda_emits_metrics_and_profiles(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    @step
+    def transform(arg1: str) -> str:
+        return arg1.upper()
+
+    zip_name, _ = package_lambda(
+        impresources.files("step_in_line") / "template_lambda.py",
+        transform("hi"),
+        "index",
+    )
+    with zipfile.ZipFile(zip_name) as zf:
+        zf.extractall(tmp_path / "transform")
+    code = (
+        "import sys; sys.path.insert(0, sys.argv[1]); import index; "
+        "index.lambda_handler({'Payload': {'previous': 1}}, None); "
+        "index.lambda_handler({'Payload': {'previous': 1}}, None)"
+    )
+    stdout = subprocess.run(
+        [sys.executable, "-c", code, str(tmp_path / "transform")],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={"STEP_IN_LINE_METRICS": "1", "STEP_IN_LINE_PROFILE_MS": "0"},
+    ).stdout
+    metrics = [
+        json.loads(line) for line in stdout.splitlines() if line.startswith('{"_aws"')
+    ]
+    assert [m["ColdStart"] for m in metrics] == [1, 0]
+    assert metrics[0]["Step"] == "transform"
+    assert metrics[0]["InputBytes"] == len(json.dumps({"Payload": {"previous": 1}}))
+    assert metrics[0]["OutputBytes"] == len(
+        json.dumps({"transform": "HI", "previous": 1})
+    )
+    names = {
+        metric["Name"]
+        for metric in metrics[0]["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+    }
+    assert {
+        "Duration",
+        "LoadTime",
+        "CombinePayloadTime",
+        "ResolveArgsTime",
+        "FunctionTime",
+        "SerializeTime",
+    } <= names
+    assert all(name in metrics[0] for name in names)
+    assert stdout.count("Profile of step transform") == 2
+    assert "cumulative" in stdout
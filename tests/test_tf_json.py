@@ -0,0 +1,163 @@
+from step_in_line.step import step
+from step_in_line.pipeline import Pipeline
+from step_in_line.tf_json import StepInLineJson, TerraformJson
+from step_in_line.tf_resources import ResourceFactory
+from pathlib import Path
+import json
+import pytest
+
+GOLDEN_FILE = Path(__file__).parent / "golden" / "step_in_line.tf.json"
+
+S3_POLICY = json.dumps(
+    {
+        "Version": "2012-10-17",
+        "Statement": [
+            {"Effect": "Allow", "Action": ["s3:GetObject"], "Resource": ["*"]}
+        ],
+    }
+)
+
+
+def golden_pipeline() -> Pipeline:
+    @step(
+        policies=[S3_POLICY],
+        layers=["arn:aws:lambda:us-east-1:123456789012:layer:example-layer"],
+    )
+    def preprocess(arg1: str) -> str:
+        return "hello"
+
+    @step(policies=[S3_POLICY], env_variables={"hello": "world"})
+    def preprocess_2(arg1: str) -> str:
+        return "hello"
+
+    @step(memory_size=1024)
+    def preprocess_3(arg1: str) -> str:
+        return "hello"
+
+    @step(retry_count=2)
+    def train(arg1: str, arg2: str, arg3: str):
+        return "goodbye"
+
+    step_process_result = preprocess("hi")
+    step_train_result = train(
+        step_process_result,
+        preprocess_2(step_process_result),
+        preprocess_3(step_process_result),
+    )
+    return Pipeline("mytest", steps=[step_train_result], schedule="rate(2 minutes)")
+
+
+def normalize(config: dict) -> dict:
+    """Removes parts of the configuration which depend on the environment:
+    the zip hashes (which change with the python version used to extract
+    the step source) and the provider versions."""
+    config = {k: v for k, v in config.items() if k != "terraform"}
+    for lambda_f in config["resource"]["aws_lambda_function"].values():
+        lambda_f["source_code_hash"] = "<hash>"
+    return config
+
+
+def test_terraform_json_references():
+    config = TerraformJson()
+    role = config.resource("aws_iam_role", "myrole", name_prefix="hello", tags=None)
+    config.output("role_arn", role.arn)
+    assert role.arn == "${aws_iam_role.myrole.arn}"
+    assert config.to_dict() == {
+        "resource": {"aws_iam_role": {"myrole": {"name_prefix": "hello"}}},
+        "output": {"role_arn": {"value": "${aws_iam_role.myrole.arn}"}},
+    }
+    with pytest.raises(ValueError):
+        config.resource("aws_iam_role", "myrole")
+
+    class Incomplete(ResourceFactory):
+        def resource(self, resource_type, resource_name, /, **attributes):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_matches_golden_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = StepInLineJson(
+        golden_pipeline(),
+        "us-east-1",
+        vpc_id="vpc-123",
+        subnet_filter=[{"name": "tag:Name", "values": ["private*"]}],
+        dedupe_iam=True,
+    )
+    config.write(tmp_path / "main.tf.json")
+    with open(tmp_path / "main.tf.json") as f:
+        generated = json.load(f)
+    with open(GOLDEN_FILE) as f:
+        golden = json.load(f)
+    assert normalize(generated) == golden
+    assert generated["terraform"]["required_providers"]["aws"] == {
+        "source": "hashicorp/aws"
+    }
+
+
+def test_matches_cdktf_stack(tmp_path, monkeypatch):
+    cdktf = pytest.importorskip("cdktf")
+    from step_in_line.tf import StepInLine
+
+    monkeypatch.chdir(tmp_path)
+
+    def pipeline() -> Pipeline:
+        pipe = golden_pipeline()
+        pipe.dispatcher = True
+        pipe.fuse = True
+        return pipe
+
+    stack = StepInLine(cdktf.Testing.app(), "parity", pipeline(), "us-east-1")
+    expected = normalize(json.loads(cdktf.Testing.synth(stack)))
+    generated = normalize(StepInLineJson(pipeline(), "us-east-1").to_dict())
+    assert generated == expected
+
+
+def test_partitioned_pipeline_creates_child_state_machines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pipe = golden_pipeline()
+    pipe.partition = True
+    pipe.max_partition_states = 4
+
+    config = StepInLineJson(pipe, "us-east-1")
+    state_machines = config.to_dict()["resource"]["aws_sfn_state_machine"]
+    assert sorted(state_machines) == ["mytest", "mytest_part_0", "mytest_part_1"]
+    definition = json.loads(state_machines["mytest"]["definition"])
+    assert (
+        definition["States"]["mytest_part_1"]["Parameters"]["StateMachineArn"]
+        == "${aws_sfn_state_machine.mytest_part_1.arn}"
+    )
+    policy = json.loads(
+        config.to_dict()["resource"]["aws_iam_policy"]["mytestpolicy"]["policy"]
+    )
+    start_execution = [
+        statement
+        for statement in policy["Statement"]
+        if statement["Action"] == ["states:StartExecution"]
+    ]
+    assert sorted(start_execution[0]["Resource"]) == [
+        "${aws_sfn_state_machine.mytest_part_0.arn}",
+        "${aws_sfn_state_machine.mytest_part_1.arn}",
+    ]
+    assert [p["name"] for p in config.partition_report] == [
+        "mytest",
+        "mytest_part_0",
+        "mytest_part_1",
+    ]
+
+
+def test_nested_express_state_machine(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pipe = golden_pipeline()
+    pipe.nest_express = True
+    pipe.durations = {"preprocess": 1, "preprocess_2": 1, "preprocess_3": 1}
+
+    state_machines = StepInLineJson(pipe, "us-east-1").to_dict()["resource"][
+        "aws_sfn_state_machine"
+    ]
+    assert state_machines["mytest"]["type"] == "STANDARD"
+    assert state_machines["mytest_express_0"]["type"] == "EXPRESS"
+    definition = json.loads(state_machines["mytest"]["definition"])
+    assert list(definition["States"]) == ["mytest_express_0", "train"]
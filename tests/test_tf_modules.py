@@ -0,0 +1,74 @@
+from step_in_line.step import step
+from step_in_line.pipeline import Pipeline
+from step_in_line.tf_modules import write_modules
+from pathlib import Path
+import json
+
+
+def make_pipeline(train_output: str) -> Pipeline:
+    @step
+    def preprocess(arg1: str) -> str:
+        return "hello"
+
+    @step
+    def preprocess_2(arg1: str) -> str:
+        return "hello"
+
+    if train_output == "goodbye":
+
+        @step
+        def train(arg1: str, arg2: str):
+            return "goodbye"
+
+    else:
+
+        @step
+        def train(arg1: str, arg2: str):
+            return "see you later"
+
+    step_process_result = preprocess("hi")
+    step_train_result = train(step_process_result, preprocess_2(step_process_result))
+    return Pipeline("mytest", steps=[step_train_result])
+
+
+def test_write_modules(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    report = write_modules(make_pipeline("goodbye"), "us-east-1", Path("out"))
+    assert sorted(report["changed"]) == ["preprocess", "preprocess_2", "train"]
+    assert Path("out", "modules", "train", "train.zip").exists()
+    with open(Path("out", "modules", "train", "main.tf.json")) as f:
+        module = json.load(f)
+    assert (
+        module["resource"]["aws_lambda_function"]["train"]["filename"]
+        == "${path.module}/train.zip"
+    )
+    with open(Path("out", "main.tf.json")) as f:
+        root = json.load(f)
+    assert root["module"]["train"] == {"source": "./modules/train"}
+    definition = root["resource"]["aws_sfn_state_machine"]["mytest"]["definition"]
+    assert "${module.train.train_lambda_arn}" in definition
+
+
+def test_write_modules_only_rewrites_changed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_modules(make_pipeline("goodbye"), "us-east-1", Path("out"))
+    report = write_modules(make_pipeline("goodbye"), "us-east-1", Path("out"))
+    assert report["changed"] == []
+    assert sorted(report["unchanged"]) == ["preprocess", "preprocess_2", "train"]
+
+    report = write_modules(make_pipeline("see you later"), "us-east-1", Path("out"))
+    assert report["changed"] == ["train"]
+
+
+def test_write_modules_removes_stale(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_modules(make_pipeline("goodbye"), "us-east-1", Path("out"))
+    report = write_modules(
+        Pipeline("mytest", steps=[make_pipeline("goodbye").steps[0]], dispatcher=True),
+        "us-east-1",
+        Path("out"),
+    )
+    assert report["changed"] == ["dispatcher_0"]
+    assert sorted(report["removed"]) == ["preprocess", "preprocess_2", "train"]
+    for module_name in report["removed"]:
+        assert not Path("out", "modules", module_name).exists()
@@ -0,0 +1,125 @@
+from step_in_line.step import step
+from step_in_line.pipeline import Pipeline
+from step_in_line.tf_json import StepInLineJson
+from step_in_line.tuning import (
+    StepMeasurement,
+    measure_steps,
+    recommend,
+    lambda_overrides,
+    combine_overrides,
+    recommendation_summary,
+)
+import time
+
+
+def test_measurement_models_cpu_scaling():
+    cpu_bound = StepMeasurement("cpu", wall=1.0, cpu=1.0, peak_memory=0, runs=1)
+    assert cpu_bound.duration(1769) == 1.0
+    assert cpu_bound.duration(1769 // 2) > 1.99
+    assert cpu_bound.duration(10240) == 1.0  # single threaded
+
+    threaded = StepMeasurement("threaded", wall=1.0, cpu=4.0, peak_memory=0, runs=1)
+    assert threaded.parallelism == 4.0
+    assert threaded.duration(4 * 1769) == 1.0
+    assert threaded.duration(1769) == 4.0
+
+    waiting = StepMeasurement("waiting", wall=1.0, cpu=0.0, peak_memory=0, runs=1)
+    assert waiting.duration(128) == waiting.duration(10240) == 1.0
+
+
+def pipeline() -> Pipeline:
+    @step
+    def wait(arg1: str) -> str:
+        time.sleep(0.05)
+        return arg1
+
+    @step(layers=["arn:aws:lambda:us-east-1:123456789012:layer:numpy"])
+    def compute(arg1: str) -> int:
+        total = 0
+        for value in range(300000):
+            total += value
+        return total
+
+    @step
+    def allocate(total: int) -> int:
+        return len(bytearray(100 * 2**20))
+
+    return Pipeline("tuned", steps=[allocate(compute(wait("hi")))])
+
+
+def test_recommends_memory_and_architecture():
+    pipe = pipeline()
+    measurements = measure_steps(pipe, runs=2)
+    assert sorted(measurements) == ["allocate", "compute", "wait"]
+    assert measurements["wait"].wall >= 0.05
+    assert measurements["wait"].cpu < 0.05
+    assert measurements["compute"].cpu > 0
+    assert measurements["allocate"].peak_memory >= 100 * 2**20
+
+    recommendations = recommend(pipe, measurements)
+    # waiting does not get faster with more memory
+    assert recommendations["wait"].memory_size == 128
+    assert recommendations["wait"].architecture == "arm64"
+    assert recommendations["wait"].cost < recommendations["wait"].current_cost
+    assert recommendations["wait"].timeout == 60
+    # layers are built for a single architecture
+    assert recommendations["compute"].architecture == "x86_64"
+    # 64 MB for the runtime, and 1.5 times the peak
+    assert recommendations["allocate"].memory_size >= 64 + 150
+
+    fastest = recommend(pipe, measurements, strategy="speed")
+    assert fastest["compute"].duration <= recommendations["compute"].duration
+    assert "tuned" not in recommendation_summary(recommendations)
+    assert "wait" in recommendation_summary(recommendations)
+
+
+def test_overrides_are_written_when_synthesizing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pipe = pipeline()
+    measurements = {
+        "wait": StepMeasurement("wait", 0.05, 0.0, 0, 1),
+        "compute": StepMeasurement("compute", 2.0, 2.0, 0, 1),
+        "allocate": StepMeasurement("allocate", 0.1, 0.1, 200 * 2**20, 1),
+    }
+    recommendations = recommend(pipe, measurements)
+    overrides = lambda_overrides(pipe, recommendations)
+    lambdas = StepInLineJson(pipe, "us-east-1", lambda_overrides=overrides).to_dict()[
+        "resource"
+    ]["aws_lambda_function"]
+    assert lambdas["wait"]["memory_size"] == 128
+    assert lambdas["wait"]["architectures"] == ["arm64"]
+    assert lambdas["compute"]["architectures"] == ["x86_64"]
+    assert lambdas["allocate"]["memory_size"] == recommendations["allocate"].memory_size
+    assert lambdas["allocate"]["timeout"] == 60
+
+    # fused steps run one after the other in a single Lambda
+    @step
+    def first(arg1: str) -> str:
+        return arg1
+
+    @step
+    def second(arg1: str) -> str:
+        return arg1
+
+    fused_pipe = Pipeline("fused", steps=[second(first("hi"))], fuse=True)
+    measurements = {
+        "first": StepMeasurement("first", 30.0, 0.0, 0, 1),
+        "second": StepMeasurement("second", 0.1, 0.1, 200 * 2**20, 1),
+    }
+    recommendations = recommend(fused_pipe, measurements)
+    (fused,) = lambda_overrides(fused_pipe, recommendations).values()
+    assert fused == {
+        "memory_size": recommendations["second"].memory_size,
+        "timeout": 90 + 60,
+        "architectures": ["arm64"],
+    }
+    assert combine_overrides([fused, None]) is None
+    assert "architectures" not in combine_overrides(
+        [{"architectures": ["arm64"]}, {"architectures": ["x86_64"]}]
+    )
+
+    lambdas = StepInLineJson(pipeline(), "us-east-1").to_dict()["resource"][
+        "aws_lambda_function"
+    ]
+    assert lambdas["wait"]["timeout"] == 900
+    assert "architectures" not in lambdas["wait"]
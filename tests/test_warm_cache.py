@@ -0,0 +1,35 @@
+from step_in_line.warm_cache import LRUCache, FileCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get_or_create("c", lambda: 4) == 3
+    assert cache.get_or_create("d", lambda: 4) == 4
+    assert len(cache) == 2
+    assert cache.stats() == {"hits": 2, "misses": 2, "evictions": 2}
+
+
+def test_file_cache_evicts_above_capacity(tmp_path):
+    cache = FileCache(str(tmp_path / "files"), max_bytes=10)
+    downloads = []
+
+    def download(path):
+        downloads.append(path)
+        with open(path, "wb") as f:
+            f.write(b"12345")
+
+    path = cache.get_or_download("s3://bucket/a", download)
+    assert cache.get_or_download("s3://bucket/a", download) == path
+    cache.put("s3://bucket/b", b"12345")
+    cache.put("s3://bucket/c", b"12345")
+    assert len(downloads) == 1
+    assert cache.get("s3://bucket/a") is None
+    assert cache.size() == 10
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 1}
+    # caches created later (eg, by another process) find the cached files
+    assert FileCache(str(tmp_path / "files")).size() == 10